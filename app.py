@@ -65,62 +65,160 @@ div[data-testid="stHorizontalBlock"] button[data-baseweb="tab"] {
 
 import pandas as pd
 import numpy as np
-import joblib
 import base64
 import sys
 from sklearn.preprocessing import QuantileTransformer
-from datetime import datetime
+from datetime import datetime, timedelta
 import plotly.express as px
 import plotly.graph_objects as go
-from io import StringIO
 import yaml
 from yaml.loader import SafeLoader
-import streamlit_authenticator as stauth
+import extra_streamlit_components as stx
 import re
 from streamlit_option_menu import option_menu
 import io
-import requests
-import gdown
-
-# Função para baixar arquivos do GitHub
-def download_file_from_github(url):
-    response = requests.get(url)
-    if response.status_code == 200:
-        return response.content
-    else:
-        raise Exception(f"Erro ao baixar arquivo: {response.status_code}")
-
-# URLs dos arquivos no GitHub
-MODEL_URL = "https://github.com/sidnei-almeida/air_quality_indicator/raw/refs/heads/main/rf_model.joblib"
-DATA_URL = "https://raw.githubusercontent.com/sidnei-almeida/air_quality_indicator/refs/heads/main/airquality.csv"
-CONFIG_URL = "https://raw.githubusercontent.com/sidnei-almeida/air_quality_indicator/refs/heads/main/config.yaml"
+import time
+import hashlib
+from streamlit.runtime import get_instance as get_runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from artifacts import ArtifactStore, ArtifactMissing
+import warmup
+from user_store import UserStore, hash_password_async
+from auth import Authenticator, AuthBusy
+from model_registry import DEFAULT_KEY, city_key
+from result_store import ResultStore, job_id
+from jobs import JobQueue
+from exports import EXPORT_FORMATS, frame_hash, get_export
+from batch_io import UPLOAD_EXTENSIONS
+from history_store import HistoryStore
+from history_views import HistoryViews
+from memory_budget import SessionMemory, cache_usage, process_rss_bytes
+from rollups import GRAIN_LABELS
+from sensitivity import sensitivity_ranking
+from summaries import ols_from_sums, SCATTER_POINT_LIMIT
+from profiling import profile_readings
+from imputation import impute_batch, IMPUTATION_METHODS, IMPUTATION_LIMIT
+from pipeline import (interval_columns, score_chunk, finalize_batch, REQUIRED_COLUMNS, PREDICTION_QUANTILES,
+                      POLLUTANT_LIMITS, HISTORY_VALUE_COLUMNS)
+import page_steps
+
+# Artefatos resolvidos localmente pelo manifesto (artifacts.json), sem rede no caminho da requisição
+@st.cache_resource
+def load_artifact_store():
+    return ArtifactStore()
+
+artifact_store = load_artifact_store()
+# Modelos carregados e aquecidos em segundo plano enquanto o usuário faz login
+# (com serve.py, desde o início do servidor)
+warmup.start(artifact_store)
+
+def artifact_path(name):
+    """Caminho local do artefato; sem ele o app mostra como obtê-lo e para."""
+    try:
+        return artifact_store.path(name)
+    except ArtifactMissing as e:
+        st.error(str(e))
+        st.stop()
 
 # Carrega as configurações de autenticação
 @st.cache_data
 def load_config():
-    try:
-        # Primeiro tenta ler localmente
-        with open('config.yaml') as file:
-            return yaml.load(file, Loader=SafeLoader)
-    except FileNotFoundError:
-        # Se não encontrar localmente, baixa do GitHub
-        content = download_file_from_github(CONFIG_URL)
-        return yaml.load(content, Loader=SafeLoader)
+    with open(artifact_path('config.yaml')) as file:
+        return yaml.load(file, Loader=SafeLoader)
 
 config = load_config()
 
-# Cria o objeto autenticador
-authenticator = stauth.Authenticate(
-    credentials=config['credentials'],
-    cookie_name=config['cookie']['name'],
-    key=config['cookie']['key'],
-    cookie_expiry_days=config['cookie']['expiry_days']
-)
+# Usuários ficam em SQLite; o config.yaml só fornece os usuários iniciais
+@st.cache_resource
+def load_user_store():
+    store = UserStore()
+    store.import_credentials(config.get('credentials'))
+    return store
+
+user_store = load_user_store()
+
+# Cria o autenticador (bcrypt em pool limitado de threads e tokens de sessão gravados no banco de usuários)
+@st.cache_resource
+def load_authenticator():
+    auth_config = config.get('auth') or {}
+    return Authenticator(
+        user_store,
+        rounds=auth_config.get('bcrypt_rounds', 12),
+        token_ttl_seconds=config['cookie']['expiry_days'] * 86400,
+        workers=auth_config.get('workers', 2),
+        max_pending=auth_config.get('max_pending_logins', 32)
+    )
+
+authenticator = load_authenticator()
+
+# Memória por sessão: limite, tempo de ociosidade e tamanho a partir do qual um objeto é despejável
+@st.cache_resource
+def load_session_memory():
+    memory_config = config.get('memory') or {}
+    return SessionMemory(
+        cap_bytes=memory_config.get('session_cap_mb', 64) * 1024 ** 2,
+        idle_seconds=memory_config.get('idle_minutes', 15) * 60,
+        large_object_bytes=memory_config.get('large_object_mb', 1) * 1024 ** 2,
+        history_limit=memory_config.get('prediction_history_limit', 200)
+    )
+
+session_memory = load_session_memory()
+cookie_manager = stx.CookieManager(key="auth_cookies")
+
+# Inicializa o estado de autenticação se não existir
+for state_key in ('authentication_status', 'name', 'username', 'auth_token'):
+    if state_key not in st.session_state:
+        st.session_state[state_key] = None
+
+# Restaura a sessão pelo token guardado no cookie (sem verificar a senha de novo)
+if not st.session_state['authentication_status']:
+    saved_token = cookie_manager.get(config['cookie']['name'])
+    if saved_token:
+        token_username, token_user = authenticator.resume(saved_token)
+        if token_user is not None:
+            st.session_state['authentication_status'] = True
+            st.session_state['name'] = token_user['name']
+            st.session_state['username'] = token_username
+            st.session_state['auth_token'] = saved_token
 
 # Inicializa o estado da página de registro se não existir
 if 'show_register' not in st.session_state:
     st.session_state.show_register = False
 
+# Função para mostrar o formulário de login
+def show_login_form():
+    with st.form("login"):
+        st.subheader("Login")
+        username = st.text_input("Nome de usuário")
+        password = st.text_input("Senha", type="password")
+        if not st.form_submit_button("Entrar"):
+            return
+    try:
+        with st.spinner('Verificando credenciais...'):
+            user, token = authenticator.login(username, password)
+    except AuthBusy:
+        st.warning('Muitos logins em andamento. Tente novamente em alguns segundos.')
+        return
+    if user is None:
+        st.session_state['authentication_status'] = False
+        return
+    st.session_state['authentication_status'] = True
+    st.session_state['name'] = user['name']
+    st.session_state['username'] = username.lower()
+    st.session_state['auth_token'] = token
+    cookie_manager.set(
+        config['cookie']['name'],
+        token,
+        expires_at=datetime.now() + timedelta(days=config['cookie']['expiry_days'])
+    )
+
+# Função para encerrar a sessão
+def logout():
+    authenticator.logout(st.session_state['auth_token'])
+    cookie_manager.delete(config['cookie']['name'])
+    for state_key in ('authentication_status', 'name', 'username', 'auth_token'):
+        st.session_state[state_key] = None
+
 # Função para alternar entre login e registro
 def toggle_register():
     st.session_state.show_register = not st.session_state.show_register
@@ -148,28 +246,19 @@ def register_new_user(username, name, email, password, password_repeat):
         st.error('A senha deve ter pelo menos 6 caracteres')
         return False
     
-    # Verifica se o usuário já existe
-    if 'usernames' in config['credentials']:
-        if username in config['credentials']['usernames']:
-            st.error('Nome de usuário já existe')
-            return False
-    else:
-        config['credentials']['usernames'] = {}
-    
-    # Cria o hash da senha
-    hasher = stauth.Hasher()
-    hashed_password = hasher.hash(password)
+    # Verifica se o usuário já existe (consulta pela chave primária)
+    if user_store.exists(username):
+        st.error('Nome de usuário já existe')
+        return False
     
-    # Adiciona o novo usuário
-    config['credentials']['usernames'][username] = {
-        'email': email,
-        'name': name,
-        'password': hashed_password
-    }
+    # Cria o hash da senha fora da thread da sessão
+    with st.spinner('Criando conta...'):
+        hashed_password = hash_password_async(password, authenticator.rounds).result()
     
-    # Salva no arquivo
-    with open('config.yaml', 'w') as file:
-        yaml.dump(config, file, default_flow_style=False)
+    # Adiciona o novo usuário (inserção atômica; falha se outro cadastro chegou antes)
+    if not user_store.add_user(username, name, email, hashed_password):
+        st.error('Nome de usuário já existe')
+        return False
     
     return True
 
@@ -180,7 +269,7 @@ with col2:
     if not st.session_state["authentication_status"]:
         if not st.session_state.show_register:
             # Mostra o formulário de login
-            authenticator.login()
+            show_login_form()
             
             # Adiciona o botão de registro abaixo do login
             st.write("Não tem uma conta?")
@@ -212,6 +301,15 @@ with col2:
 
 # Só mostra o conteúdo principal se estiver autenticado
 if st.session_state["authentication_status"]:
+    # Mede o session_state desta sessão e despeja objetos grandes (desta, se passou do
+    # limite, e das sessões ociosas)
+    script_ctx = get_script_run_ctx()
+    if script_ctx is not None:
+        evicted_keys = session_memory.track(script_ctx.session_id, st.session_state.get('username'),
+                                            script_ctx.session_state)
+        if evicted_keys:
+            st.toast("Dados antigos da sessão foram liberados para economizar memória.")
+
     # Add the .streamlit directory to the path so we can import the banner module
     sys.path.append('.streamlit')
     try:
@@ -220,59 +318,110 @@ if st.session_state["authentication_status"]:
         def add_banner():
             st.markdown('<h1 class="main-header">🌬️ Indicador de Qualidade do Ar</h1>', unsafe_allow_html=True)
 
-    # Carrega o modelo treinado
+    # Modelo global, modelos por cidade (models/<cidade>/<versao>.joblib) e transformer
+    # vêm do aquecimento; só espera se ele ainda não terminou
+    if not warmup.is_ready():
+        with st.spinner("Carregando modelos..."):
+            warmup.wait()
+    if not warmup.is_ready():
+        st.error(f"Não foi possível carregar os modelos: {warmup.status()['erro']}")
+        st.stop()
+
+    registry = warmup.registry()
+    qt = warmup.quantile_transformer()
+    # Verifica se há versões novas em disco; a troca acontece em segundo plano
+    registry.refresh()
+
+    # Histórico particionado por cidade e mês; na primeira execução o CSV de referência
+    # vira as partições iniciais
     @st.cache_resource
-    def load_model():
-        try:
-            # Primeiro tenta carregar localmente
-            return joblib.load('rf_model.joblib')
-        except FileNotFoundError:
-            # Se não encontrar localmente, baixa do Google Drive
-            # ID do arquivo no Google Drive
-            file_id = "1dSQkrwW-2RhsiCQj_brBxhHWu0xQMUBq"
-            output = 'rf_model.joblib'
-            
-            try:
-                url = f'https://drive.google.com/uc?id={file_id}'
-                gdown.download(url, output, quiet=False)
-                return joblib.load('rf_model.joblib')
-            except Exception as e:
-                st.error(f"Erro ao baixar o modelo do Google Drive: {str(e)}")
-                return None
-
-    model = load_model()
-
-    # Carrega os dados de referência
-    @st.cache_data
-    def load_data():
-        try:
-            # Primeiro tenta ler localmente
-            return pd.read_csv('airquality.csv')
-        except FileNotFoundError:
-            # Se não encontrar localmente, baixa do GitHub
-            content = download_file_from_github(DATA_URL)
-            return pd.read_csv(StringIO(content.decode('utf-8')))
-
-    data = load_data()
-    # Convert column names to lowercase
-    data.columns = data.columns.str.lower()
-    # Select numeric columns for normalization reference
-    data_num = data.select_dtypes(include=['float64', 'int64'])
-
-    # Carrega o Quantile Transformer
+    def load_history_store():
+        store = HistoryStore()
+        if store.is_empty():
+            store.append(pd.read_csv(artifact_path('airquality.csv')))
+        return store
+
+    history_store = load_history_store()
+
+    # O índice por cidade e os agregados cobrem só as cidades e os períodos já pedidos pelas
+    # páginas (ver ``history_views.py``). Horários ausentes e valores faltantes do histórico são
+    # preenchidos ao carregar; as linhas inseridas (``horario_inserido``) e preenchidas
+    # (``imputado``, ``imputado_poluentes``) ficam marcadas e o perfil de qualidade lê as leituras
+    # originais do store
+    imputation_config = config.get('imputation') or {}
+
+    @st.cache_resource
+    def load_history_views():
+        return HistoryViews(history_store, imputation_config.get('history', 'interpolacao'),
+                            imputation_config.get('limit', IMPUTATION_LIMIT))
+
+    history_views = load_history_views()
+
+    # Primeira e última data de uma cidade (ou de todas), para os filtros de período
+    @st.cache_data(max_entries=64)
+    def history_bounds(city, store_version):
+        return history_store.bounds([city] if city is not None else None)
+
+    # Cálculos da análise em cache pela revisão do índice (``history_version``)
+    @st.cache_data(max_entries=32)
+    def city_summary(_history, pollutant, start, end, history_version):
+        return _history.city_summary(pollutant, start, end)
+
+    @st.cache_data(max_entries=64)
+    def period_correlation(_history, city, start, end, history_version):
+        return _history.period_correlation(city, start, end)
+
+    @st.cache_data(max_entries=64)
+    def bivariate_density(_history, x_var, y_var, city, start, end, history_version):
+        return _history.density(x_var, y_var, city, start, end)
+
+    # Resultados de lotes em disco, compartilhados entre sessões e reruns
     @st.cache_resource
-    def load_quantile_transformer():
-        try:
-            # Primeiro tenta carregar localmente
-            return joblib.load('qt.joblib')
-        except FileNotFoundError:
-            # Se não encontrar localmente, baixa do GitHub
-            content = download_file_from_github("https://github.com/sidnei-almeida/air_quality_indicator/raw/refs/heads/main/qt.joblib")
-            with open('qt.joblib', 'wb') as f:
-                f.write(content)
-            return joblib.load('qt.joblib')
-
-    qt = load_quantile_transformer()
+    def load_result_store():
+        return ResultStore()
+
+    result_store = load_result_store()
+
+    # Fila de processamentos em segundo plano (arquivos grandes não travam a sessão)
+    @st.cache_resource
+    def load_job_queue():
+        def store_job_result(results_df, batch_id):
+            results_df, anomaly_stats = finalize_batch(results_df)
+            result_store.put(batch_id, results_df, {
+                'result_hash': frame_hash(results_df),
+                'anomaly_stats': anomaly_stats
+            })
+
+        return JobQueue(
+            process_chunk=lambda chunk: score_chunk(registry, qt, chunk),
+            finalize=store_job_result,
+            # A imputação vê o arquivo inteiro, não cada bloco
+            prepare=lambda input_df, options: impute_batch(
+                input_df, options.get('imputacao', 'nenhum'), REQUIRED_COLUMNS
+            )[0]
+        )
+
+    job_queue = load_job_queue()
+
+    # Detecção de anomalias sobre todo o índice (o filtro de data é aplicado depois)
+    @st.cache_data(max_entries=8)
+    def detect_historical_anomalies(_history, window, threshold, history_version):
+        return _history.anomalies(window, threshold)
+
+    # Contribuições de cada poluente e intervalo entre as árvores, em cache por vetor de entrada
+    # e versão do modelo. Retorna ``(explanation, (inferior, superior))``.
+    @st.cache_data(max_entries=1000)
+    def explain_vector(vector, city, model_version):
+        return page_steps.explain_vector(registry, qt, vector, city)
+
+    # Varreduras "e se?" em cache por vetor base, cidade e versão do modelo
+    @st.cache_data(max_entries=200)
+    def what_if_sweeps(vector, city, model_version, ranges, points):
+        return page_steps.what_if_sweeps(registry, qt, vector, city, ranges, points)
+
+    @st.cache_data(max_entries=200)
+    def what_if_grid(vector, city, model_version, x_pollutant, y_pollutant, ranges, points):
+        return page_steps.what_if_grid(registry, qt, vector, city, x_pollutant, y_pollutant, ranges, points)
 
     def show_individual_prediction():
         st.write("Esta página permite prever o Índice de Qualidade do Ar (AQI) com base em medições individuais de poluentes.")
@@ -282,7 +431,7 @@ if st.session_state["authentication_status"]:
             st.session_state.prediction_history = []
 
         # Criar tabs para input e histórico
-        tab1, tab2 = st.tabs(["📊 Nova Previsão", "📜 Histórico"])
+        tab1, tab_what_if, tab2 = st.tabs(["📊 Nova Previsão", "🎛️ E se?", "📜 Histórico"])
 
         with tab1:
             # Criar containers para organizar o layout
@@ -291,14 +440,7 @@ if st.session_state["authentication_status"]:
 
             with input_container:
                 # Definir limites e valores de referência para cada poluente
-                pollutant_limits = {
-                    'co': {'min': 0.0, 'max': 1000.0, 'ref': 290.0, 'unit': 'μg/m³'},
-                    'no2': {'min': 0.0, 'max': 100.0, 'ref': 25.0, 'unit': 'μg/m³'},
-                    'so2': {'min': 0.0, 'max': 50.0, 'ref': 1.0, 'unit': 'μg/m³'},
-                    'o3': {'min': 0.0, 'max': 100.0, 'ref': 25.0, 'unit': 'μg/m³'},
-                    'pm2.5': {'min': 0.0, 'max': 100.0, 'ref': 10.0, 'unit': 'μg/m³'},
-                    'pm10': {'min': 0.0, 'max': 150.0, 'ref': 15.0, 'unit': 'μg/m³'}
-                }
+                pollutant_limits = POLLUTANT_LIMITS
 
                 # Criar layout com três colunas
                 col1, col2 = st.columns(2)
@@ -344,6 +486,16 @@ if st.session_state["authentication_status"]:
                                 help=get_pollutant_description(pollutant)
                             )
 
+                # Seleção do modelo por cidade, quando houver modelos específicos
+                city_options = [c for c in registry.cities() if c != DEFAULT_KEY]
+                selected_city = None
+                if city_options:
+                    selected_city = st.selectbox(
+                        "Modelo da cidade:",
+                        [None] + city_options,
+                        format_func=lambda c: "Geral" if c is None else c.replace('_', ' ').title()
+                    )
+
                 # Botão de previsão com classe específica
                 button_container = st.container()
                 with button_container:
@@ -353,38 +505,27 @@ if st.session_state["authentication_status"]:
                 
                 if predict_button:
                     with st.spinner('Processando dados...'):
-                        # Criar DataFrame com os valores de entrada
-                        input_data = pd.DataFrame({
-                            'co': [input_values['co']],
-                            'no2': [input_values['no2']],
-                            'so2': [input_values['so2']],
-                            'o3': [input_values['o3']],
-                            'pm2.5': [input_values['pm2.5']],
-                            'pm10': [input_values['pm10']],
-                            'aqi': [0]  # Valor temporário para a transformação
-                        })
-
-                        # Normalizar dados usando o Quantile Transformer pré-treinado
-                        input_normalized = pd.DataFrame(
-                            qt.transform(input_data),
-                            columns=input_data.columns
-                        )
-                        # Remover a coluna 'aqi' antes de fazer a previsão
-                        input_normalized = input_normalized.drop('aqi', axis=1)
+                        # Normalizar com o Quantile Transformer e prever com o modelo da cidade selecionada
+                        input_vector = tuple(input_values[p] for p in REQUIRED_COLUMNS)
+                        prediction = page_steps.predict_vector(registry, qt, input_vector, selected_city)
 
-                        # Fazer previsão
-                        prediction = model.predict(input_normalized)
-                        
                         # Adicionar ao histórico
                         st.session_state.prediction_history.append({
                             'timestamp': datetime.now(),
                             'inputs': input_values.copy(),
-                            'prediction': prediction[0]
+                            'prediction': prediction
                         })
+                        session_memory.trim_history(st.session_state.prediction_history)
 
                         # Mostrar resultado
                         with result_container:
-                            show_prediction_result(prediction[0])
+                            model_entry = registry.current(city_key(selected_city)) or registry.current(DEFAULT_KEY)
+                            explanation, interval = explain_vector(
+                                input_vector,
+                                selected_city,
+                                model_entry.version if model_entry else None
+                            )
+                            show_prediction_result(prediction, explanation, interval)
                             
                             # Adicionar gráfico comparativo
                             st.subheader("Comparação com Valores de Referência")
@@ -425,6 +566,64 @@ if st.session_state["authentication_status"]:
                             
                             st.plotly_chart(fig, use_container_width=True)
 
+        with tab_what_if:
+            st.write("Como o AQI previsto responde a variações de cada poluente em torno dos valores "
+                     "informados na aba de previsão (os demais poluentes ficam fixos).")
+            base_vector = tuple(input_values[p] for p in REQUIRED_COLUMNS)
+            model_entry = registry.current(city_key(selected_city)) or registry.current(DEFAULT_KEY)
+            model_version = model_entry.version if model_entry else None
+            points = st.select_slider("Pontos por poluente:", options=[25, 50, 100, 200],
+                                      value=page_steps.WHAT_IF_POINTS)
+
+            sweeps = what_if_sweeps(base_vector, selected_city, model_version, page_steps.WHAT_IF_RANGES, points)
+            ranking = sensitivity_ranking(sweeps)
+            st.info(f"🎯 Nesta medição, {ranking.index[0].upper()} é o poluente que mais altera o AQI "
+                    f"(variação de {ranking.iloc[0]:.1f} pontos na faixa permitida).")
+
+            # Curvas de resposta, uma por poluente
+            response_cols = st.columns(3)
+            for i, pollutant in enumerate(ranking.index):
+                curve = sweeps[sweeps['poluente'] == pollutant]
+                fig = go.Figure(go.Scatter(x=curve['valor'], y=curve['aqi'], mode='lines',
+                                           line=dict(color='#02ab21')))
+                fig.add_vline(x=input_values[pollutant], line_dash='dash', line_color='gray')
+                fig.update_layout(
+                    title=f"{pollutant.upper()} (amplitude {ranking[pollutant]:.1f})",
+                    xaxis_title=f"{pollutant.upper()} (μg/m³)",
+                    yaxis_title="AQI Previsto",
+                    height=280,
+                    margin=dict(t=40, b=40)
+                )
+                with response_cols[i % 3]:
+                    st.plotly_chart(fig, use_container_width=True)
+
+            # Grade 2-D para dois poluentes
+            st.subheader("Interação entre Dois Poluentes")
+            default_x, _ = page_steps.what_if_axes(ranking)
+            col1, col2 = st.columns(2)
+            with col1:
+                x_pollutant = st.selectbox("Eixo X:", REQUIRED_COLUMNS, index=REQUIRED_COLUMNS.index(default_x),
+                                           key="what_if_x")
+            with col2:
+                y_options = [p for p in REQUIRED_COLUMNS if p != x_pollutant]
+                y_pollutant = st.selectbox("Eixo Y:", y_options, key="what_if_y")
+            x_values, y_values, grid = what_if_grid(
+                base_vector, selected_city, model_version, x_pollutant, y_pollutant,
+                page_steps.WHAT_IF_RANGES, page_steps.WHAT_IF_GRID_POINTS
+            )
+            fig = go.Figure(go.Heatmap(z=grid, x=x_values, y=y_values, colorscale='YlOrRd',
+                                       colorbar=dict(title='AQI')))
+            fig.add_trace(go.Scatter(x=[input_values[x_pollutant]], y=[input_values[y_pollutant]],
+                                     mode='markers', marker=dict(color='black', size=10, symbol='x'),
+                                     name='Medição atual'))
+            fig.update_layout(
+                title=f"AQI Previsto por {x_pollutant.upper()} e {y_pollutant.upper()}",
+                xaxis_title=f"{x_pollutant.upper()} (μg/m³)",
+                yaxis_title=f"{y_pollutant.upper()} (μg/m³)",
+                height=450
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
         with tab2:
             if st.session_state.prediction_history:
                 st.subheader("Histórico de Previsões")
@@ -475,6 +674,18 @@ if st.session_state["authentication_status"]:
         }
         return descriptions.get(pollutant, "")
 
+    # Template em Excel gerado uma vez por processo, não um BytesIO novo a cada rerun
+    @st.cache_data(max_entries=1)
+    def template_excel(template_data):
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
+            template_data.to_excel(writer, sheet_name='Template', index=False)
+            # Ajustar largura das colunas
+            worksheet = writer.sheets['Template']
+            for i, col in enumerate(template_data.columns):
+                worksheet.set_column(i, i, 15)
+        return buffer.getvalue()
+
     def show_batch_prediction():
         st.write("Esta página permite fazer previsões em lote do Índice de Qualidade do Ar (AQI) para múltiplas medições.")
         
@@ -489,7 +700,7 @@ if st.session_state["authentication_status"]:
         })
         
         # Criar abas para organizar o conteúdo
-        tab1, tab2 = st.tabs(["📥 Upload e Previsão", "📋 Instruções"])
+        tab1, tab_queue, tab2 = st.tabs(["📥 Upload e Previsão", "🗂️ Fila de Processamento", "📋 Instruções"])
         
         with tab1:
             col1, col2 = st.columns([2, 1])
@@ -498,11 +709,11 @@ if st.session_state["authentication_status"]:
                 st.markdown("""
                 <div style='border: 1px solid #e0e0e0; border-radius: 5px; padding: 15px; margin-bottom: 20px;'>
                     <h3 style='margin-top: 0;'>📤 Upload de Arquivo</h3>
-                    <p>Faça upload de um arquivo CSV com as medições dos poluentes.</p>
+                    <p>Faça upload de um arquivo CSV (também .csv.gz/.csv.zst), Parquet ou Excel com as medições dos poluentes.</p>
                 </div>
                 """, unsafe_allow_html=True)
                 
-                uploaded_file = st.file_uploader("Escolha um arquivo CSV", type="csv")
+                uploaded_file = st.file_uploader("Escolha um arquivo", type=UPLOAD_EXTENSIONS)
             
             with col2:
                 st.markdown("""
@@ -527,70 +738,37 @@ if st.session_state["authentication_status"]:
                         mime="text/csv"
                     )
                 else:
-                    # Criar buffer para arquivo Excel
-                    buffer = io.BytesIO()
-                    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                        template_data.to_excel(writer, sheet_name='Template', index=False)
-                        # Ajustar largura das colunas
-                        worksheet = writer.sheets['Template']
-                        for i, col in enumerate(template_data.columns):
-                            worksheet.set_column(i, i, 15)
-                    
                     st.download_button(
                         label="📥 Download Template Excel",
-                        data=buffer.getvalue(),
+                        data=template_excel(template_data),
                         file_name="template.xlsx",
                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                     )
             
             if uploaded_file is not None:
                 try:
-                    # Tentar ler o arquivo
-                    input_df = pd.read_csv(uploaded_file)
                     required_columns = ['co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10']
-                    
-                    # Verificar colunas
-                    missing_cols = [col for col in required_columns if col not in input_df.columns]
-                    if missing_cols:
-                        st.error(f"❌ Colunas ausentes no arquivo: {', '.join(missing_cols)}")
-                        return
-                    
-                    # Verificar tipos de dados e valores
-                    invalid_rows = []
-                    for idx, row in input_df.iterrows():
-                        try:
-                            for col in required_columns:
-                                # Converter para float e verificar se é negativo
-                                val = float(row[col])
-                                if val < 0:
-                                    invalid_rows.append(idx + 1)
-                                    break
-                        except (ValueError, TypeError):
-                            invalid_rows.append(idx + 1)
-                            break
-                    
-                    if invalid_rows:
-                        st.error(f"❌ Linhas com valores inválidos: {', '.join(map(str, invalid_rows))}")
+
+                    # Colunas conferidas pelo cabeçalho, antes de ler o arquivo inteiro; depois só as
+                    # colunas usadas são lidas (poluentes em float32) e os valores são validados
+                    try:
+                        input_df = page_steps.load_upload(uploaded_file, uploaded_file.name)
+                    except page_steps.UploadRejected as e:
+                        st.error(f"❌ {e}")
                         return
+
+                    upload_hash = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
                     
                     # Preview dos dados com estilo
                     st.markdown("### 📊 Preview dos Dados")
                     
-                    # Adicionar toggle para mostrar estatísticas
-                    show_stats = st.checkbox("Mostrar estatísticas básicas")
-                    if show_stats:
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.markdown("#### 📈 Estatísticas Gerais")
-                            stats = input_df.describe()
-                            st.dataframe(stats.style.format("{:.2f}"))
-                        with col2:
-                            st.markdown("#### 🔍 Informações do Dataset")
-                            st.write(f"- Total de registros: {len(input_df)}")
-                            st.write(f"- Memória utilizada: {input_df.memory_usage().sum() / 1024:.2f} KB")
-                            st.write("- Tipos de dados:")
-                            for col in input_df.columns:
-                                st.write(f"  - {col}: {input_df[col].dtype}")
+                    # Perfil de qualidade do arquivo (uma passada, em cache pelo hash do arquivo)
+                    with st.expander("🩺 Qualidade dos Dados"):
+                        show_data_profile(batch_profile(input_df, upload_hash))
+                        st.caption(
+                            f"Memória utilizada: {input_df.memory_usage().sum() / 1024:.2f} KB · Tipos: "
+                            + ", ".join(f"{col} ({dtype})" for col, dtype in input_df.dtypes.items())
+                        )
                     
                     # Preview da tabela com scroll
                     st.markdown("#### 📋 Dados Carregados")
@@ -599,284 +777,123 @@ if st.session_state["authentication_status"]:
                         use_container_width=True
                     )
                     
+                    # Células vazias: preenchidas por cidade antes da previsão, conforme o método escolhido
+                    imputation_method = 'nenhum'
+                    blank_cells = int(input_df[REQUIRED_COLUMNS].isna().to_numpy().sum())
+                    if blank_cells:
+                        imputation_method = st.radio(
+                            f"O arquivo tem {blank_cells:,} células vazias. Preencher com:",
+                            list(IMPUTATION_METHODS),
+                            index=list(IMPUTATION_METHODS).index('interpolacao'),
+                            format_func=IMPUTATION_METHODS.get,
+                            horizontal=True,
+                            key="imputation_method"
+                        )
+                        input_df, filled_cells, incomplete = page_steps.impute_upload(input_df, imputation_method)
+                        if imputation_method != 'nenhum':
+                            st.caption(f"{filled_cells:,} de {blank_cells:,} células preenchidas "
+                                       "(marcadas nas colunas 'imputado' e 'imputado_poluentes').")
+                        # O que o método não preencheu (ex.: lacunas longas, início da série) não vai ao modelo
+                        if len(incomplete) == len(input_df):
+                            st.error("❌ Todas as linhas têm células vazias: escolha um método de preenchimento.")
+                            return
+                        if len(incomplete):
+                            st.warning(
+                                f"⚠️ {len(incomplete):,} linhas ainda têm células vazias e ficarão sem previsão "
+                                f"(primeiras: {', '.join(map(str, incomplete[:10]))})."
+                            )
+
+                    # Identifica o lote pelo conteúdo do arquivo, pelas versões dos modelos e pela imputação
+                    # (mudar qualquer uma invalida o cache do lote)
+                    model_signature = ';'.join(
+                        [f"{m['cidade']}={m['versao']}" for m in registry.stats()] + interval_columns()
+                        + ([f"imputacao={imputation_method}"] if imputation_method != 'nenhum' else [])
+                    )
+                    batch_id = job_id(upload_hash, model_signature)
+                    cached_result = result_store.get(batch_id)
+                    computed_now = False
+
                     # Container para os botões de ação
                     col1, col2, col3 = st.columns([1,1,1])
                     with col2:
                         st.markdown('<div class="main-button">', unsafe_allow_html=True)
                         predict_button = st.button("🎯 Realizar Previsões", use_container_width=True)
                         st.markdown('</div>', unsafe_allow_html=True)
+                    with col3:
+                        queue_button = st.button("🗂️ Enviar para a fila", use_container_width=True,
+                                                 disabled=cached_result is not None)
+
+                    if queue_button:
+                        if job_queue.enqueue(batch_id, st.session_state['username'],
+                                             uploaded_file.name, uploaded_file.getvalue(),
+                                             options={'imputacao': imputation_method}):
+                            st.success("✅ Arquivo enviado para a fila. Acompanhe na aba 'Fila de Processamento'.")
+                        else:
+                            st.info("ℹ️ Este arquivo já está na fila.")
 
-                    # Mover a lógica de previsão para fora das colunas
-                    if predict_button:
+                    # Mover a lógica de previsão para fora das colunas (lotes em cache não são recalculados)
+                    if predict_button and cached_result is None:
                         # Criar barra de progresso
                         progress_bar = st.progress(0)
                         status_text = st.empty()
                         
+                        def show_progress(fraction, text):
+                            if text:
+                                status_text.text(text)
+                            progress_bar.progress(int(fraction * 100))
+
                         try:
-                            # Normalizar dados
-                            status_text.text("Normalizando dados...")
-                            # Adicionar coluna 'aqi' temporária
-                            input_df_with_aqi = input_df[required_columns].copy()
-                            input_df_with_aqi['aqi'] = 0  # Valor temporário para a transformação
-                            
-                            input_normalized = pd.DataFrame(
-                                qt.transform(input_df_with_aqi),
-                                columns=input_df_with_aqi.columns
-                            )
-                            # Remover a coluna 'aqi' antes de fazer a previsão
-                            input_normalized = input_normalized.drop('aqi', axis=1)
-                            progress_bar.progress(30)
-                            
-                            # Fazer previsões
-                            status_text.text("Realizando previsões...")
-                            predictions = model.predict(input_normalized)
-                            progress_bar.progress(60)
-                            
-                            # Preparar resultados
-                            status_text.text("Preparando resultados...")
-                            results_df = input_df.copy()
-                            results_df['aqi_prediction'] = predictions
-                            progress_bar.progress(90)
-                            
+                            # Previsões com a contribuição de cada poluente (modelo por cidade se houver
+                            # coluna 'city') e leituras atípicas marcadas (por cidade, se houver a coluna)
+                            results_df, anomaly_stats = page_steps.score_upload(registry, qt, input_df, show_progress)
+
                             # Mostrar resultados
                             st.success("✅ Previsões realizadas com sucesso!")
                             progress_bar.progress(100)
                             status_text.empty()
                             
-                            # Criar container para resultados usando toda a largura
-                            st.markdown("### 📊 Resultados das Previsões")
-                            
-                            # Tabs para diferentes visualizações dos resultados
-                            result_tab1, result_tab2, result_tab3 = st.tabs([
-                                "📊 Resultados", 
-                                "📈 Visualizações",
-                                "📥 Exportar"
-                            ])
-                            
-                            with result_tab1:
-                                # Estilizar e mostrar o dataframe
-                                st.dataframe(
-                                    results_df.style
-                                    .format({
-                                        'aqi_prediction': '{:.2f}',
-                                        'co': '{:.2f}',
-                                        'no2': '{:.2f}',
-                                        'so2': '{:.2f}',
-                                        'o3': '{:.2f}',
-                                        'pm2.5': '{:.2f}',
-                                        'pm10': '{:.2f}'
-                                    })
-                                    .background_gradient(
-                                        subset=['aqi_prediction'],
-                                        cmap='YlOrRd'
-                                    ),
-                                    use_container_width=True
-                                )
-                                
-                                # Adicionar estatísticas resumidas em colunas que ocupam toda a largura
-                                st.markdown("#### 📊 Estatísticas Resumidas")
-                                metric_cols = st.columns(4)
-                                
-                                with metric_cols[0]:
-                                    st.metric(
-                                        "AQI Médio",
-                                        f"{results_df['aqi_prediction'].mean():.2f}",
-                                        f"{results_df['aqi_prediction'].std():.2f} σ"
-                                    )
-                                
-                                with metric_cols[1]:
-                                    st.metric(
-                                        "AQI Máximo",
-                                        f"{results_df['aqi_prediction'].max():.2f}",
-                                        f"Linha {results_df['aqi_prediction'].idxmax() + 1}"
-                                    )
-                                
-                                with metric_cols[2]:
-                                    st.metric(
-                                        "AQI Mínimo",
-                                        f"{results_df['aqi_prediction'].min():.2f}",
-                                        f"Linha {results_df['aqi_prediction'].idxmin() + 1}"
-                                    )
-                                
-                                with metric_cols[3]:
-                                    n_critical = len(results_df[results_df['aqi_prediction'] > 150])
-                                    st.metric(
-                                        "Registros Críticos",
-                                        n_critical,
-                                        f"{(n_critical/len(results_df))*100:.1f}%"
-                                    )
-
-                            with result_tab2:
-                                # Criar subseções para diferentes tipos de visualização
-                                st.markdown("#### 📈 Distribuição do AQI")
-                                dist_col1, dist_col2 = st.columns(2)
-                                
-                                with dist_col1:
-                                    # Histograma melhorado das previsões
-                                    fig_hist = px.histogram(
-                                        results_df,
-                                        x='aqi_prediction',
-                                        nbins=30,
-                                        title='Distribuição das Previsões de AQI',
-                                        labels={'aqi_prediction': 'AQI Previsto', 'count': 'Frequência'},
-                                        color_discrete_sequence=['#02ab21']
-                                    )
-                                    fig_hist.update_layout(
-                                        showlegend=False,
-                                        plot_bgcolor='white',
-                                        title_x=0.5
-                                    )
-                                    st.plotly_chart(fig_hist, use_container_width=True)
-                                
-                                with dist_col2:
-                                    # Box plot melhorado
-                                    fig_box = px.box(
-                                        results_df,
-                                        y='aqi_prediction',
-                                        title='Distribuição do AQI (Box Plot)',
-                                        labels={'aqi_prediction': 'AQI Previsto'},
-                                        color_discrete_sequence=['#02ab21']
-                                    )
-                                    fig_box.update_layout(
-                                        showlegend=False,
-                                        plot_bgcolor='white',
-                                        title_x=0.5
-                                    )
-                                    st.plotly_chart(fig_box, use_container_width=True)
-
-                                # Adicionar seção de análise temporal se houver coluna de data
-                                if 'date' in results_df.columns:
-                                    st.markdown("#### 📅 Análise Temporal")
-                                    # Gráfico de linha do AQI ao longo do tempo
-                                    fig_time = px.line(
-                                        results_df,
-                                        x='date',
-                                        y='aqi_prediction',
-                                        title='Evolução do AQI ao Longo do Tempo',
-                                        labels={
-                                            'date': 'Data',
-                                            'aqi_prediction': 'AQI Previsto'
-                                        }
-                                    )
-                                    fig_time.update_layout(
-                                        plot_bgcolor='white',
-                                        title_x=0.5
-                                    )
-                                    st.plotly_chart(fig_time, use_container_width=True)
-
-                                # Análise de Correlação
-                                st.markdown("#### 🔄 Correlação entre Variáveis")
-                                
-                                # Heatmap de correlação
-                                corr_matrix = results_df[['aqi_prediction', 'co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10']].corr()
-                                fig_corr = px.imshow(
-                                    corr_matrix,
-                                    labels=dict(color="Correlação"),
-                                    color_continuous_scale='RdBu',
-                                    aspect='auto'
-                                )
-                                fig_corr.update_layout(
-                                    title={
-                                        'text': 'Matriz de Correlação',
-                                        'x': 0.5
-                                    }
-                                )
-                                st.plotly_chart(fig_corr, use_container_width=True)
-
-                                # Análise de Contribuição
-                                st.markdown("#### 🎯 Contribuição dos Poluentes")
-                                
-                                # Calcular médias dos poluentes
-                                pollutant_means = results_df[['co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10']].mean()
-                                
-                                # Criar gráfico de barras para médias dos poluentes
-                                fig_contrib = go.Figure(data=[
-                                    go.Bar(
-                                        x=pollutant_means.index,
-                                        y=pollutant_means.values,
-                                        marker_color='#02ab21'
-                                    )
-                                ])
-                                fig_contrib.update_layout(
-                                    title={
-                                        'text': 'Média dos Poluentes',
-                                        'x': 0.5
-                                    },
-                                    xaxis_title="Poluente",
-                                    yaxis_title="Concentração Média (μg/m³)",
-                                    plot_bgcolor='white'
-                                )
-                                st.plotly_chart(fig_contrib, use_container_width=True)
-
-                                # Adicionar insights baseados nos dados
-                                st.markdown("#### 💡 Insights")
-                                insights_col1, insights_col2 = st.columns(2)
-                                
-                                with insights_col1:
-                                    # Encontrar o poluente mais correlacionado com AQI
-                                    corr_with_aqi = corr_matrix['aqi_prediction'].abs()
-                                    most_corr = corr_with_aqi.nlargest(2).index[1]  # Pegar o segundo maior (primeiro é o próprio AQI)
-                                    st.info(f"🔍 O poluente mais correlacionado com o AQI é {most_corr.upper()} " +
-                                           f"(correlação: {corr_matrix.loc['aqi_prediction', most_corr]:.2f})")
-                                
-                                with insights_col2:
-                                    # Identificar poluente com maior variação
-                                    cv = results_df[['co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10']].std() / results_df[['co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10']].mean()
-                                    most_variable = cv.idxmax()
-                                    st.info(f"📊 O poluente com maior variação relativa é {most_variable.upper()} " +
-                                           f"(CV: {cv[most_variable]:.2f})")
-
-                            with result_tab3:
-                                col1, col2 = st.columns(2)
-                                
-                                with col1:
-                                    # Download CSV
-                                    st.download_button(
-                                        label="📥 Download CSV",
-                                        data=results_df.to_csv(index=False),
-                                        file_name="predictions.csv",
-                                        mime="text/csv"
-                                    )
-                                
-                                with col2:
-                                    # Download Excel
-                                    buffer = io.BytesIO()
-                                    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                                        results_df.to_excel(writer, sheet_name='Predictions', index=False)
-                                        # Ajustar largura das colunas
-                                        worksheet = writer.sheets['Predictions']
-                                        for i, col in enumerate(results_df.columns):
-                                            worksheet.set_column(i, i, 15)
-                                    
-                                    st.download_button(
-                                        label="📥 Download Excel",
-                                        data=buffer.getvalue(),
-                                        file_name="predictions.xlsx",
-                                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                                    )
+                            # Guardar o resultado para que sobreviva a reruns e novos uploads do mesmo arquivo
+                            result_store.put(batch_id, results_df, {
+                                'result_hash': frame_hash(results_df),
+                                'anomaly_stats': anomaly_stats
+                            })
+                            cached_result = result_store.get(batch_id)
+                            computed_now = True
                                 
                         except Exception as e:
                             st.error(f"❌ Erro ao processar as previsões: {str(e)}")
                             progress_bar.empty()
                             status_text.empty()
                         st.markdown('</div>', unsafe_allow_html=True)
+
+                    # Mostrar resultados já calculados para este lote
+                    if cached_result is not None:
+                        results_df, metadata = cached_result
+                        if not computed_now:
+                            st.caption("♻️ Resultados recuperados do cache para este arquivo.")
+                        show_batch_results(results_df, metadata['anomaly_stats'], metadata['result_hash'])
                 
                 except Exception as e:
                     st.error(f"❌ Erro ao ler o arquivo: {str(e)}")
         
+        with tab_queue:
+            show_job_queue()
+
         with tab2:
             st.markdown("""
             ### 📋 Instruções de Uso
             
             1. **Preparação dos Dados**
                - Baixe o template no formato desejado (CSV ou Excel)
+               - Formatos aceitos no upload: CSV, CSV comprimido (.csv.gz, .csv.zst), Parquet e Excel (.xlsx)
+               - Colunas opcionais: date e city (demais colunas são ignoradas)
                - Preencha com suas medições de poluentes
                - Mantenha os nomes das colunas inalterados
             
             2. **Formato dos Dados**
                - Todas as medições devem ser números positivos
                - Use ponto (.) como separador decimal
-               - Não deixe células vazias
+               - Células vazias podem ser preenchidas antes da previsão (última leitura, interpolação no tempo ou modelo)
             
             3. **Colunas Necessárias**
                - co: Monóxido de Carbono (μg/m³)
@@ -895,73 +912,482 @@ if st.session_state["authentication_status"]:
                - PM10: 0-150 μg/m³
             """)
 
+    # Gráficos de distribuição a partir de resumos calculados no servidor:
+    # o navegador recebe só as contagens e os cinco números, não as linhas
+    # Perfil de qualidade em cache pelo conjunto de dados (período do histórico ou hash do arquivo)
+    @st.cache_data(max_entries=32)
+    def history_profile(city, start, end, history_version):
+        return history_views.profile(city, start, end)
+
+    @st.cache_data(max_entries=16)
+    def batch_profile(_input_df, upload_hash):
+        return profile_readings(_input_df, REQUIRED_COLUMNS)
+
+    def show_data_profile(profile):
+        """Faltantes, valores fora da faixa, datas repetidas, lacunas e sensores travados."""
+        columns = profile['colunas']
+        gaps = int(profile['cidades']['lacunas'].sum()) if profile['cidades'] is not None else 0
+        metric_cols = st.columns(5)
+        metric_cols[0].metric("Valores faltantes", f"{int(columns['faltantes'].sum()):,}")
+        metric_cols[1].metric("Fora da faixa", f"{int((columns['abaixo_min'] + columns['acima_max']).sum()):,}")
+        metric_cols[2].metric("Datas repetidas", f"{profile['duplicadas']:,}")
+        metric_cols[3].metric("Lacunas na série", f"{gaps:,}")
+        metric_cols[4].metric("Sensores travados", f"{int(columns['travamentos'].sum()):,}")
+        st.dataframe(
+            columns.style.format({
+                'faltantes_pct': '{:.2f}%', 'fora_faixa_pct': '{:.2f}%',
+                'min': '{:.2f}', 'media': '{:.2f}', 'max': '{:.2f}'
+            }),
+            use_container_width=True
+        )
+        if profile['cidades'] is not None and (gaps or profile['duplicadas']):
+            st.dataframe(profile['cidades'].astype({'maior_lacuna': str}), use_container_width=True)
+        details = [f"{profile['linhas']:,} linhas analisadas em {profile['segundos']:.2f}s"]
+        if profile['intervalo'] is not None:
+            details.append(f"intervalo típico entre leituras: {profile['intervalo']}")
+        if profile['datas_invalidas']:
+            details.append(f"{profile['datas_invalidas']:,} datas inválidas")
+        st.caption(" · ".join(details) + ". Sensor travado: 12 ou mais leituras seguidas com o mesmo valor.")
+
+    def summary_histogram(counts, edges, title, x_label, color='#02ab21'):
+        fig = go.Figure(go.Bar(
+            x=(edges[:-1] + edges[1:]) / 2,
+            y=counts,
+            width=np.diff(edges),
+            marker_color=color,
+            hovertemplate=f'{x_label}: %{{x:.2f}}<br>Frequência: %{{y}}<extra></extra>'
+        ))
+        fig.update_layout(title=title, xaxis_title=x_label, yaxis_title='Frequência', bargap=0.1)
+        return fig
+
+    def summary_box(box, title, y_label, color='#02ab21'):
+        fig = go.Figure()
+        if box is not None:
+            fig.add_trace(go.Box(
+                q1=[box['q1']],
+                median=[box['mediana']],
+                q3=[box['q3']],
+                lowerfence=[box['bigode_inferior']],
+                upperfence=[box['bigode_superior']],
+                mean=[box['media']],
+                x=[y_label],
+                marker_color=color,
+                name=y_label
+            ))
+            if len(box['outliers']):
+                fig.add_trace(go.Scatter(
+                    x=[y_label] * len(box['outliers']),
+                    y=box['outliers'],
+                    mode='markers',
+                    marker=dict(color=color, size=4, opacity=0.6),
+                    name=f"Outliers ({box['total_outliers']:,})"
+                ))
+        fig.update_layout(title=title, yaxis_title=y_label, showlegend=False)
+        return fig
+
+    @st.cache_data(max_entries=64)
+    def distribution_summary(_history, pollutant, city, start, end, history_version):
+        return _history.distribution(pollutant, city, start, end)
+
+    # Gráficos do lote, em cache pelo hash do resultado (reruns não os reconstroem)
+    @st.cache_data(max_entries=16)
+    def build_batch_figures(_results_df, result_hash):
+        summaries = page_steps.batch_summaries(_results_df)
+        figures = {}
+
+        # Histograma e box plot das previsões
+        fig_hist = summary_histogram(*summaries['hist'], 'Distribuição das Previsões de AQI', 'AQI Previsto')
+        fig_hist.update_layout(showlegend=False, plot_bgcolor='white', title_x=0.5)
+        figures['hist'] = fig_hist
+
+        fig_box = summary_box(summaries['box'], 'Distribuição do AQI (Box Plot)', 'AQI Previsto')
+        fig_box.update_layout(plot_bgcolor='white', title_x=0.5)
+        figures['box'] = fig_box
+
+        if summaries['time'] is not None:
+            # AQI ao longo do tempo, agregado na resolução adequada ao período do arquivo
+            grain, series = summaries['time']
+            fig_time = go.Figure([
+                go.Scatter(x=series.index, y=series['aqi_prediction_max'], name='Máximo',
+                           mode='lines', line=dict(color='rgba(2, 171, 33, 0.35)', dash='dot')),
+                go.Scatter(x=series.index, y=series['aqi_prediction_mean'], name='Média',
+                           mode='lines', line=dict(color='#02ab21'))
+            ])
+            fig_time.update_layout(
+                title=f'Evolução do AQI ao Longo do Tempo (por {GRAIN_LABELS[grain].lower()})',
+                xaxis_title='Data',
+                yaxis_title='AQI Previsto',
+                plot_bgcolor='white',
+                title_x=0.5
+            )
+            figures['time'] = fig_time
+
+        # Heatmap de correlação
+        fig_corr = px.imshow(
+            summaries['corr'],
+            labels=dict(color="Correlação"),
+            color_continuous_scale='RdBu',
+            aspect='auto'
+        )
+        fig_corr.update_layout(
+            title={
+                'text': 'Matriz de Correlação',
+                'x': 0.5
+            }
+        )
+        figures['corr'] = fig_corr
+
+        # Médias dos poluentes
+        pollutant_means = summaries['means']
+
+        # Criar gráfico de barras para médias dos poluentes
+        fig_contrib = go.Figure(data=[
+            go.Bar(
+                x=pollutant_means.index,
+                y=pollutant_means.values,
+                marker_color='#02ab21'
+            )
+        ])
+        fig_contrib.update_layout(
+            title={
+                'text': 'Média dos Poluentes',
+                'x': 0.5
+            },
+            xaxis_title="Poluente",
+            yaxis_title="Concentração Média (μg/m³)",
+            plot_bgcolor='white'
+        )
+        figures['contrib'] = fig_contrib
+
+        # Contribuição média (absoluta) de cada poluente para o AQI previsto
+        mean_abs_contrib = summaries['contrib']
+        fig_explain = go.Figure(data=[
+            go.Bar(
+                x=REQUIRED_COLUMNS,
+                y=mean_abs_contrib.values,
+                marker_color='#028a1a'
+            )
+        ])
+        fig_explain.update_layout(
+            title={
+                'text': 'Contribuição Média para o AQI Previsto',
+                'x': 0.5
+            },
+            xaxis_title="Poluente",
+            yaxis_title="|Contribuição| média (AQI)",
+            plot_bgcolor='white'
+        )
+        figures['explain'] = fig_explain
+
+        # Insights (os mesmos mostrados pelo score_batch.py)
+        insights = summaries['insights']
+        figures['most_corr'] = insights['most_corr']
+        figures['most_variable'] = insights['most_variable']
+        return figures
+
+    def show_batch_results(results_df, anomaly_stats, result_hash, key_prefix=""):
+        """Mostra os resultados de um lote já processado (tabela, gráficos e exportação)."""
+        # Criar container para resultados usando toda a largura
+        st.markdown("### 📊 Resultados das Previsões")
+
+        # Tabs para diferentes visualizações dos resultados
+        result_tab1, result_tab2, result_tab3 = st.tabs([
+            "📊 Resultados", 
+            "📈 Visualizações",
+            "📥 Exportar"
+        ])
+
+        with result_tab1:
+            # Estilizar e mostrar o dataframe
+            st.dataframe(
+                results_df.style
+                .format({
+                    col: '{:.2f}'
+                    for col in ['aqi_prediction', *interval_columns(), *REQUIRED_COLUMNS]
+                    if col in results_df.columns
+                })
+                .background_gradient(
+                    subset=['aqi_prediction'],
+                    cmap='YlOrRd'
+                ),
+                use_container_width=True
+            )
+
+            not_scored = int(results_df['aqi_prediction'].isna().sum())
+            if not_scored:
+                st.warning(f"⚠️ {not_scored:,} linhas com células vazias ficaram sem previsão.")
+
+            # Resumo da detecção de anomalias
+            if anomaly_stats['anomalias'] > 0:
+                st.warning(
+                    f"🚨 {anomaly_stats['anomalias']} registros com leituras atípicas "
+                    f"(detecção em {anomaly_stats['segundos']:.2f} s, "
+                    f"{anomaly_stats['linhas_por_segundo']:,.0f} linhas/s). "
+                    "Veja as colunas 'anomalia' e 'anomalia_poluentes'."
+                )
+            else:
+                st.info(f"✅ Nenhuma anomalia detectada ({anomaly_stats['segundos']:.2f} s)")
+
+            # Adicionar estatísticas resumidas em colunas que ocupam toda a largura
+            st.markdown("#### 📊 Estatísticas Resumidas")
+            metric_cols = st.columns(4)
+
+            with metric_cols[0]:
+                st.metric(
+                    "AQI Médio",
+                    f"{results_df['aqi_prediction'].mean():.2f}",
+                    f"{results_df['aqi_prediction'].std():.2f} σ"
+                )
+
+            with metric_cols[1]:
+                st.metric(
+                    "AQI Máximo",
+                    f"{results_df['aqi_prediction'].max():.2f}",
+                    f"Linha {results_df['aqi_prediction'].idxmax() + 1}"
+                )
+
+            with metric_cols[2]:
+                st.metric(
+                    "AQI Mínimo",
+                    f"{results_df['aqi_prediction'].min():.2f}",
+                    f"Linha {results_df['aqi_prediction'].idxmin() + 1}"
+                )
+
+            with metric_cols[3]:
+                n_critical = len(results_df[results_df['aqi_prediction'] > 150])
+                st.metric(
+                    "Registros Críticos",
+                    n_critical,
+                    f"{(n_critical/len(results_df))*100:.1f}%"
+                )
+
+        with result_tab2:
+            figures = build_batch_figures(results_df, result_hash)
+
+            # Criar subseções para diferentes tipos de visualização
+            st.markdown("#### 📈 Distribuição do AQI")
+            dist_col1, dist_col2 = st.columns(2)
+
+            with dist_col1:
+                st.plotly_chart(figures['hist'], use_container_width=True)
+
+            with dist_col2:
+                st.plotly_chart(figures['box'], use_container_width=True)
+
+            # Adicionar seção de análise temporal se houver coluna de data
+            if 'time' in figures:
+                st.markdown("#### 📅 Análise Temporal")
+                st.plotly_chart(figures['time'], use_container_width=True)
+
+            # Análise de Correlação
+            st.markdown("#### 🔄 Correlação entre Variáveis")
+            st.plotly_chart(figures['corr'], use_container_width=True)
+
+            # Análise de Contribuição
+            st.markdown("#### 🎯 Contribuição dos Poluentes")
+            st.plotly_chart(figures['contrib'], use_container_width=True)
+            st.plotly_chart(figures['explain'], use_container_width=True)
+
+            # Adicionar insights baseados nos dados
+            st.markdown("#### 💡 Insights")
+            insights_col1, insights_col2 = st.columns(2)
+
+            with insights_col1:
+                most_corr, most_corr_value = figures['most_corr']
+                st.info(f"🔍 O poluente mais correlacionado com o AQI é {most_corr.upper()} " +
+                       f"(correlação: {most_corr_value:.2f})")
+
+            with insights_col2:
+                most_variable, most_variable_cv = figures['most_variable']
+                st.info(f"📊 O poluente com maior variação relativa é {most_variable.upper()} " +
+                       f"(CV: {most_variable_cv:.2f})")
+
+        with result_tab3:
+            st.write("Os arquivos são gerados apenas quando solicitados e reaproveitados enquanto o resultado não mudar.")
+            export_format = st.radio(
+                "Formato:",
+                list(EXPORT_FORMATS),
+                horizontal=True,
+                key=f"{key_prefix}export_format"
+            )
+            extension, mime = EXPORT_FORMATS[export_format]
+            requested = st.session_state.get('export_requested', set())
+            if (result_hash, export_format) not in requested:
+                if st.button(f"⚙️ Gerar arquivo {export_format}", key=f"{key_prefix}generate_export"):
+                    requested.add((result_hash, export_format))
+                    st.session_state.export_requested = requested
+                    st.rerun()
+            else:
+                with st.spinner(f"Gerando arquivo {export_format}..."):
+                    export_path = get_export(results_df, export_format, result_hash)
+                with open(export_path, 'rb') as export_file:
+                    st.download_button(
+                        label=f"📥 Download {export_format}",
+                        data=export_file,
+                        file_name=f"predictions{extension}",
+                        mime=mime,
+                        key=f"{key_prefix}download_export"
+                    )
+
+    def show_job_queue():
+        """Lista os processamentos do usuário e mostra os resultados dos concluídos."""
+        st.write("Arquivos enviados para a fila são processados em segundo plano. "
+                 "Você pode sair da página e voltar depois para baixar os resultados.")
+
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            st.button("🔄 Atualizar", key="refresh_jobs")
+        with col2:
+            auto_refresh = st.checkbox("Atualizar automaticamente", key="auto_refresh_jobs")
+
+        jobs = job_queue.list_jobs(st.session_state['username'])
+        if not jobs:
+            st.info("Nenhum arquivo na fila.")
+            return
+
+        status_labels = {'queued': '⏳ Na fila', 'running': '⚙️ Processando', 'done': '✅ Concluído', 'failed': '❌ Falhou'}
+        for job in jobs:
+            progress = job['processed_rows'] / job['total_rows'] if job['total_rows'] else 0.0
+            details = [status_labels.get(job['status'], job['status']),
+                       datetime.fromtimestamp(job['created_at']).strftime('%d/%m/%Y %H:%M')]
+            if job['total_rows']:
+                details.append(f"{job['processed_rows']}/{job['total_rows']} linhas")
+            if job['rows_per_second']:
+                details.append(f"{job['rows_per_second']:,.0f} linhas/s")
+            st.markdown(f"**{job['filename']}** — " + " · ".join(details))
+            if job['status'] in ('queued', 'running'):
+                st.progress(progress)
+            elif job['status'] == 'failed':
+                st.error(f"Erro: {job['error']}")
+
+        done_jobs = [job for job in jobs if job['status'] == 'done']
+        if done_jobs:
+            selected_job = st.selectbox(
+                "Ver resultados de:",
+                done_jobs,
+                format_func=lambda job: f"{job['filename']} ({datetime.fromtimestamp(job['created_at']).strftime('%d/%m/%Y %H:%M')})",
+                key="selected_job"
+            )
+            cached_result = result_store.get(selected_job['id'])
+            if cached_result is None:
+                st.warning("Os resultados deste processamento expiraram do cache. Envie o arquivo novamente.")
+            else:
+                results_df, metadata = cached_result
+                show_batch_results(results_df, metadata['anomaly_stats'], metadata['result_hash'], key_prefix="job_")
+
+        if auto_refresh and any(job['status'] in ('queued', 'running') for job in jobs):
+            time.sleep(2)
+            st.rerun()
+
     def show_data_analysis():
         st.write("Esta página apresenta análises e insights sobre os dados históricos de qualidade do ar.")
-        
-        # Converter data para datetime se existir
-        if 'date' in data.columns:
-            data['date'] = pd.to_datetime(data['date'])
-            
-            # Adicionar filtros de data
+
+        # Seleção de cidade: cada cidade é um bloco contíguo do histórico (fatia, sem máscara)
+        selected_city = None
+        store_cities = history_store.cities()
+        if store_cities:
+            city_option = st.selectbox(
+                "Cidade:",
+                ["Todas as cidades"] + store_cities,
+                key="analysis_city"
+            )
+            selected_city = None if city_option == "Todas as cidades" else city_option
+        first_date, last_date = history_bounds(selected_city, history_store.version())
+        if first_date is None:
+            st.info("O histórico ainda não tem leituras.")
+            return
+
+        # Adicionar filtros de data (e, opcionalmente, de horário: os dados são horários)
+        col1, col2 = st.columns(2)
+        with col1:
+            start_date = st.date_input(
+                "Data Inicial",
+                value=first_date.date(),
+                min_value=first_date.date(),
+                max_value=last_date.date()
+            )
+        with col2:
+            end_date = st.date_input(
+                "Data Final",
+                value=last_date.date(),
+                min_value=first_date.date(),
+                max_value=last_date.date()
+            )
+        start_time, end_time = datetime.min.time(), datetime.max.time()
+        if st.checkbox("Filtrar por horário", key="analysis_time_filter"):
             col1, col2 = st.columns(2)
             with col1:
-                start_date = st.date_input(
-                    "Data Inicial",
-                    value=data['date'].min().date(),
-                    min_value=data['date'].min().date(),
-                    max_value=data['date'].max().date()
-                )
+                start_time = st.time_input("Hora Inicial", value=start_time, step=3600)
             with col2:
-                end_date = st.date_input(
-                    "Data Final",
-                    value=data['date'].max().date(),
-                    min_value=data['date'].min().date(),
-                    max_value=data['date'].max().date()
-                )
-            
-            # Filtrar dados pelo período selecionado
-            mask = (data['date'].dt.date >= start_date) & (data['date'].dt.date <= end_date)
-            filtered_data = data[mask]
-        else:
-            filtered_data = data
+                end_time = st.time_input("Hora Final", value=end_time.replace(second=0, microsecond=0), step=3600)
+        period_start = datetime.combine(start_date, start_time)
+        period_end = datetime.combine(end_date, end_time)
+
+        # Lê (se ainda não estiverem no índice) só as partições da seleção
+        snapshot = history_views.current(
+            [selected_city] if selected_city is not None else None, period_start, period_end
+        )
+        history_version, city_index, rollups = snapshot.revision, snapshot.index, snapshot.rollups
+        history = city_index.data
+
+        # Linhas de uma cidade (ou de todas) no período: busca binária no índice ordenado
+        def period_rows(city):
+            return city_index.time_slice(city, period_start, period_end)
+
+        filtered_data = period_rows(selected_city)
 
         # Criar abas para diferentes tipos de análise
-        tab1, tab2, tab3, tab4 = st.tabs([
+        tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
             "📈 Tendências Temporais",
             "🔄 Correlações",
             "📊 Distribuições",
-            "📑 Estatísticas"
+            "📑 Estatísticas",
+            "🚨 Anomalias",
+            "🌍 Cidades"
         ])
         
         with tab1:
             st.subheader("Tendências Temporais dos Poluentes")
-            if 'date' in data.columns:
+            if 'date' in history.columns:
                 # Seletor de poluentes para visualização
                 pollutants = st.multiselect(
                     "Selecione os poluentes para visualizar:",
-                    options=['aqi', 'co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10'],
+                    options=HISTORY_VALUE_COLUMNS,
                     default=['aqi']
                 )
                 
+                grain_option = st.radio(
+                    "Resolução:",
+                    ['auto'] + list(GRAIN_LABELS),
+                    format_func=lambda g: "Automática" if g == 'auto' else GRAIN_LABELS[g],
+                    horizontal=True,
+                    key="trend_grain"
+                )
+
                 if pollutants:
-                    # Criar gráfico de linha para cada poluente selecionado
+                    # Séries agregadas: a resolução automática mantém no máximo ~500 pontos
+                    grain, series = rollups.query(
+                        selected_city, period_start, period_end,
+                        grain=None if grain_option == 'auto' else grain_option
+                    )
                     fig = go.Figure()
                     for pollutant in pollutants:
                         fig.add_trace(go.Scatter(
-                            x=filtered_data['date'],
-                            y=filtered_data[pollutant],
+                            x=series.index,
+                            y=series[f'{pollutant}_mean'],
                             name=pollutant.upper(),
                             mode='lines'
                         ))
                     
                     fig.update_layout(
-                        title="Variação dos Poluentes ao Longo do Tempo",
+                        title=f"Variação dos Poluentes ao Longo do Tempo (média por {GRAIN_LABELS[grain].lower()})",
                         xaxis_title="Data",
                         yaxis_title="Concentração (μg/m³)",
                         hovermode="x unified",
                         showlegend=True
                     )
                     st.plotly_chart(fig, use_container_width=True)
+                    st.caption(f"{len(series):,} pontos por série, agregados de {int(series['linhas'].sum()):,} leituras.")
                     
                     # Adicionar análise de tendência
                     st.subheader("Análise de Tendência")
@@ -976,7 +1402,7 @@ if st.session_state["authentication_status"]:
             st.subheader("🔄 Correlação entre Poluentes")
             
             # Matriz de correlação com heatmap interativo
-            corr = filtered_data[['aqi', 'co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10']].corr()
+            corr = period_correlation(snapshot, selected_city, period_start, period_end, history_version)
             
             # Criar heatmap com Plotly
             fig = go.Figure(data=go.Heatmap(
@@ -1004,18 +1430,59 @@ if st.session_state["authentication_status"]:
             st.subheader("Análise Bivariada")
             col1, col2 = st.columns(2)
             with col1:
-                x_var = st.selectbox("Variável X:", ['aqi', 'co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10'])
+                x_var = st.selectbox("Variável X:", HISTORY_VALUE_COLUMNS)
             with col2:
-                y_var = st.selectbox("Variável Y:", ['aqi', 'co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10'], index=1)
+                y_var = st.selectbox("Variável Y:", HISTORY_VALUE_COLUMNS, index=1)
             
-            fig = px.scatter(
-                filtered_data,
-                x=x_var,
-                y=y_var,
-                trendline="ols",
-                title=f"Relação entre {x_var.upper()} e {y_var.upper()}"
+            # Regressão em forma fechada a partir de Σx, Σy, Σxy, Σx², Σy²
+            sums = snapshot.period_sums(x_var, y_var, selected_city, period_start, period_end)
+            fit = ols_from_sums(sums)
+
+            if sums['n'] <= SCATTER_POINT_LIMIT:
+                fig = go.Figure(go.Scattergl(
+                    x=filtered_data[x_var],
+                    y=filtered_data[y_var],
+                    mode='markers',
+                    marker=dict(color='#02ab21', opacity=0.5),
+                    name='Leituras'
+                ))
+                x_min, x_max = filtered_data[x_var].min(), filtered_data[x_var].max()
+            else:
+                # Muitos pontos: densidade em bins calculada no servidor
+                counts, x_centers, y_centers = bivariate_density(
+                    snapshot, x_var, y_var, selected_city, period_start, period_end, history_version
+                )
+                fig = go.Figure(go.Heatmap(
+                    z=np.where(counts > 0, counts, np.nan),
+                    x=x_centers,
+                    y=y_centers,
+                    colorscale='Greens',
+                    colorbar=dict(title='Leituras'),
+                    name='Densidade'
+                ))
+                x_min, x_max = x_centers[0], x_centers[-1]
+
+            if fit is not None:
+                fig.add_trace(go.Scatter(
+                    x=[x_min, x_max],
+                    y=[fit['inclinacao'] * x_min + fit['intercepto'], fit['inclinacao'] * x_max + fit['intercepto']],
+                    mode='lines',
+                    line=dict(color='#d62728', width=2),
+                    name='Tendência (MQO)'
+                ))
+            fig.update_layout(
+                title=f"Relação entre {x_var.upper()} e {y_var.upper()}",
+                xaxis_title=x_var.upper(),
+                yaxis_title=y_var.upper()
             )
             st.plotly_chart(fig, use_container_width=True)
+
+            if fit is not None:
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Inclinação", f"{fit['inclinacao']:.4f}")
+                col2.metric("Intercepto", f"{fit['intercepto']:.2f}")
+                col3.metric("R²", f"{fit['r2']:.3f}")
+                col4.metric("Leituras", f"{fit['n']:,}")
         
         with tab3:
             st.subheader("📊 Distribuição dos Poluentes")
@@ -1023,29 +1490,21 @@ if st.session_state["authentication_status"]:
             # Seletor de poluente
             pollutant = st.selectbox(
                 "Selecione um poluente:",
-                ['aqi', 'co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10']
+                HISTORY_VALUE_COLUMNS
             )
             
             col1, col2 = st.columns(2)
             
+            hist, box = distribution_summary(snapshot, pollutant, selected_city, period_start, period_end, history_version)
+
             with col1:
                 # Histograma
-                fig = px.histogram(
-                    filtered_data,
-                    x=pollutant,
-                    nbins=30,
-                    title=f"Distribuição de {pollutant.upper()}"
-                )
-                fig.update_layout(bargap=0.1)
+                fig = summary_histogram(*hist, f"Distribuição de {pollutant.upper()}", pollutant.upper())
                 st.plotly_chart(fig, use_container_width=True)
             
             with col2:
                 # Box plot
-                fig = px.box(
-                    filtered_data,
-                    y=pollutant,
-                    title=f"Box Plot de {pollutant.upper()}"
-                )
+                fig = summary_box(box, f"Box Plot de {pollutant.upper()}", pollutant.upper())
                 st.plotly_chart(fig, use_container_width=True)
             
             # Adicionar estatísticas descritivas
@@ -1061,7 +1520,7 @@ if st.session_state["authentication_status"]:
             st.subheader("📑 Estatísticas Detalhadas")
             
             # Tabela de estatísticas com formatação
-            stats_df = filtered_data[['aqi', 'co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10']].describe()
+            stats_df = filtered_data[HISTORY_VALUE_COLUMNS].describe()
             st.dataframe(
                 stats_df.style.format("{:.2f}")
                 .background_gradient(cmap='YlOrRd', axis=1)
@@ -1073,19 +1532,165 @@ if st.session_state["authentication_status"]:
             
             with col1:
                 st.write("**Período da Análise:**")
-                if 'date' in data.columns:
+                if 'date' in history.columns:
                     st.write(f"- Início: {filtered_data['date'].min().strftime('%d/%m/%Y')}")
                     st.write(f"- Fim: {filtered_data['date'].max().strftime('%d/%m/%Y')}")
                 st.write(f"- Total de registros: {len(filtered_data)}")
             
             with col2:
-                st.write("**Qualidade dos Dados:**")
-                missing_data = filtered_data[['aqi', 'co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10']].isnull().sum()
-                for col, missing in missing_data.items():
-                    if missing > 0:
-                        st.write(f"- {col.upper()}: {missing} valores faltantes")
-                    else:
-                        st.write(f"- {col.upper()}: Dados completos")
+                st.write("**Cobertura:**")
+                st.write(f"- Cidades: {filtered_data['city'].nunique() if 'city' in filtered_data.columns else 1}")
+                if 'imputado' in filtered_data.columns:
+                    st.write(f"- Registros preenchidos: {int(filtered_data['imputado'].sum())} "
+                             f"({int(filtered_data['horario_inserido'].sum())} horários inseridos)")
+
+            st.subheader("🩺 Qualidade dos Dados")
+            show_data_profile(history_profile(selected_city, period_start, period_end, history_version))
+
+        with tab5:
+            st.subheader("🚨 Detecção de Anomalias")
+            st.write("Leituras marcadas pelo z-score robusto (mediana/MAD) em janela móvel, por cidade e poluente.")
+
+            col1, col2 = st.columns(2)
+            with col1:
+                window_hours = st.slider("Janela (horas):", 24, 24 * 30, 24 * 7, step=24)
+            with col2:
+                threshold = st.slider("Limiar do z-score:", 2.0, 10.0, 5.0, step=0.5)
+
+            flags, anomaly_stats = detect_historical_anomalies(snapshot, window_hours, threshold, history_version)
+            flagged_data = pd.concat([history, flags], axis=1).loc[filtered_data.index]
+            anomalies_df = flagged_data[flagged_data['anomalia']]
+
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Anomalias no período", len(anomalies_df),
+                        f"{len(anomalies_df) / max(len(flagged_data), 1) * 100:.1f}%")
+            col2.metric("Tempo de detecção", f"{anomaly_stats['segundos']:.2f} s")
+            col3.metric("Vazão", f"{anomaly_stats['linhas_por_segundo']:,.0f} linhas/s")
+
+            pollutant = st.selectbox(
+                "Poluente:",
+                HISTORY_VALUE_COLUMNS,
+                key="anomaly_pollutant"
+            )
+            if 'date' in flagged_data.columns:
+                fig = go.Figure()
+                fig.add_trace(go.Scatter(
+                    x=flagged_data['date'],
+                    y=flagged_data[pollutant],
+                    name=pollutant.upper(),
+                    mode='lines',
+                    line=dict(color='#02ab21')
+                ))
+                pollutant_anomalies = anomalies_df[anomalies_df['anomalia_poluentes'].str.contains(
+                    pollutant.upper(), regex=False)]
+                fig.add_trace(go.Scatter(
+                    x=pollutant_anomalies['date'],
+                    y=pollutant_anomalies[pollutant],
+                    name="Anomalia",
+                    mode='markers',
+                    marker=dict(color='#ff0000', size=6)
+                ))
+                fig.update_layout(
+                    title=f"Anomalias de {pollutant.upper()}",
+                    xaxis_title="Data",
+                    yaxis_title="Concentração (μg/m³)"
+                )
+                st.plotly_chart(fig, use_container_width=True)
+
+            st.dataframe(
+                anomalies_df.sort_values('anomalia_score', ascending=False).head(500),
+                use_container_width=True
+            )
+            st.download_button(
+                label="📥 Download Anomalias CSV",
+                data=anomalies_df.to_csv(index=False),
+                file_name="anomalias.csv",
+                mime="text/csv"
+            )
+
+        with tab6:
+            st.subheader("🌍 Comparação entre Cidades")
+            if not store_cities:
+                st.info("Os dados não possuem a coluna de cidade.")
+            else:
+                col1, col2 = st.columns([2, 1])
+                with col1:
+                    compare_cities = st.multiselect(
+                        "Cidades:",
+                        store_cities,
+                        default=store_cities,
+                        key="compare_cities"
+                    )
+                with col2:
+                    compare_pollutant = st.selectbox(
+                        "Poluente:",
+                        HISTORY_VALUE_COLUMNS,
+                        key="compare_pollutant"
+                    )
+
+                # As cidades comparadas também precisam estar no índice, no período selecionado
+                snapshot = history_views.current(compare_cities, period_start, period_end)
+                history_version, city_index, rollups = snapshot.revision, snapshot.index, snapshot.rollups
+
+                # Mapa com a média e a última leitura de cada cidade no período
+                summary = city_summary(snapshot, compare_pollutant, period_start, period_end, history_version)
+                summary = summary[summary['city'].isin(compare_cities)]
+                if 'lat' in summary.columns:
+                    fig = px.scatter_geo(
+                        summary,
+                        lat='lat',
+                        lon='lon',
+                        size=f'{compare_pollutant}_mean',
+                        color=f'{compare_pollutant}_latest',
+                        hover_name='city',
+                        hover_data={
+                            f'{compare_pollutant}_mean': ':.2f',
+                            f'{compare_pollutant}_latest': ':.2f',
+                            'lat': False,
+                            'lon': False
+                        },
+                        color_continuous_scale='YlOrRd',
+                        projection='natural earth',
+                        title=f"{compare_pollutant.upper()} por Cidade (tamanho: média, cor: última leitura)"
+                    )
+                    st.plotly_chart(fig, use_container_width=True)
+
+                if compare_cities:
+                    period_blocks = {city: period_rows(city) for city in compare_cities}
+
+                    # Evolução lado a lado, na resolução adequada ao período
+                    fig = go.Figure()
+                    grain = 'dia'
+                    if rollups is not None:
+                        for city in period_blocks:
+                            grain, series = rollups.query(city, period_start, period_end)
+                            fig.add_trace(go.Scatter(x=series.index, y=series[f'{compare_pollutant}_mean'],
+                                                     name=city, mode='lines'))
+                    fig.update_layout(
+                        title=f"Média de {compare_pollutant.upper()} por Cidade (por {GRAIN_LABELS[grain].lower()})",
+                        xaxis_title="Data",
+                        yaxis_title="Concentração (μg/m³)",
+                        hovermode="x unified"
+                    )
+                    st.plotly_chart(fig, use_container_width=True)
+
+                    # Média e máximo no período, por cidade
+                    period_stats = pd.DataFrame({
+                        'Cidade': list(period_blocks),
+                        'Média': [block[compare_pollutant].mean() for block in period_blocks.values()],
+                        'Máximo': [block[compare_pollutant].max() for block in period_blocks.values()]
+                    })
+                    fig = go.Figure([
+                        go.Bar(name='Média', x=period_stats['Cidade'], y=period_stats['Média'], marker_color='#02ab21'),
+                        go.Bar(name='Máximo', x=period_stats['Cidade'], y=period_stats['Máximo'],
+                               marker_color='rgba(2, 171, 33, 0.3)')
+                    ])
+                    fig.update_layout(
+                        title=f"{compare_pollutant.upper()} no Período Selecionado",
+                        barmode='group',
+                        yaxis_title="Concentração (μg/m³)"
+                    )
+                    st.plotly_chart(fig, use_container_width=True)
 
     def show_about():
         st.header("Sobre o Projeto 🌍")
@@ -1122,7 +1727,7 @@ if st.session_state["authentication_status"]:
             st.error("201-300: Muito Insalubre")
             st.error("301+: Perigoso")
 
-    def show_prediction_result(aqi_value):
+    def show_prediction_result(aqi_value, contributions=None, interval=None):
         st.header("🔍 Resultado da Previsão")
         
         # Definir categorias e limites de AQI
@@ -1151,7 +1756,31 @@ if st.session_state["authentication_status"]:
                 <p style='color: white; font-size: 20px; margin: 10px 0;'>{category}</p>
             </div>
             """, unsafe_allow_html=True)
+            if interval is not None:
+                coverage = round((PREDICTION_QUANTILES[-1] - PREDICTION_QUANTILES[0]) * 100)
+                st.caption(
+                    f"Intervalo de {coverage}% entre as árvores do modelo: "
+                    f"{interval[0]:.1f} – {interval[1]:.1f}"
+                )
         
+        # Contribuição de cada poluente (decomposição pelos caminhos das árvores)
+        if contributions is not None:
+            st.subheader("🧩 Contribuição dos Poluentes")
+            pollutants = [p for p in contributions if p != 'base']
+            values = [contributions[p] for p in pollutants]
+            fig = go.Figure(go.Bar(
+                x=values,
+                y=[p.upper() for p in pollutants],
+                orientation='h',
+                marker_color=['#ff7e00' if v > 0 else '#02ab21' for v in values]
+            ))
+            fig.update_layout(
+                title=f"Partindo do AQI médio de {contributions['base']:.1f}",
+                xaxis_title="Contribuição para o AQI",
+                height=300
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
         # Recomendações baseadas na categoria
         st.subheader("🏥 Recomendações de Saúde")
         
@@ -1239,7 +1868,74 @@ if st.session_state["authentication_status"]:
             }
             </style>
         """, unsafe_allow_html=True)
-        authenticator.logout("Sair", "sidebar")
+        if st.button("Sair"):
+            logout()
+            st.rerun()
+
+        # Painel de modelos (apenas administrador)
+        if st.session_state.get('username') == 'admin':
+            with st.expander("🧠 Modelos"):
+                model_stats = registry.stats()
+                if model_stats:
+                    st.dataframe(pd.DataFrame(model_stats), use_container_width=True)
+                warmup_status = warmup.status()
+                st.caption("Aquecimento: " + ", ".join(
+                    f"{step} {seconds:.2f}s" for step, seconds in warmup_status['etapas'].items()
+                ))
+                if st.button("Recarregar modelos"):
+                    registry.warm_up()
+                    st.rerun()
+                rollback_key = st.selectbox("Rollback de:", registry.cities(), key="rollback_city")
+                if rollback_key and st.button("Voltar versão anterior"):
+                    if registry.rollback(rollback_key):
+                        st.success(f"Modelo de {rollback_key} revertido")
+                    else:
+                        st.warning("Não há versão anterior para reverter")
+            with st.expander("🗄️ Histórico"):
+                partitions = history_store.partitions()
+                st.write(f"- Versão: {history_store.version()}")
+                st.write(f"- Partições: {len(partitions)} "
+                         f"({len({key for key, _, _ in partitions})} cidades)")
+                recent = history_store.appends()[-5:]
+                if recent:
+                    st.dataframe(pd.DataFrame([
+                        {'versão': entry['version'], 'linhas': entry['linhas'],
+                         'cidades': ", ".join(sorted(entry['cidades']))}
+                        for entry in reversed(recent)
+                    ]), use_container_width=True)
+                new_readings = st.file_uploader("Incluir leituras", type=['csv', 'parquet'],
+                                                key="history_upload")
+                if new_readings is not None and st.button("Incluir no histórico"):
+                    try:
+                        if new_readings.name.endswith('.parquet'):
+                            readings = pd.read_parquet(new_readings)
+                        else:
+                            readings = pd.read_csv(new_readings)
+                        version, changes = history_store.append(readings)
+                        st.success(f"Versão {version}: {len(changes)} cidade(s) atualizada(s)")
+                        st.rerun()
+                    except ValueError as e:
+                        st.error(f"Leituras inválidas: {e}")
+            with st.expander("🧮 Memória"):
+                rss = process_rss_bytes()
+                st.write(f"- Processo (RSS): {'n/d' if rss is None else f'{rss / 1024 ** 2:,.0f} MB'}")
+                session_stats = session_memory.stats()
+                if session_stats:
+                    st.dataframe(pd.DataFrame(session_stats[:10]), use_container_width=True)
+                if st.button("Liberar sessões ociosas"):
+                    session_memory.evict_idle()
+                    st.rerun()
+                # Medir os caches percorre os objetos guardados; só sob demanda
+                if st.button("Medir caches"):
+                    st.dataframe(pd.DataFrame(cache_usage(get_runtime().stats_mgr.get_stats())),
+                                 use_container_width=True)
+            with st.expander("🔐 Autenticação"):
+                auth_latencies, auth_counters = authenticator.metrics()
+                if auth_latencies:
+                    st.dataframe(pd.DataFrame(auth_latencies), use_container_width=True)
+                st.write(f"- Tokens ativos: {auth_counters['tokens_ativos']}")
+                st.write(f"- Senhas recalculadas: {auth_counters['senhas_recalculadas']}")
+                st.write(f"- Usuários cadastrados: {user_store.count()}")
 
     # Add the banner to the top of the page
     add_banner()
@@ -0,0 +1,272 @@
+"""Artefatos do app (modelo, transformer, dados e configuração) resolvidos sem rede.
+
+O manifesto ``artifacts.json`` lista cada artefato com o SHA-256 esperado e as
+origens para download. Em tempo de execução só arquivos locais são usados:
+a cópia do repositório (se não for um ponteiro do git-lfs e o hash bater) ou
+o armazenamento local endereçado por conteúdo. Downloads acontecem apenas no
+``prefetch``, executado no deploy:
+
+    python artifacts.py prefetch   # baixa em paralelo o que faltar e verifica os hashes
+    python artifacts.py verify     # confere o que está disponível localmente
+    python artifacts.py pin NOME   # grava no manifesto o hash do arquivo local atual
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+MANIFEST_PATH = 'artifacts.json'
+STORE_DIR = os.environ.get('AQI_ARTIFACTS_DIR', '.artifacts')
+DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_RETRIES = 3
+
+_LFS_POINTER_PREFIX = b'version https://git-lfs'
+
+
+class ArtifactMissing(Exception):
+    """O artefato não está disponível localmente (ou está corrompido)."""
+
+
+class UnverifiedArtifact(UserWarning):
+    """O artefato não tem ``sha256`` no manifesto: o conteúdo usado não foi verificado."""
+
+
+def file_sha256(path, block_size=1024 ** 2):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_lfs_pointer(path):
+    """True se o arquivo é só o ponteiro do git-lfs, e não o conteúdo."""
+    with open(path, 'rb') as f:
+        return f.read(len(_LFS_POINTER_PREFIX)) == _LFS_POINTER_PREFIX
+
+
+class ArtifactStore:
+    """Resolve artefatos pelo manifesto, verificando o SHA-256 uma vez por processo.
+
+    Artefatos marcados com ``"mutable": true`` (ex.: ``config.yaml``, editado em
+    cada deploy) não têm hash e são aceitos como estão. Qualquer outro artefato
+    sem ``sha256`` também é aceito, mas com um aviso ``UnverifiedArtifact`` a cada
+    processo, até que o hash seja gravado com ``pin``. O hash baixado fica
+    registrado no índice do armazenamento.
+    """
+
+    def __init__(self, manifest_path=MANIFEST_PATH, store_dir=STORE_DIR, base_dir='.'):
+        self.manifest_path = manifest_path
+        self.store_dir = store_dir
+        self.base_dir = base_dir
+        with open(manifest_path, encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self._verified = {}
+        self._warned = set()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Resolução local (usada pelo app; nunca acessa a rede)
+    # ------------------------------------------------------------------
+    def _index_path(self):
+        return os.path.join(self.store_dir, 'index.json')
+
+    def _index(self):
+        try:
+            with open(self._index_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def expected_hash(self, name):
+        if name not in self.manifest:
+            raise KeyError(f'{name} não está em {self.manifest_path}')
+        return self.manifest[name].get('sha256')
+
+    def is_unverified(self, name):
+        """True se o artefato deveria ter hash no manifesto e não tem."""
+        info = self.manifest[name]
+        return info.get('sha256') is None and not info.get('mutable', False)
+
+    def _warn_unverified(self, name):
+        with self._lock:
+            if name in self._warned:
+                return
+            self._warned.add(name)
+        warnings.warn(
+            f'Artefato "{name}" sem sha256 em {self.manifest_path}: o conteúdo usado NÃO é verificado. '
+            f'Grave o hash com "python artifacts.py pin {name}".',
+            UnverifiedArtifact, stacklevel=3
+        )
+
+    def _is_valid(self, path, expected):
+        """Confere o arquivo (com cache por tamanho, data de modificação e hash esperado)."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        key = (path, stat.st_size, stat.st_mtime_ns, expected)
+        with self._lock:
+            if key in self._verified:
+                return self._verified[key]
+        if is_lfs_pointer(path):
+            valid = False
+        elif expected is None:
+            valid = True
+        else:
+            valid = file_sha256(path) == expected
+        with self._lock:
+            self._verified[key] = valid
+        return valid
+
+    def _candidates(self, name):
+        expected = self.expected_hash(name)
+        yield os.path.join(self.base_dir, name), expected
+        stored = expected or self._index().get(name)
+        if stored:
+            yield os.path.join(self.store_dir, stored), expected
+
+    def find(self, name):
+        """Caminho local válido do artefato, ou None."""
+        for path, expected in self._candidates(name):
+            if self._is_valid(path, expected):
+                if self.is_unverified(name):
+                    self._warn_unverified(name)
+                return path
+        return None
+
+    def path(self, name):
+        """Caminho local válido do artefato; levanta ``ArtifactMissing`` se não houver."""
+        path = self.find(name)
+        if path is None:
+            raise ArtifactMissing(
+                f'Artefato "{name}" indisponível ou com hash diferente do manifesto. '
+                f'Execute "python artifacts.py prefetch" no deploy (com acesso à rede) '
+                f'ou copie o arquivo para {os.path.abspath(self.store_dir)}.'
+            )
+        return path
+
+    def status(self):
+        """Situação de cada artefato do manifesto: caminho resolvido, hash esperado e se é verificado."""
+        return [
+            {'artefato': name, 'caminho': self.find(name), 'sha256': info.get('sha256'),
+             'verificado': not self.is_unverified(name)}
+            for name, info in self.manifest.items()
+        ]
+
+    # ------------------------------------------------------------------
+    # Download (apenas no deploy)
+    # ------------------------------------------------------------------
+    def _download(self, url, destination, timeout):
+        if 'drive.google.com' in url:
+            import gdown
+            if gdown.download(url, destination, quiet=True) is None:
+                raise OSError(f'falha no download de {url}')
+            return
+        import requests
+        with requests.get(url, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            with open(destination, 'wb') as f:
+                for block in response.iter_content(chunk_size=1024 ** 2):
+                    f.write(block)
+
+    def fetch(self, name, timeout=DOWNLOAD_TIMEOUT, retries=DOWNLOAD_RETRIES):
+        """Garante o artefato localmente, baixando-o das origens do manifesto se preciso."""
+        path = self.find(name)
+        if path is not None:
+            return path
+        expected = self.expected_hash(name)
+        os.makedirs(self.store_dir, exist_ok=True)
+        errors = []
+        for url in self.manifest[name].get('sources', []):
+            for attempt in range(retries):
+                fd, tmp_path = tempfile.mkstemp(prefix='.partial-', dir=self.store_dir)
+                os.close(fd)
+                try:
+                    self._download(url, tmp_path, timeout)
+                    digest = file_sha256(tmp_path)
+                    if expected is not None and digest != expected:
+                        raise OSError(f'hash {digest[:12]}… diferente do manifesto')
+                    final_path = os.path.join(self.store_dir, digest)
+                    os.replace(tmp_path, final_path)
+                    self._record(name, digest)
+                    return final_path
+                except Exception as e:
+                    errors.append(f'{url} (tentativa {attempt + 1}): {e}')
+                    time.sleep(min(2 ** attempt, 10))
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+        raise ArtifactMissing(f'Não foi possível obter "{name}": ' + '; '.join(errors or ['sem origens']))
+
+    def _record(self, name, digest):
+        with self._lock:
+            index = self._index()
+            index[name] = digest
+            fd, tmp_path = tempfile.mkstemp(prefix='.partial-', dir=self.store_dir)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(index, f, indent=2)
+            os.replace(tmp_path, self._index_path())
+
+    def prefetch(self, names=None, workers=4, timeout=DOWNLOAD_TIMEOUT):
+        """Baixa em paralelo os artefatos que faltam. Retorna ``{nome: caminho ou erro}``."""
+        names = list(self.manifest) if names is None else names
+
+        def fetch_one(name):
+            try:
+                return name, self.fetch(name, timeout=timeout)
+            except ArtifactMissing as e:
+                return name, e
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(executor.map(fetch_one, names))
+
+    def pin(self, name):
+        """Grava no manifesto o hash do arquivo local atual do artefato."""
+        path = os.path.join(self.base_dir, name)
+        if is_lfs_pointer(path):
+            raise ArtifactMissing(f'{path} é um ponteiro do git-lfs; execute "git lfs pull" antes')
+        self.manifest.setdefault(name, {})['sha256'] = file_sha256(path)
+        self.manifest[name]['size'] = os.path.getsize(path)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2)
+            f.write('\n')
+        return self.manifest[name]['sha256']
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else 'verify'
+    store = ArtifactStore()
+    if command == 'prefetch':
+        failed = False
+        for name, result in store.prefetch(argv[1:] or None).items():
+            failed |= isinstance(result, Exception)
+            print(f"{'ERRO' if isinstance(result, Exception) else 'OK'}  {name}: {result}")
+        return 1 if failed else 0
+    if command == 'verify':
+        rows = store.status()
+        for row in rows:
+            state = 'OK' if row['caminho'] else 'FALTA'
+            if row['caminho'] and not row['verificado']:
+                state = 'SEM HASH'
+            print(f"{state}  {row['artefato']}: {row['caminho'] or '-'}")
+        unverified = [row['artefato'] for row in rows if not row['verificado']]
+        if unverified:
+            print(f"Aviso: sem sha256 no manifesto ({', '.join(unverified)}); "
+                  f"grave com \"python artifacts.py pin <nome>\".", file=sys.stderr)
+        return 0 if all(row['caminho'] for row in rows) else 1
+    if command == 'pin' and len(argv) == 2:
+        print(f'{argv[1]}: {store.pin(argv[1])}')
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
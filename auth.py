@@ -0,0 +1,161 @@
+"""Autenticação com verificação bcrypt fora da thread da sessão e tokens de sessão persistidos."""
+import hashlib
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+import numpy as np
+
+from user_store import hash_password
+
+
+class AuthBusy(Exception):
+    """Há verificações de senha demais em andamento."""
+
+
+def hash_rounds(password_hash):
+    """Custo (log2 das rodadas) de um hash ``$2b$NN$...``."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class SessionTokens:
+    """Tokens de sessão com expiração (TTL), gravados no banco de usuários.
+
+    Só o SHA-256 do token é gravado. Como o banco é compartilhado, um token vale
+    em qualquer processo do servidor e continua válido após reinícios e deploys,
+    enquanto o cookie não expira.
+    """
+
+    def __init__(self, user_store, ttl_seconds):
+        self.user_store = user_store
+        self.ttl_seconds = ttl_seconds
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def issue(self, username):
+        token = secrets.token_urlsafe(32)
+        self.user_store.add_session(self._digest(token), username, time.time() + self.ttl_seconds)
+        return token
+
+    def validate(self, token):
+        """Retorna ``(username, user)`` do dono do token, ou ``(None, None)`` se não existir ou tiver expirado."""
+        if not token:
+            return None, None
+        return self.user_store.session_user(self._digest(token))
+
+    def revoke(self, token):
+        if token:
+            self.user_store.delete_session(self._digest(token))
+
+    def __len__(self):
+        return self.user_store.count_sessions()
+
+
+class Authenticator:
+    """Login verificado num pool limitado de threads.
+
+    - no máximo ``workers`` hashes são verificados ao mesmo tempo e no máximo
+      ``max_pending`` aguardam; acima disso ``AuthBusy`` é levantada;
+    - após um login correto com hash de custo diferente de ``rounds``, a
+      senha é recalculada com o custo configurado e gravada no banco (uma vez
+      por usuário; com o pool cheio, fica para o próximo login);
+    - sessões autenticadas recebem um token, validado sem bcrypt (ver ``SessionTokens``).
+    """
+
+    def __init__(self, user_store, rounds=12, token_ttl_seconds=30 * 86400,
+                 workers=2, max_pending=32, latency_window=1000):
+        self.user_store = user_store
+        self.rounds = rounds
+        self.tokens = SessionTokens(user_store, token_ttl_seconds)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='auth')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._latencies = {'verificacao': deque(maxlen=latency_window), 'token': deque(maxlen=latency_window)}
+        self._rehashed = 0
+        self._rehashing = set()
+        self._rehash_lock = threading.Lock()
+        # Hash usado quando o usuário não existe, para que o tempo de resposta não revele isso
+        self._dummy_hash = hash_password(secrets.token_hex(8), rounds)
+
+    def _submit(self, fn, *args, wait=1.0):
+        if not self._slots.acquire(timeout=wait):
+            raise AuthBusy()
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _record(self, kind, start):
+        self._latencies[kind].append((time.perf_counter() - start) * 1000)
+
+    def login(self, username, password):
+        """Verifica usuário e senha. Retorna ``(user, token)`` ou ``(None, None)``."""
+        start = time.perf_counter()
+        user = self.user_store.get(username) if username else None
+        stored_hash = user['password'] if user else self._dummy_hash
+        future = self._submit(bcrypt.checkpw, password.encode('utf-8'), stored_hash.encode('utf-8'))
+        try:
+            valid = future.result()
+        except ValueError:
+            # Hash gravado malformado ("Invalid salt"): login recusado
+            valid = False
+        self._record('verificacao', start)
+        if not (valid and user):
+            return None, None
+
+        if hash_rounds(stored_hash) != self.rounds:
+            # O novo hash é calculado em segundo plano; o login não espera por ele
+            self._schedule_rehash(username.lower(), password)
+        return user, self.tokens.issue(username.lower())
+
+    def _schedule_rehash(self, username, password):
+        with self._rehash_lock:
+            if username in self._rehashing:
+                return
+            self._rehashing.add(username)
+        try:
+            self._submit(self._rehash, username, password, wait=0)
+        except AuthBusy:
+            with self._rehash_lock:
+                self._rehashing.discard(username)
+
+    def _rehash(self, username, password):
+        try:
+            # Outro login pode ter recalculado o hash desde a verificação
+            user = self.user_store.get(username)
+            if user is None or hash_rounds(user['password']) == self.rounds:
+                return
+            self.user_store.update_password(username, hash_password(password, self.rounds))
+            self._rehashed += 1
+        finally:
+            with self._rehash_lock:
+                self._rehashing.discard(username)
+
+    def resume(self, token):
+        """Restaura a sessão a partir de um token emitido antes (sem bcrypt)."""
+        start = time.perf_counter()
+        username, user = self.tokens.validate(token)
+        self._record('token', start)
+        if user is None:
+            return None, None
+        return username, user
+
+    def logout(self, token):
+        self.tokens.revoke(token)
+
+    def metrics(self):
+        """Percentis de latência (ms) por tipo de autenticação."""
+        rows = []
+        for kind, values in self._latencies.items():
+            if not values:
+                continue
+            p50, p95, p99 = np.percentile(np.fromiter(values, dtype=float), [50, 95, 99])
+            rows.append({'tipo': kind, 'amostras': len(values), 'p50_ms': round(float(p50), 1),
+                         'p95_ms': round(float(p95), 1), 'p99_ms': round(float(p99), 1)})
+        return rows, {'tokens_ativos': len(self.tokens), 'senhas_recalculadas': self._rehashed}
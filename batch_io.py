@@ -0,0 +1,159 @@
+"""Leitura dos arquivos de previsão em lote (CSV, CSV comprimido, Parquet e Excel)."""
+import os
+
+import numpy as np
+import pandas as pd
+
+from pipeline import REQUIRED_COLUMNS
+
+# Colunas opcionais aproveitadas quando presentes no arquivo
+OPTIONAL_COLUMNS = ['date', 'city']
+UPLOAD_EXTENSIONS = ['csv', 'gz', 'zst', 'parquet', 'xlsx']
+CSV_CHUNK_ROWS = 200_000
+
+_COMPRESSION = {'.gz': 'gzip', '.zst': 'zstd'}
+
+
+def detect_format(filename):
+    """Identifica o formato e a compressão pelo nome do arquivo."""
+    name = filename.lower()
+    ext = os.path.splitext(name)[1]
+    if ext in _COMPRESSION:
+        return 'csv', _COMPRESSION[ext]
+    if ext == '.parquet':
+        return 'parquet', None
+    if ext == '.xlsx':
+        return 'xlsx', None
+    return 'csv', None
+
+
+def _rewind(file):
+    if hasattr(file, 'seek'):
+        file.seek(0)
+
+
+def read_header(file, filename):
+    """Lê apenas os nomes das colunas, sem carregar os dados."""
+    fmt, compression = detect_format(filename)
+    _rewind(file)
+    try:
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            return list(pq.ParquetFile(file).schema_arrow.names)
+        if fmt == 'xlsx':
+            from openpyxl import load_workbook
+            workbook = load_workbook(file, read_only=True)
+            try:
+                first_row = next(workbook.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+            finally:
+                workbook.close()
+            return [str(col) for col in first_row if col is not None]
+        return list(pd.read_csv(file, nrows=0, compression=compression).columns)
+    finally:
+        _rewind(file)
+
+
+def check_schema(columns):
+    """Retorna as colunas obrigatórias ausentes no cabeçalho."""
+    return [col for col in REQUIRED_COLUMNS if col not in columns]
+
+
+def read_batch(file, filename, columns=None):
+    """Carrega o arquivo inteiro (só as colunas usadas pelo pipeline), com poluentes em float32.
+
+    CSV (comprimido ou não) é lido em blocos só para limitar o pico do parser;
+    o resultado é um único DataFrame. Parquet lê só as colunas pedidas. Se algum
+    valor não for numérico a leitura tipada falha e as colunas são lidas como
+    texto, para que a validação aponte as linhas. Para não manter o arquivo
+    inteiro em memória, use ``iter_batch``.
+    """
+    columns = read_header(file, filename) if columns is None else columns
+    usecols = [col for col in REQUIRED_COLUMNS + OPTIONAL_COLUMNS if col in columns]
+    dtypes = {col: np.float32 for col in REQUIRED_COLUMNS}
+    fmt, compression = detect_format(filename)
+
+    _rewind(file)
+    if fmt == 'parquet':
+        df = pd.read_parquet(file, columns=usecols)
+        numeric = [col for col in REQUIRED_COLUMNS if pd.api.types.is_numeric_dtype(df[col])]
+        return df.astype({col: np.float32 for col in numeric})
+
+    try:
+        if fmt == 'xlsx':
+            return pd.read_excel(file, usecols=usecols, dtype=dtypes, engine='openpyxl')
+        chunks = pd.read_csv(file, usecols=usecols, dtype=dtypes, compression=compression,
+                             chunksize=CSV_CHUNK_ROWS)
+        return pd.concat(chunks, ignore_index=True)
+    except (ValueError, TypeError):
+        _rewind(file)
+        if fmt == 'xlsx':
+            return pd.read_excel(file, usecols=usecols, engine='openpyxl')
+        return pd.read_csv(file, usecols=usecols, compression=compression)
+
+
+def _excel_chunks(file, usecols, chunk_rows):
+    from openpyxl import load_workbook
+    workbook = load_workbook(file, read_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(col) if col is not None else None for col in next(rows, ())]
+        positions = [header.index(col) for col in usecols]
+        buffer = []
+        for row in rows:
+            values = [row[p] if p < len(row) else None for p in positions]
+            if any(v is not None for v in values):
+                buffer.append(values)
+            if len(buffer) == chunk_rows:
+                yield pd.DataFrame(buffer, columns=usecols)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=usecols)
+    finally:
+        workbook.close()
+
+
+def iter_batch(file, filename, columns=None, chunk_rows=CSV_CHUNK_ROWS):
+    """Blocos de até ``chunk_rows`` linhas com as colunas usadas, sem carregar o arquivo inteiro.
+
+    Os valores vêm como estão no arquivo (sem tipagem forçada); cada bloco passa
+    por ``invalid_rows`` e ``as_float32``. O índice segue a numeração das linhas
+    do arquivo e sempre há ao menos um bloco (vazio, se o arquivo não tiver linhas).
+    """
+    columns = read_header(file, filename) if columns is None else columns
+    usecols = [col for col in REQUIRED_COLUMNS + OPTIONAL_COLUMNS if col in columns]
+    fmt, compression = detect_format(filename)
+
+    _rewind(file)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        chunks = (batch.to_pandas() for batch in
+                  pq.ParquetFile(file).iter_batches(batch_size=chunk_rows, columns=usecols))
+    elif fmt == 'xlsx':
+        chunks = _excel_chunks(file, usecols, chunk_rows)
+    else:
+        chunks = pd.read_csv(file, usecols=usecols, compression=compression, chunksize=chunk_rows)
+
+    start = 0
+    for chunk in chunks:
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        yield chunk
+    if start == 0:
+        yield pd.DataFrame(columns=usecols)
+
+
+def as_float32(df):
+    """Converte as colunas de poluentes para float32 (valores inválidos viram NaN)."""
+    for col in REQUIRED_COLUMNS:
+        if df[col].dtype != np.float32:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float32)
+    return df
+
+
+def invalid_rows(df):
+    """Números (base 1) das linhas com valores não numéricos ou negativos."""
+    raw = df[REQUIRED_COLUMNS]
+    numeric = raw.apply(pd.to_numeric, errors='coerce')
+    not_numeric = numeric.isna() & raw.notna()
+    negative = numeric < 0
+    return (np.flatnonzero((not_numeric | negative).any(axis=1).to_numpy()) + 1).tolist()
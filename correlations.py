@@ -0,0 +1,153 @@
+"""Correlação e covariância a partir de co-momentos acumulados (Welford/Chan).
+
+``CoMoments`` guarda, para cada par de colunas, a quantidade de linhas em
+que as duas têm valor, as médias, as somas dos quadrados dos desvios e o
+co-momento. Acumuladores de blocos diferentes se combinam sem reler as
+linhas, com o mesmo resultado de ``DataFrame.corr()``/``cov()`` (pares
+completos, NaN ignorados par a par).
+
+``CorrelationIndex`` mantém os acumuladores de blocos fixos de linhas do
+histórico: um intervalo qualquer combina os blocos inteiros e lê apenas as
+linhas das pontas.
+"""
+import numpy as np
+import pandas as pd
+
+BLOCK_ROWS = 256
+
+
+def _block_moments(values):
+    """Co-momentos de cada bloco de ``values`` (blocos × linhas × colunas), numa passada vetorizada."""
+    valid = ~np.isnan(values)
+    weights = valid.astype(np.float64)
+    counts = weights.sum(axis=1)
+    # Desvios em relação à média de cada coluna no bloco, para não perder precisão
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shift = np.where(counts > 0, np.where(valid, values, 0.0).sum(axis=1) / counts, 0.0)
+    centered = np.where(valid, values - shift[:, None, :], 0.0)
+    n = np.einsum('bri,brj->bij', weights, weights)
+    sums = np.einsum('bri,brj->bij', centered, weights)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        relative = np.where(n > 0, sums / n, 0.0)
+    mean = shift[:, :, None] + relative
+    m2 = np.einsum('bri,brj->bij', centered ** 2, weights) - sums * relative
+    cm = np.einsum('bri,brj->bij', centered, centered) - sums * relative.transpose(0, 2, 1)
+    return n, mean, m2, cm
+
+
+def _combine(n, mean, m2, cm):
+    """Combina acumuladores empilhados (blocos × colunas × colunas) num só."""
+    total = n.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        combined_mean = np.where(total > 0, (n * mean).sum(axis=0) / total, 0.0)
+    delta = np.where(n > 0, mean - combined_mean, 0.0)
+    combined_m2 = m2.sum(axis=0) + (n * delta ** 2).sum(axis=0)
+    combined_cm = cm.sum(axis=0) + (n * delta * delta.transpose(0, 2, 1)).sum(axis=0)
+    return total, combined_mean, combined_m2, combined_cm
+
+
+class CoMoments:
+    """Acumulador de co-momentos de ``columns``; ``merge`` junta dois blocos sem reler as linhas."""
+
+    def __init__(self, columns, n, mean, m2, cm):
+        self.columns = list(columns)
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+        self.cm = cm
+
+    @classmethod
+    def empty(cls, columns):
+        k = len(columns)
+        return cls(columns, *(np.zeros((k, k)) for _ in range(4)))
+
+    @classmethod
+    def from_array(cls, columns, values):
+        values = np.asarray(values, dtype=np.float64).reshape(1, -1, len(columns))
+        return cls(columns, *(part[0] for part in _block_moments(values)))
+
+    @classmethod
+    def from_frame(cls, df, columns):
+        return cls.from_array(columns, df[columns].to_numpy(dtype=np.float64))
+
+    @classmethod
+    def combine(cls, parts):
+        parts = list(parts)
+        stacked = [np.stack([getattr(p, name) for p in parts]) for name in ('n', 'mean', 'm2', 'cm')]
+        return cls(parts[0].columns, *_combine(*stacked))
+
+    def merge(self, other):
+        return CoMoments.combine([self, other])
+
+    def update(self, values):
+        """Acumulador com as linhas novas (matriz na ordem de ``columns``) incluídas."""
+        return self.merge(CoMoments.from_array(self.columns, values))
+
+    @property
+    def rows(self):
+        return int(self.n.diagonal().max()) if len(self.columns) else 0
+
+    def covariance(self):
+        """Covariância amostral par a par (como ``DataFrame.cov()``)."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cov = np.where(self.n > 1, self.cm / (self.n - 1), np.nan)
+        return pd.DataFrame(cov, index=self.columns, columns=self.columns)
+
+    def correlation(self):
+        """Correlação de Pearson par a par (como ``DataFrame.corr()``)."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            denominator = np.sqrt(self.m2 * self.m2.T)
+            corr = np.where((self.n > 1) & (denominator > 0), self.cm / denominator, np.nan)
+        return pd.DataFrame(np.clip(corr, -1.0, 1.0), index=self.columns, columns=self.columns)
+
+    def means(self):
+        return pd.Series(self.mean.diagonal(), index=self.columns)
+
+    def std(self):
+        """Desvio padrão amostral de cada coluna."""
+        n = self.n.diagonal()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.where(n > 1, np.sqrt(self.m2.diagonal() / (n - 1)), np.nan)
+        return pd.Series(std, index=self.columns)
+
+    def most_correlated(self, target):
+        """Coluna (exceto ``target``) de maior |correlação| com ``target``: ``(coluna, r)``."""
+        corr = self.correlation()[target].drop(target)
+        if corr.isna().all():
+            return None, float('nan')
+        column = corr.abs().idxmax()
+        return column, float(corr[column])
+
+
+class CorrelationIndex:
+    """Co-momentos de blocos de ``block_rows`` linhas; intervalos de linhas em O(blocos) sem reler os dados."""
+
+    def __init__(self, columns, values, block_rows=BLOCK_ROWS):
+        self.columns = list(columns)
+        self.block_rows = block_rows
+        self.values = np.asarray(values, dtype=np.float64)
+        full = len(self.values) // block_rows
+        blocks = self.values[:full * block_rows].reshape(full, block_rows, len(self.columns))
+        self._blocks = _block_moments(blocks)
+
+    @classmethod
+    def from_frame(cls, df, columns, block_rows=BLOCK_ROWS):
+        return cls(columns, df[columns].to_numpy(dtype=np.float64), block_rows)
+
+    def query(self, ranges):
+        """Co-momentos das linhas nos intervalos ``(start, stop)``."""
+        parts = []
+        for start, stop in ranges:
+            first = -(-start // self.block_rows)
+            last = min(stop // self.block_rows, len(self._blocks[0]))
+            if first >= last:
+                parts.append(_block_moments(self.values[None, start:stop]))
+                continue
+            parts.append(tuple(part[first:last] for part in self._blocks))
+            for edge_start, edge_stop in ((start, first * self.block_rows), (last * self.block_rows, stop)):
+                if edge_stop > edge_start:
+                    parts.append(_block_moments(self.values[None, edge_start:edge_stop]))
+        if not parts:
+            return CoMoments.empty(self.columns)
+        stacked = [np.concatenate([part[i] for part in parts]) for i in range(4)]
+        return CoMoments(self.columns, *_combine(*stacked))
@@ -0,0 +1,196 @@
+"""Índice cidade → intervalo de linhas sobre o histórico ordenado por cidade."""
+import time
+
+import numpy as np
+import pandas as pd
+
+# Coordenadas aproximadas das estações, usadas no mapa de comparação
+CITY_COORDINATES = {
+    'Brasilia': (-15.7939, -47.8828),
+    'Cairo': (30.0444, 31.2357),
+    'Dubai': (25.2048, 55.2708),
+    'London': (51.5074, -0.1278),
+    'New York': (40.7128, -74.0060),
+    'Sydney': (-33.8688, 151.2093),
+}
+
+
+class CityIndex:
+    """Mantém o histórico ordenado por (cidade, data) e o intervalo de linhas de cada cidade.
+
+    Selecionar uma cidade é um ``iloc[start:stop]`` sobre blocos contíguos,
+    que o pandas devolve como view, sem máscara booleana sobre o DataFrame
+    inteiro. Dentro de cada bloco as datas são crescentes, então um período
+    vira duas buscas binárias (``searchsorted``) sobre os instantes em ns.
+    """
+
+    def __init__(self, data, city_column='city', date_column='date', assume_sorted=False):
+        self.city_column = city_column
+        self.date_column = date_column
+        sort_columns = [c for c in (city_column, date_column) if c in data.columns]
+        keys = data[sort_columns]
+        # O CSV já vem ordenado; só reordena (uma vez) se não vier. ``assume_sorted`` pula a
+        # verificação quando os blocos já chegam ordenados (ver ``replace``)
+        if city_column in data.columns and not assume_sorted and not _is_sorted(keys):
+            data = data.sort_values(sort_columns, kind='stable')
+        self.data = data.reset_index(drop=True)
+
+        self.ranges = {}
+        if city_column in self.data.columns:
+            cities = self.data[city_column].to_numpy()
+            boundaries = np.flatnonzero(cities[1:] != cities[:-1]) + 1
+            starts = np.concatenate(([0], boundaries))
+            stops = np.concatenate((boundaries, [len(cities)]))
+            self.ranges = {cities[start]: (int(start), int(stop)) for start, stop in zip(starts, stops)}
+
+        # Instantes em ns (UTC) para as buscas binárias por período
+        self.tz = None
+        self._times = None
+        if date_column in self.data.columns:
+            dates = self.data[date_column]
+            if dates.dt.tz is not None:
+                self.tz = dates.dt.tz
+                dates = dates.dt.tz_convert('UTC').dt.tz_localize(None)
+            self._times = dates.to_numpy(dtype='datetime64[ns]').view('i8')
+
+    @property
+    def cities(self):
+        return list(self.ranges)
+
+    def rows(self, city=None):
+        """Linhas de uma cidade (view), ou o histórico inteiro se ``city`` for None."""
+        if city is None:
+            return self.data
+        start, stop = self.ranges.get(city, (0, 0))
+        return self.data.iloc[start:stop]
+
+    def _bound(self, value):
+        """Converte uma data/hora em ns UTC, no fuso do histórico se vier sem fuso."""
+        ts = pd.Timestamp(value)
+        if ts.tzinfo is None and self.tz is not None:
+            ts = ts.tz_localize(self.tz)
+        if ts.tzinfo is not None:
+            ts = ts.tz_convert('UTC').tz_localize(None)
+        return ts.value
+
+    def _blocks(self, city):
+        if city is not None:
+            return [self.ranges[city]] if city in self.ranges else []
+        return list(self.ranges.values()) or [(0, len(self.data))]
+
+    def time_range(self, city=None, start=None, end=None):
+        """Intervalos ``(start, stop)`` de linhas com ``start <= data <= end``, um por cidade."""
+        if self._times is None:
+            return self._blocks(city)
+        low = self._bound(start) if start is not None else None
+        high = self._bound(end) if end is not None else None
+        ranges = []
+        for block_start, block_stop in self._blocks(city):
+            times = self._times[block_start:block_stop]
+            first = block_start + (int(np.searchsorted(times, low, side='left')) if low is not None else 0)
+            last = block_start + (int(np.searchsorted(times, high, side='right')) if high is not None else len(times))
+            if last > first:
+                ranges.append((first, last))
+        return ranges
+
+    def city_ranges(self, city=None, start=None, end=None):
+        """Como ``time_range``, mas ``{cidade: (start, stop)}`` relativos ao bloco de cada cidade."""
+        result = {}
+        for name in ([city] if city is not None else (self.cities or [None])):
+            offset = self.ranges.get(name, (0, 0))[0] if name is not None else 0
+            for first, last in self.time_range(name, start, end):
+                result[name] = (first - offset, last - offset)
+        return result
+
+    def replace(self, frames):
+        """Novo índice com ``frames`` ({cidade: linhas ordenadas por data}) no lugar dessas cidades.
+
+        Os blocos das demais cidades são reaproveitados como estão, sem reler nem
+        reordenar; os blocos ficam em ordem alfabética de cidade, como no histórico.
+        """
+        blocks = {city: self.data.iloc[start:stop] for city, (start, stop) in self.ranges.items()}
+        blocks.update(frames)
+        return CityIndex(pd.concat([blocks[city] for city in sorted(blocks)], ignore_index=True), self.city_column, self.date_column,
+                         assume_sorted=True)
+
+    def time_slice(self, city=None, start=None, end=None):
+        """Linhas no período ``[start, end]`` (aceita horários, não só datas).
+
+        Para uma cidade devolve uma view; para todas, concatena as fatias de
+        cada cidade.
+        """
+        ranges = self.time_range(city, start, end)
+        if len(ranges) == 1:
+            return self.data.iloc[ranges[0][0]:ranges[0][1]]
+        if not ranges:
+            return self.data.iloc[0:0]
+        return pd.concat([self.data.iloc[first:last] for first, last in ranges])
+
+    def summary(self, columns, start=None, end=None):
+        """Média, máximo e última leitura de cada cidade no período, uma linha por cidade."""
+        rows = []
+        for city in self.cities:
+            block = self.time_slice(city, start, end)
+            if block.empty:
+                continue
+            row = {'city': city}
+            for col in columns:
+                values = block[col].to_numpy()
+                row[f'{col}_mean'] = float(np.nanmean(values))
+                row[f'{col}_max'] = float(np.nanmax(values))
+                row[f'{col}_latest'] = float(values[-1])
+            if city in CITY_COORDINATES:
+                row['lat'], row['lon'] = CITY_COORDINATES[city]
+            rows.append(row)
+        return pd.DataFrame(rows) if rows else pd.DataFrame(columns=['city'])
+
+
+def _is_sorted(keys):
+    if len(keys) < 2:
+        return True
+    city = keys.iloc[:, 0].to_numpy()
+    # Cada cidade precisa formar um único bloco contíguo...
+    changes = np.flatnonzero(city[1:] != city[:-1]) + 1
+    if len(pd.unique(city[np.concatenate(([0], changes))])) != len(changes) + 1:
+        return False
+    if keys.shape[1] < 2:
+        return True
+    # ...e, dentro de cada bloco, as datas precisam ser crescentes
+    dates = keys.iloc[:, 1].to_numpy()
+    decreasing = np.flatnonzero(dates[1:] < dates[:-1]) + 1
+    return np.isin(decreasing, changes).all()
+
+
+def benchmark_time_filter(index, start, end, city=None, repeat=20):
+    """Compara a máscara com ``.dt.date`` (usada antes) com a busca binária, em ms por filtro."""
+    start_date, end_date = pd.Timestamp(start).date(), pd.Timestamp(end).date()
+    rows = index.rows(city)
+
+    began = time.perf_counter()
+    for _ in range(repeat):
+        mask_result = rows[(rows[index.date_column].dt.date >= start_date) & (rows[index.date_column].dt.date <= end_date)]
+    mask_ms = (time.perf_counter() - began) * 1000 / repeat
+
+    end_of_day = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')
+    began = time.perf_counter()
+    for _ in range(repeat):
+        index.time_range(city, pd.Timestamp(start_date), end_of_day)
+    search_ms = (time.perf_counter() - began) * 1000 / repeat
+    slice_result = index.time_slice(city, pd.Timestamp(start_date), end_of_day)
+
+    return {
+        'linhas': len(rows),
+        'linhas_no_periodo': len(slice_result),
+        'mesmo_resultado': mask_result.index.equals(slice_result.index),
+        'mascara_ms': round(mask_ms, 3),
+        'busca_binaria_ms': round(search_ms, 3),
+    }
+
+
+if __name__ == '__main__':
+    history = pd.read_csv('airquality.csv')
+    history.columns = history.columns.str.lower()
+    history['date'] = pd.to_datetime(history['date'])
+    index = CityIndex(history)
+    print(benchmark_time_filter(index, '2023-03-01', '2023-06-30'))
+    print(benchmark_time_filter(index, '2023-03-01', '2023-06-30', city=index.cities[0]))
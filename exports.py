@@ -0,0 +1,159 @@
+"""Exportação dos resultados em lote, gerada sob demanda e gravada em disco em blocos."""
+import hashlib
+import os
+import tempfile
+from contextlib import contextmanager
+
+import pandas as pd
+
+EXPORT_FORMATS = {
+    'CSV': ('.csv', 'text/csv'),
+    'Excel': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'Parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+EXPORT_DIR = os.path.join(tempfile.gettempdir(), 'aqi_exports')
+EXPORT_CHUNK_ROWS = 50_000
+# Quantidade máxima de arquivos exportados mantidos em disco
+MAX_EXPORT_FILES = 50
+
+
+def frame_hash(df):
+    """Hash do conteúdo de um DataFrame (valores, índice e nomes das colunas)."""
+    digest = hashlib.sha256()
+    digest.update(','.join(map(str, df.columns)).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()[:32]
+
+
+def _chunks(df, chunk_rows):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+class _CsvWriter:
+    def __init__(self, path):
+        self._file = open(path, 'w', newline='', encoding='utf-8')
+        self._header = True
+
+    def write(self, chunk):
+        chunk.to_csv(self._file, header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        self._file.close()
+
+
+class _ExcelWriter:
+    def __init__(self, path, sheet_name='Predictions'):
+        import xlsxwriter
+
+        # constant_memory grava cada linha no disco assim que a próxima começa
+        self._workbook = xlsxwriter.Workbook(path, {
+            'constant_memory': True,
+            'nan_inf_to_errors': True,
+            'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+            # O Excel não guarda fuso: datas com fuso (ex.: de Parquet) são gravadas no horário local delas
+            'remove_timezone': True,
+        })
+        self._worksheet = self._workbook.add_worksheet(sheet_name)
+        self._row = 0
+
+    def write(self, chunk):
+        if self._row == 0:
+            # Ajustar largura das colunas
+            self._worksheet.set_column(0, max(len(chunk.columns) - 1, 0), 15)
+            self._worksheet.write_row(0, 0, [str(col) for col in chunk.columns])
+            self._row = 1
+        for values in chunk.itertuples(index=False, name=None):
+            # pd.isna cobre NaN, NaT e pd.NA (tipos anuláveis)
+            self._worksheet.write_row(self._row, 0, [None if pd.isna(v) else v for v in values])
+            self._row += 1
+
+    def close(self):
+        self._workbook.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path):
+        self.path = path
+        self._schema = None
+        self._writer = None
+
+    def write(self, chunk):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # O esquema vem do primeiro bloco; os seguintes são convertidos para ele
+        if self._writer is None:
+            self._schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+            self._writer = pq.ParquetWriter(self.path, self._schema)
+        self._writer.write_table(pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+_WRITERS = {'CSV': _CsvWriter, 'Excel': _ExcelWriter, 'Parquet': _ParquetWriter}
+
+
+def _evict_old_exports(directory, keep):
+    files = [os.path.join(directory, f) for f in os.listdir(directory)]
+    files = sorted((f for f in files if os.path.isfile(f)), key=os.path.getmtime, reverse=True)
+    for path in files[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def frame_writer(path, fmt):
+    """Grava blocos sucessivos em ``path``: ``with frame_writer(path, fmt) as write: write(chunk)``.
+
+    Só o bloco atual fica em memória. O arquivo é gravado num temporário e
+    renomeado ao final, então nunca fica parcial (nem se houver erro no meio).
+    """
+    extension = EXPORT_FORMATS[fmt][0]
+    fd, tmp_path = tempfile.mkstemp(suffix=extension, dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    writer = None
+    try:
+        writer = _WRITERS[fmt](tmp_path)
+        yield writer.write
+        writer.close()
+        writer = None
+        os.replace(tmp_path, path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_frame(df, path, fmt, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Grava ``df`` em ``path`` no formato pedido, em blocos."""
+    with frame_writer(path, fmt) as write:
+        for chunk in _chunks(df, chunk_rows):
+            write(chunk)
+        if len(df) == 0:
+            write(df)
+
+
+def get_export(df, fmt, result_hash=None, directory=EXPORT_DIR, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Retorna o caminho do arquivo exportado, gerando-o apenas se ainda não existir.
+
+    Os arquivos são identificados pelo hash do resultado, então reruns do
+    Streamlit reaproveitam o arquivo já gravado em vez de gerá-lo de novo.
+    """
+    extension = EXPORT_FORMATS[fmt][0]
+    result_hash = result_hash or frame_hash(df)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{result_hash}{extension}')
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+
+    write_frame(df, path, fmt, chunk_rows)
+    _evict_old_exports(directory, MAX_EXPORT_FILES)
+    return path
@@ -1,5 +1,6 @@
-import streamlit_authenticator as stauth
+import sys
 
-hasher = stauth.Hasher()
-hashed_password = hasher.hash('senha123')
-print(f"Senha hasheada: {hashed_password}") 
\ No newline at end of file
+from user_store import hash_password
+
+password = sys.argv[1] if len(sys.argv) > 1 else 'senha123'
+print(f"Senha hasheada: {hash_password(password)}")
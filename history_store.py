@@ -0,0 +1,221 @@
+"""Histórico de leituras em Parquet, particionado por cidade e mês, só com inclusões.
+
+Cada inclusão grava um arquivo novo em cada partição afetada
+(``historico/city=<cidade>/month=AAAA-MM/part-<versao>.parquet``); nada é
+reescrito. O manifesto registra a versão e, para cada inclusão, a primeira
+data nova de cada cidade, para que índices e agregados recalculem só o que
+mudou. Leituras repetidas (mesma cidade e data) valem pela mais recente.
+
+    python history_store.py append novas_leituras.csv
+    python history_store.py info
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+
+import pandas as pd
+
+from model_registry import city_key
+
+HISTORY_DIR = 'historico'
+HISTORY_COLUMNS = ['date', 'city', 'co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10', 'aqi']
+
+
+def prepare_readings(frame):
+    """Padroniza colunas e tipos das leituras; levanta ValueError se faltar coluna."""
+    frame = frame.rename(columns=str.lower)
+    missing = [col for col in HISTORY_COLUMNS if col not in frame.columns]
+    if missing:
+        raise ValueError(f"colunas ausentes: {', '.join(missing)}")
+    frame = frame[HISTORY_COLUMNS].copy()
+    frame['date'] = pd.to_datetime(frame['date'], utc=True, errors='coerce')
+    for col in HISTORY_COLUMNS[2:]:
+        frame[col] = pd.to_numeric(frame[col], errors='coerce')
+    frame = frame.dropna(subset=['date', 'city'])
+    frame['city'] = frame['city'].astype(str)
+    return frame
+
+
+def as_utc(value):
+    """Data/hora em UTC; sem fuso, é tomada como UTC."""
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    return ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+
+class HistoryStore:
+    """Partições por (cidade, mês); consultas leem só as partições do período pedido."""
+
+    def __init__(self, directory=HISTORY_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, '_manifest.json')
+
+    def _manifest(self):
+        try:
+            with open(self._manifest_path(), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'version': 0, 'appends': []}
+
+    def _write_atomic(self, path, write):
+        fd, tmp_path = tempfile.mkstemp(prefix='.partial-', dir=os.path.dirname(path))
+        os.close(fd)
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def version(self):
+        return self._manifest()['version']
+
+    def is_empty(self):
+        return self.version() == 0
+
+    def append(self, frame):
+        """Inclui leituras. Retorna ``(versao, {cidade: primeira data incluída})``."""
+        frame = prepare_readings(frame)
+        if frame.empty:
+            return self.version(), {}
+        months = frame['date'].dt.strftime('%Y-%m')
+        changes = {}
+        with self._lock:
+            manifest = self._manifest()
+            version = manifest['version'] + 1
+            for (city, month), part in frame.groupby([frame['city'], months], sort=False):
+                directory = os.path.join(self.directory, f'city={city_key(city)}', f'month={month}')
+                os.makedirs(directory, exist_ok=True)
+                part = part.sort_values('date')
+                self._write_atomic(
+                    os.path.join(directory, f'part-{version:08d}.parquet'),
+                    lambda path: part.to_parquet(path, index=False)
+                )
+                first = part['date'].iloc[0]
+                changes[city] = min(changes.get(city, first), first)
+            manifest['version'] = version
+            manifest['appends'].append({
+                'version': version,
+                'linhas': len(frame),
+                'cidades': {city: first.isoformat() for city, first in changes.items()},
+            })
+
+            def write_manifest(path):
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, indent=2)
+            self._write_atomic(self._manifest_path(), write_manifest)
+        return version, changes
+
+    def appends(self):
+        """Registro das inclusões (versão, linhas e primeira data por cidade), da mais antiga à mais recente."""
+        return self._manifest()['appends']
+
+    def changes_since(self, version):
+        """Primeira data nova de cada cidade nas inclusões posteriores a ``version``."""
+        changes = {}
+        for entry in self.appends():
+            if version is not None and entry['version'] <= version:
+                continue
+            for city, first in entry['cidades'].items():
+                first = pd.Timestamp(first)
+                changes[city] = min(changes.get(city, first), first)
+        return changes
+
+    def cities(self):
+        """Nomes das cidades com leituras, em ordem alfabética (pelo manifesto, sem ler partições)."""
+        return sorted({city for entry in self.appends() for city in entry['cidades']})
+
+    def bounds(self, cities=None):
+        """Primeira e última data das leituras de ``cities`` (ou de todas).
+
+        Lê só a coluna de datas da primeira e da última partição de cada cidade.
+        Retorna ``(None, None)`` se não houver leituras.
+        """
+        keys = {city_key(c) for c in cities} if cities is not None else None
+        directories = {}
+        for key, _, directory in self.partitions():
+            if keys is None or key in keys:
+                directories.setdefault(key, []).append(directory)
+        dates = []
+        for months in directories.values():
+            for directory in dict.fromkeys((months[0], months[-1])):
+                for name in sorted(os.listdir(directory)):
+                    if name.startswith('part-') and name.endswith('.parquet'):
+                        dates.append(pd.read_parquet(os.path.join(directory, name), columns=['date'])['date'])
+        if not dates:
+            return None, None
+        dates = pd.concat(dates, ignore_index=True)
+        return dates.min(), dates.max()
+
+    def partitions(self):
+        """Lista ``(cidade, mes, diretorio)`` de todas as partições."""
+        result = []
+        for city_dir in sorted(os.listdir(self.directory)):
+            if not city_dir.startswith('city='):
+                continue
+            for month_dir in sorted(os.listdir(os.path.join(self.directory, city_dir))):
+                if month_dir.startswith('month='):
+                    result.append((city_dir[5:], month_dir[6:], os.path.join(self.directory, city_dir, month_dir)))
+        return result
+
+    def read(self, cities=None, start=None, end=None, columns=None):
+        """Leituras ordenadas por (cidade, data), lendo só as partições que cruzam o período."""
+        keys = {city_key(c) for c in cities} if cities is not None else None
+        start, end = as_utc(start), as_utc(end)
+        first_month = start.strftime('%Y-%m') if start is not None else None
+        last_month = end.strftime('%Y-%m') if end is not None else None
+        read_columns = None if columns is None else list(dict.fromkeys(['date', 'city'] + list(columns)))
+
+        frames = []
+        selected = 0
+        for key, month, directory in self.partitions():
+            if keys is not None and key not in keys:
+                continue
+            if (first_month and month < first_month) or (last_month and month > last_month):
+                continue
+            selected += 1
+            for name in sorted(os.listdir(directory)):
+                if name.startswith('part-') and name.endswith('.parquet'):
+                    frames.append(pd.read_parquet(os.path.join(directory, name), columns=read_columns))
+        if not frames:
+            return pd.DataFrame(columns=read_columns or HISTORY_COLUMNS)
+
+        history = pd.concat(frames, ignore_index=True)
+        if len(frames) > selected:
+            # Houve mais de uma inclusão na mesma partição: vale a leitura mais recente
+            history = history.drop_duplicates(['city', 'date'], keep='last')
+        if start is not None:
+            history = history[history['date'] >= start]
+        if end is not None:
+            history = history[history['date'] <= end]
+        return history.sort_values(['city', 'date'], kind='stable').reset_index(drop=True)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    store = HistoryStore()
+    if argv[:1] == ['append'] and len(argv) > 1:
+        for path in argv[1:]:
+            frame = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+            version, changes = store.append(frame)
+            print(f'{path}: versão {version}, cidades: {", ".join(sorted(changes)) or "-"}')
+        return 0
+    if argv[:1] == ['info']:
+        partitions = store.partitions()
+        print(f'versão {store.version()}, {len(partitions)} partições, '
+              f'{len({key for key, _, _ in partitions})} cidades')
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""Índice, agregados e acumuladores do histórico usados pela página de análise.
+
+``HistoryViews`` mantém, de cada cidade, só a janela de datas já pedida: a
+janela é lida das partições que a cruzam (``HistoryStore.read``), com os
+horários ausentes inseridos e os valores faltantes preenchidos, e só é
+ampliada quando um pedido sai dela. Após uma inclusão no store, apenas as
+cidades carregadas alcançadas pelas datas novas são relidas.
+
+``current`` devolve um ``HistorySnapshot`` (uma revisão do índice); os cálculos
+de cada aba da análise saem dele. Somas acumuladas e co-momentos de cada
+cidade ficam em cache pela versão da cidade, então uma inclusão só refaz as
+cidades alteradas. O ``app.py`` (um por processo, em ``st.cache_resource``) e o
+``loadtest.py`` usam as mesmas classes.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from anomalies import detect_anomalies
+from correlations import CoMoments, CorrelationIndex
+from data_index import CityIndex
+from history_store import as_utc
+from imputation import impute_history, IMPUTATION_LIMIT
+from pipeline import HISTORY_VALUE_COLUMNS
+from profiling import profile_readings
+from rollups import Rollups
+from summaries import PrefixSums, density_grid, histogram_summary, box_summary, SUM_KEYS
+
+# Folga das janelas além do período pedido: cobre a semana e o mês inteiros dos agregados
+# nas pontas e a maior janela da detecção de anomalias (30 dias)
+HISTORY_LEAD = pd.Timedelta(days=31)
+# Acumuladores por cidade (somas acumuladas e co-momentos) mantidos em memória
+ACCUMULATOR_ENTRIES = 128
+
+
+class HistoryViews:
+    """Janelas carregadas por cidade sobre um ``HistoryStore``, compartilhadas entre sessões.
+
+    ``method`` e ``limit`` são os da imputação do histórico; cada leitura de
+    partições inclui ``limit`` horas além das pontas da janela, para que a
+    interpolação nas bordas tenha as leituras vizinhas (a folga é descartada).
+    """
+
+    def __init__(self, store, method='interpolacao', limit=IMPUTATION_LIMIT):
+        self.store = store
+        self.method = method
+        self.limit = limit
+        self.margin = pd.Timedelta(hours=limit)
+        self.version = None
+        # ``revision`` muda a cada alteração do índice; ``city_versions`` guarda a revisão
+        # que alterou cada cidade por último
+        self.revision = 0
+        self.index = None
+        self.rollups = None
+        self.windows = {}
+        self.city_versions = {}
+        self._lock = threading.Lock()
+        self._accumulators = OrderedDict()
+        self._accumulators_lock = threading.Lock()
+
+    def prepare(self, readings):
+        return impute_history(readings, HISTORY_VALUE_COLUMNS, self.method, self.limit)
+
+    def _load_window(self, city, start, end):
+        """Leituras preparadas de ``city`` em ``[start, end]`` (None = sem limite)."""
+        frame = self.prepare(self.store.read(
+            [city], None if start is None else start - self.margin, None if end is None else end + self.margin
+        ))
+        keep = np.ones(len(frame), dtype=bool)
+        if start is not None:
+            keep &= (frame['date'] >= start).to_numpy()
+        if end is not None:
+            keep &= (frame['date'] <= end).to_numpy()
+        return frame[keep].reset_index(drop=True)
+
+    def _appended(self, index, frames, since):
+        """Relê as cidades carregadas alcançadas pelas inclusões desde ``self.version``."""
+        for city, first in self.store.changes_since(self.version).items():
+            if city not in self.windows:
+                continue  # ainda não pedida: a janela é lida quando for
+            low, high = self.windows[city]
+            # Leituras novas também preenchem a lacuna (horária) logo antes delas
+            cutoff = first - self.margin
+            if high is not None and cutoff > high:
+                continue  # datas novas depois da janela
+            if high is None and city in index.ranges and (low is None or cutoff - self.margin >= low):
+                # Só o fim da cidade: recalcula a partir de ``cutoff``, relendo mais ``margin`` de contexto
+                fresh = self.prepare(self.store.read([city], start=cutoff - self.margin))
+                fresh = fresh[fresh['date'] >= cutoff]
+                kept = index.rows(city)
+                kept = kept.iloc[:int(kept['date'].searchsorted(cutoff))]
+                frames[city] = pd.concat([kept, fresh], ignore_index=True)
+                since[city] = cutoff
+            else:
+                frames[city] = self._load_window(city, low, high)
+                since[city] = frames[city]['date'].min()
+
+    def current(self, cities=None, start=None, end=None):
+        """Revisão do índice que cobre ``cities`` (None = todas) no período ``[start, end]``."""
+        version = self.store.version()
+        cities = self.store.cities() if cities is None else cities
+        start = None if start is None else as_utc(start) - HISTORY_LEAD
+        end = None if end is None else as_utc(end) + HISTORY_LEAD
+        with self._lock:
+            index = self.index
+            frames, since = {}, {}
+            if self.version is not None and self.version != version:
+                self._appended(index, frames, since)
+            for city in cities:
+                window = self.windows.get(city)
+                if window is not None and _covers(window, start, end):
+                    continue
+                if window is not None:
+                    window = (None if window[0] is None or start is None else min(window[0], start),
+                              None if window[1] is None or end is None else max(window[1], end))
+                else:
+                    window = (start, end)
+                self.windows[city] = window
+                frame = self._load_window(city, *window)
+                if len(frame):
+                    frames[city] = frame
+                    since[city] = frame['date'].min()
+            if frames:
+                if index is None:
+                    index = CityIndex(pd.concat([frames[city] for city in sorted(frames)], ignore_index=True),
+                                      assume_sorted=True)
+                    self.rollups = Rollups(index, HISTORY_VALUE_COLUMNS)
+                else:
+                    index = index.replace(frames)
+                    self.rollups.update(index, list(frames), min(since.values()))
+                self.revision += 1
+                self.city_versions.update(dict.fromkeys(frames, self.revision))
+            self.version, self.index = version, index
+            return HistorySnapshot(self, self.revision, index, self.rollups, dict(self.city_versions))
+
+    def profile(self, city=None, start=None, end=None):
+        """Perfil de qualidade das leituras como foram gravadas (sem as inseridas nem as imputadas)."""
+        readings = self.store.read([city] if city is not None else None, start, end)
+        return profile_readings(readings, HISTORY_VALUE_COLUMNS)
+
+    def _accumulator(self, key, build):
+        with self._accumulators_lock:
+            if key in self._accumulators:
+                self._accumulators.move_to_end(key)
+                return self._accumulators[key]
+        value = build()
+        with self._accumulators_lock:
+            self._accumulators[key] = value
+            while len(self._accumulators) > ACCUMULATOR_ENTRIES:
+                self._accumulators.popitem(last=False)
+        return value
+
+
+def _covers(window, start, end):
+    low, high = window
+    return ((low is None or (start is not None and low <= start))
+            and (high is None or (end is not None and high >= end)))
+
+
+class HistorySnapshot:
+    """Uma revisão do índice: ``revision``, ``index`` (``CityIndex``), ``rollups`` e ``city_versions``."""
+
+    def __init__(self, views, revision, index, rollups, city_versions):
+        self.views = views
+        self.revision = revision
+        self.index = index
+        self.rollups = rollups
+        self.city_versions = city_versions
+
+    def pair_sums(self, x_var, y_var, city):
+        """Somas acumuladas do par na cidade: a regressão de qualquer período sai em O(1)."""
+        return self.views._accumulator(
+            ('somas', x_var, y_var, city, self.city_versions.get(city)),
+            lambda: PrefixSums(self.index.rows(city)[x_var].to_numpy(), self.index.rows(city)[y_var].to_numpy())
+        )
+
+    def correlation_index(self, city):
+        """Co-momentos por blocos de linhas da cidade: a correlação de qualquer período combina os blocos."""
+        return self.views._accumulator(
+            ('correlacao', city, self.city_versions.get(city)),
+            lambda: CorrelationIndex.from_frame(self.index.rows(city), HISTORY_VALUE_COLUMNS)
+        )
+
+    def period_sums(self, x_var, y_var, city=None, start=None, end=None):
+        total = dict.fromkeys(SUM_KEYS, 0.0)
+        for name, local in self.index.city_ranges(city, start, end).items():
+            for key, value in self.pair_sums(x_var, y_var, name).sums([local]).items():
+                total[key] += value
+        return total
+
+    def period_correlation(self, city=None, start=None, end=None):
+        parts = [self.correlation_index(name).query([local])
+                 for name, local in self.index.city_ranges(city, start, end).items()]
+        if not parts:
+            return CoMoments.empty(HISTORY_VALUE_COLUMNS).correlation()
+        return CoMoments.combine(parts).correlation()
+
+    def density(self, x_var, y_var, city=None, start=None, end=None):
+        rows = self.index.time_slice(city, start, end)
+        return density_grid(rows[x_var].to_numpy(), rows[y_var].to_numpy())
+
+    def distribution(self, pollutant, city=None, start=None, end=None):
+        """Histograma e resumo do box plot de um poluente no período."""
+        values = self.index.time_slice(city, start, end)[pollutant].to_numpy()
+        return histogram_summary(values), box_summary(values)
+
+    def city_summary(self, pollutant, start=None, end=None):
+        return self.index.summary([pollutant], start, end)
+
+    def anomalies(self, window, threshold):
+        """Anomalias sobre todo o índice (o filtro de período é aplicado depois). Retorna ``(flags, stats)``."""
+        # O índice já mantém o histórico ordenado por cidade e data
+        flags, stats = detect_anomalies(
+            self.index.data,
+            HISTORY_VALUE_COLUMNS,
+            group_column='city',
+            window=window,
+            threshold=threshold
+        )
+        # Valores preenchidos não são medições: não viram anomalias
+        imputed = self.index.data['imputado'].to_numpy()
+        flags.loc[imputed, 'anomalia'] = False
+        flags.loc[imputed, 'anomalia_poluentes'] = ''
+        stats['anomalias'] = int(flags['anomalia'].sum())
+        return flags, stats
@@ -0,0 +1,231 @@
+"""Preenchimento de lacunas e imputação de valores faltantes antes da previsão.
+
+Os métodos trabalham por cidade, na ordem das datas quando há coluna
+``date`` (senão na ordem das linhas), com operações vetorizadas por grupo:
+
+- ``ffill``: repete a última leitura válida da cidade, por até ``limit``
+  leituras seguidas;
+- ``interpolacao``: interpolação linear no tempo entre as leituras vizinhas
+  da cidade, em lacunas de até ``limit`` leituras;
+- ``modelo``: melhor previsor linear a partir dos demais poluentes da mesma
+  linha, com médias e covariâncias da cidade (co-momentos de ``correlations``).
+
+Células que o método não consegue preencher (ex.: início da série no
+``ffill``) continuam vazias.
+"""
+import numpy as np
+import pandas as pd
+
+from correlations import CoMoments
+
+IMPUTATION_METHODS = {
+    'nenhum': 'Não preencher',
+    'ffill': 'Repetir a última leitura',
+    'interpolacao': 'Interpolação no tempo',
+    'modelo': 'Modelo (demais poluentes)',
+}
+# Leituras seguidas preenchidas no máximo pelo ffill e pela interpolação
+IMPUTATION_LIMIT = 6
+# Abaixo disso a cidade usa médias e covariâncias de todas as cidades no método ``modelo``
+MODEL_MIN_ROWS = 50
+
+
+def _series_order(df, city_column, date_column):
+    """Posições em ordem (cidade, data), códigos das cidades e tempos (ns) nessa ordem."""
+    if city_column in df.columns:
+        codes = pd.factorize(df[city_column].fillna('').astype(str))[0].astype(np.int64)
+    else:
+        codes = np.zeros(len(df), dtype=np.int64)
+    if date_column in df.columns:
+        times = pd.to_datetime(df[date_column], errors='coerce', utc=True)
+        times = times.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    else:
+        times = np.arange(len(df), dtype=np.int64)
+    order = np.lexsort((times, codes))
+    return order, codes[order], times[order]
+
+
+def _group_bounds(codes):
+    """Início e fim (exclusivo) do grupo de cada posição, com ``codes`` ordenados."""
+    n = len(codes)
+    positions = np.arange(n)
+    is_start = np.ones(n, dtype=bool)
+    is_start[1:] = codes[1:] != codes[:-1]
+    start = np.maximum.accumulate(np.where(is_start, positions, 0))
+    is_end = np.ones(n, dtype=bool)
+    is_end[:-1] = is_start[1:]
+    end = np.minimum.accumulate(np.where(is_end, positions + 1, n)[::-1])[::-1]
+    return start, end
+
+
+def _neighbors(valid):
+    """Última posição válida até cada linha e a próxima a partir dela, por coluna."""
+    n = len(valid)
+    positions = np.arange(n)[:, None]
+    previous = np.maximum.accumulate(np.where(valid, positions, -1), axis=0)
+    following = np.minimum.accumulate(np.where(valid, positions, n)[::-1], axis=0)[::-1]
+    return previous, following
+
+
+def _forward_fill(values, codes, times, limit):
+    valid = ~np.isnan(values)
+    start, _ = _group_bounds(codes)
+    previous, _ = _neighbors(valid)
+    fill = ~valid & (previous >= start[:, None]) & (np.arange(len(values))[:, None] - previous <= limit)
+    source = np.take_along_axis(values, np.maximum(previous, 0), axis=0)
+    return np.where(fill, source, values)
+
+
+def _interpolate(values, codes, times, limit):
+    valid = ~np.isnan(values)
+    start, end = _group_bounds(codes)
+    previous, following = _neighbors(valid)
+    fill = (~valid & (previous >= start[:, None]) & (following < end[:, None])
+            & (following - previous - 1 <= limit))
+    n = len(values)
+    before = np.take_along_axis(values, np.clip(previous, 0, n - 1), axis=0)
+    after = np.take_along_axis(values, np.clip(following, 0, n - 1), axis=0)
+    t = times.astype(np.float64)[:, None]
+    t_before = t[np.clip(previous, 0, n - 1), 0]
+    t_after = t[np.clip(following, 0, n - 1), 0]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(t_after > t_before, (t - t_before) / (t_after - t_before), 0.0)
+    return np.where(fill, before + (after - before) * weight, values)
+
+
+def _model_fill(values, codes, times, limit, columns):
+    missing = np.isnan(values)
+    rows = np.flatnonzero(missing.any(axis=1) & ~missing.all(axis=1))
+    if len(rows) == 0:
+        return values
+    filled = values.copy()
+    overall = CoMoments.from_array(columns, values)
+    # Linhas agrupadas por (cidade, padrão de faltantes): uma regressão por grupo
+    pattern = missing[rows] @ (1 << np.arange(len(columns)))
+    keys = codes[rows] * (1 << len(columns)) + pattern
+    group_order = np.argsort(keys, kind='stable')
+    boundaries = np.flatnonzero(np.diff(keys[group_order])) + 1
+    moments_by_city = {}
+    for group in np.split(rows[group_order], boundaries):
+        city = codes[group[0]]
+        if city not in moments_by_city:
+            in_city = values[codes == city]
+            moments_by_city[city] = (CoMoments.from_array(columns, in_city)
+                                     if len(in_city) >= MODEL_MIN_ROWS else overall)
+        moments = moments_by_city[city]
+        mean = moments.means().to_numpy()
+        cov = np.nan_to_num(moments.covariance().to_numpy())
+        target = missing[group[0]]
+        observed = ~target
+        coef = cov[np.ix_(target, observed)] @ np.linalg.pinv(cov[np.ix_(observed, observed)])
+        estimate = mean[target] + (values[np.ix_(group, observed)] - mean[observed]) @ coef.T
+        filled[np.ix_(group, target)] = np.maximum(estimate, 0.0)
+    return filled
+
+
+_METHODS = {'ffill': _forward_fill, 'interpolacao': _interpolate}
+
+
+def impute(df, columns, method, city_column='city', date_column='date', limit=IMPUTATION_LIMIT):
+    """Preenche os valores faltantes de ``columns``.
+
+    Retorna ``(df, filled)``: cópia de ``df`` com os valores preenchidos (mesmos tipos)
+    e um DataFrame booleano com as células preenchidas.
+    """
+    if method not in IMPUTATION_METHODS:
+        raise ValueError(f'método de imputação desconhecido: {method}')
+    values = df[columns].to_numpy(dtype=np.float64)
+    missing = np.isnan(values)
+    if method == 'nenhum' or not missing.any():
+        return df, pd.DataFrame(False, index=df.index, columns=columns)
+
+    order, codes, times = _series_order(df, city_column, date_column)
+    if method == 'modelo':
+        sorted_filled = _model_fill(values[order], codes, times, limit, columns)
+    else:
+        sorted_filled = _METHODS[method](values[order], codes, times, limit)
+    result = np.empty_like(values)
+    result[order] = sorted_filled
+
+    imputed = df.copy()
+    for i, col in enumerate(columns):
+        imputed[col] = result[:, i].astype(df[col].dtype)
+    filled = pd.DataFrame(missing & ~np.isnan(result), index=df.index, columns=columns)
+    return imputed, filled
+
+
+def imputation_flags(filled):
+    """Colunas ``imputado`` e ``imputado_poluentes`` alinhadas ao lote."""
+    mask = filled.to_numpy()
+    names = np.array([col.upper() for col in filled.columns], dtype=object)
+    imputed_pollutants = np.full(len(mask), '', dtype=object)
+    for row in np.flatnonzero(mask.any(axis=1)):
+        imputed_pollutants[row] = ', '.join(names[mask[row]])
+    return pd.DataFrame({'imputado': mask.any(axis=1), 'imputado_poluentes': imputed_pollutants},
+                        index=filled.index)
+
+
+def impute_batch(input_df, method, columns, limit=IMPUTATION_LIMIT):
+    """Imputa um lote e acrescenta as colunas de marcação. Retorna ``(df, células preenchidas)``."""
+    if method == 'nenhum':
+        return input_df, 0
+    imputed, filled = impute(input_df, columns, method, limit=limit)
+    return pd.concat([imputed, imputation_flags(filled)], axis=1), int(filled.to_numpy().sum())
+
+
+def impute_history(history, columns, method, limit=IMPUTATION_LIMIT):
+    """Histórico com os horários ausentes inseridos e os valores faltantes preenchidos.
+
+    ``horario_inserido`` marca as linhas inseridas; ``imputado`` (inseridas incluídas)
+    e ``imputado_poluentes`` as preenchidas, como em ``impute_batch``.
+    """
+    history = fill_time_gaps(history, max_gap=limit, flag_column='horario_inserido')
+    history, filled = impute(history, columns, method, limit=limit)
+    flags = imputation_flags(filled)
+    flags['imputado'] |= history['horario_inserido']
+    return pd.concat([history, flags], axis=1)
+
+
+def fill_time_gaps(df, city_column='city', date_column='date', max_gap=IMPUTATION_LIMIT, interval=None,
+                   flag_column=None):
+    """Insere linhas vazias nos horários que faltam na série de cada cidade.
+
+    Só lacunas de até ``max_gap`` leituras são completadas; ``interval`` é o passo
+    entre leituras (por padrão, o passo mais comum). ``df`` deve estar ordenado por
+    (cidade, data), como o histórico. Com ``flag_column``, essa coluna marca as
+    linhas inseridas.
+    """
+    if flag_column is not None:
+        df = df.assign(**{flag_column: False})
+    if len(df) < 2 or date_column not in df.columns:
+        return df
+    times = df[date_column].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    cities = df[city_column].to_numpy() if city_column in df.columns else np.zeros(len(df))
+    steps = np.diff(times)
+    same_city = cities[1:] == cities[:-1]
+    if interval is None:
+        positive = steps[same_city & (steps > 0)]
+        if len(positive) == 0:
+            return df
+        values, counts = np.unique(positive, return_counts=True)
+        interval = int(values[counts.argmax()])
+    absent = np.where(same_city & (steps > interval), steps // interval - 1, 0)
+    absent[absent > max_gap] = 0
+    if not absent.any():
+        return df
+
+    # Para cada lacuna, os horários que faltam a partir da leitura anterior
+    gap_rows = np.flatnonzero(absent)
+    repeats = absent[gap_rows]
+    offsets = np.arange(repeats.sum()) - np.repeat(np.cumsum(repeats) - repeats, repeats) + 1
+    new_times = np.repeat(times[gap_rows], repeats) + offsets * interval
+    inserted = pd.DataFrame({
+        date_column: pd.to_datetime(new_times, unit='ns', utc=True).tz_convert(df[date_column].dt.tz),
+    })
+    if city_column in df.columns:
+        inserted[city_column] = np.repeat(cities[gap_rows], repeats)
+    if flag_column is not None:
+        inserted[flag_column] = True
+    combined = pd.concat([df, inserted], ignore_index=True)
+    keys = [city_column, date_column] if city_column in df.columns else [date_column]
+    return combined.sort_values(keys, kind='stable').reset_index(drop=True)
@@ -0,0 +1,273 @@
+"""Fila local de processamentos em lote, executados fora da thread do Streamlit.
+
+Os jobs ficam numa tabela SQLite; cada bloco processado é gravado em disco
+(checkpoint), então um job interrompido por reinício do servidor continua
+do último bloco concluído. Quem processa um job renova ``heartbeat_at``
+periodicamente; só jobs sem sinal há ``STALE_SECONDS`` voltam para a fila,
+então processos que compartilham o diretório não retomam jobs uns dos outros.
+"""
+import json
+import os
+import secrets
+import socket
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+from batch_io import read_batch, as_float32
+
+JOBS_DIR = os.path.join(tempfile.gettempdir(), 'aqi_jobs')
+JOB_CHUNK_ROWS = 20_000
+HEARTBEAT_SECONDS = 10
+STALE_SECONDS = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total_rows INTEGER DEFAULT 0,
+    processed_rows INTEGER DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    rows_per_second REAL,
+    error TEXT,
+    worker TEXT,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, created_at);
+"""
+
+
+class JobQueue:
+    """Fila de jobs em SQLite com um pool de threads de processamento.
+
+    ``prepare(df, options)`` (opcional) recebe o arquivo inteiro antes da divisão
+    em blocos, com as opções do envio (ex.: imputação); o resultado é gravado no
+    diretório do job, e uma retomada usa esse mesmo quadro em vez de preparar de
+    novo (os blocos já gravados vieram dele). ``process_chunk(df)``
+    processa um bloco de linhas e ``finalize(df, job_id)`` recebe o resultado completo (ex.: detecção de anomalias e gravação no
+    ``ResultStore``). Como ``prepare`` e ``finalize`` veem o arquivo inteiro, um job
+    mantém em memória a entrada completa durante a previsão e, depois, o resultado
+    completo; ``chunk_rows`` limita só as matrizes intermediárias de cada bloco. O id do job é o mesmo id de lote usado no cache de
+    resultados, então reenviar o mesmo arquivo não cria um job novo.
+    """
+
+    def __init__(self, process_chunk, finalize, directory=JOBS_DIR, workers=2, chunk_rows=JOB_CHUNK_ROWS,
+                 prepare=None):
+        self.process_chunk = process_chunk
+        self.prepare = prepare
+        self.finalize = finalize
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.db_path = os.path.join(directory, 'jobs.db')
+        self._wakeup = threading.Event()
+        # Identifica este processo nos jobs que ele está processando
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}'
+        self._running = set()
+        self._running_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            # Bancos criados antes do heartbeat
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for column, kind in (('worker', 'TEXT'), ('heartbeat_at', 'REAL')):
+                if column not in columns:
+                    try:
+                        conn.execute(f'ALTER TABLE jobs ADD COLUMN {column} {kind}')
+                    except sqlite3.OperationalError:
+                        pass  # outro processo acabou de incluir
+            self._requeue_stale(conn)
+        self._threads = [
+            threading.Thread(target=self._worker, name=f'batch-worker-{i}', daemon=True)
+            for i in range(workers)
+        ] + [threading.Thread(target=self._heartbeat, name='batch-heartbeat', daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.row_factory = sqlite3.Row
+            yield conn
+        finally:
+            conn.close()
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.directory, job_id)
+
+    # ------------------------------------------------------------------
+    # API usada pela interface
+    # ------------------------------------------------------------------
+    def enqueue(self, job_id, owner, filename, content, options=None):
+        """Coloca um arquivo na fila. Retorna False se o mesmo lote já está na fila."""
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        extension = filename.lower().split('.', 1)[1] if '.' in filename else 'csv'
+        input_path = os.path.join(job_dir, f'input.{extension}')
+        with self._connect() as conn:
+            existing = conn.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if existing is not None and existing['status'] in ('queued', 'running'):
+                return False
+            with open(input_path, 'wb') as f:
+                f.write(content)
+            with open(os.path.join(job_dir, 'options.json'), 'w', encoding='utf-8') as f:
+                json.dump(options or {}, f)
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, owner, filename, status, created_at) "
+                "VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, owner, filename, time.time())
+            )
+        self._wakeup.set()
+        return True
+
+    def list_jobs(self, owner, limit=20):
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT * FROM jobs WHERE owner = ? ORDER BY created_at DESC LIMIT ?',
+                (owner, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    # ------------------------------------------------------------------
+    # Processamento
+    # ------------------------------------------------------------------
+    def _requeue_stale(self, conn):
+        """Jobs interrompidos (sem heartbeat recente) voltam para a fila e retomam do checkpoint."""
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL "
+            "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+            (time.time() - STALE_SECONDS,)
+        )
+
+    def _claim(self):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            self._requeue_stale(conn)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?), worker = ?, "
+                "heartbeat_at = ? WHERE id = ?",
+                (now, self.worker_id, now, row['id'])
+            )
+            conn.execute('COMMIT')
+            return dict(row)
+
+    def _update(self, job_id, **fields):
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._connect() as conn:
+            conn.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    def _worker(self):
+        while True:
+            try:
+                job = self._claim()
+            except sqlite3.OperationalError:
+                # Banco travado por outro processo além do timeout: tenta de novo em seguida
+                time.sleep(1)
+                continue
+            if job is None:
+                self._wakeup.wait(timeout=5)
+                self._wakeup.clear()
+                continue
+            with self._running_lock:
+                self._running.add(job['id'])
+            try:
+                self._run(job)
+            except Exception as e:
+                self._update(job['id'], status='failed', error=str(e), finished_at=time.time())
+            finally:
+                with self._running_lock:
+                    self._running.discard(job['id'])
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            with self._running_lock:
+                running = list(self._running)
+            if not running:
+                continue
+            try:
+                with self._connect() as conn:
+                    conn.executemany(
+                        'UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ?',
+                        [(time.time(), job_id, self.worker_id) for job_id in running]
+                    )
+            except sqlite3.OperationalError:
+                continue  # banco ocupado; o próximo sinal chega antes de o job ficar velho
+
+    def _run(self, job):
+        job_dir = self._job_dir(job['id'])
+        prepared_path = os.path.join(job_dir, 'prepared.parquet')
+        if os.path.exists(prepared_path):
+            input_df = pd.read_parquet(prepared_path)
+        else:
+            input_name = next(f for f in os.listdir(job_dir) if f.startswith('input.'))
+            with open(os.path.join(job_dir, input_name), 'rb') as f:
+                input_df = as_float32(read_batch(f, input_name))
+            if self.prepare is not None:
+                options_path = os.path.join(job_dir, 'options.json')
+                options = {}
+                if os.path.exists(options_path):
+                    with open(options_path, encoding='utf-8') as f:
+                        options = json.load(f)
+                input_df = self.prepare(input_df, options)
+                tmp_path = prepared_path + '.tmp'
+                input_df.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, prepared_path)
+        total = len(input_df)
+        self._update(job['id'], total_rows=total)
+
+        started = time.perf_counter()
+        processed_now = 0
+        for number, start in enumerate(range(0, total, self.chunk_rows)):
+            part_path = os.path.join(job_dir, f'part-{number:05d}.parquet')
+            chunk = input_df.iloc[start:start + self.chunk_rows]
+            if not os.path.exists(part_path):
+                tmp_path = part_path + '.tmp'
+                self.process_chunk(chunk).to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, part_path)
+                processed_now += len(chunk)
+            self._update(job['id'], processed_rows=start + len(chunk))
+
+        parts = sorted(f for f in os.listdir(job_dir) if f.startswith('part-') and f.endswith('.parquet'))
+        if not parts:
+            results_df = self.process_chunk(input_df)
+        else:
+            # A entrada é liberada antes de juntar os blocos: no pico só o resultado fica em memória
+            del input_df, chunk
+            results_df = pd.concat(
+                [pd.read_parquet(os.path.join(job_dir, f)) for f in parts], ignore_index=True
+            )
+        self.finalize(results_df, job['id'])
+
+        elapsed = time.perf_counter() - started
+        self._update(
+            job['id'],
+            status='done',
+            finished_at=time.time(),
+            rows_per_second=processed_now / elapsed if elapsed > 0 and processed_now else None
+        )
+        # Os resultados ficam no ResultStore; os blocos intermediários não são mais necessários
+        shutil.rmtree(job_dir, ignore_errors=True)
@@ -0,0 +1,385 @@
+"""Teste de carga local: N usuários simultâneos percorrendo o fluxo do app.
+
+Cada usuário virtual é uma thread, como as sessões do Streamlit num mesmo
+processo, e repete login → previsão individual (previsão, contribuições,
+varreduras "e se?" e grade 32×32) → lote (arquivo do ``generate_test_data.py``,
+com perfil de qualidade e imputação de uma fração de células esvaziadas) →
+análise histórica (agregados, correlação, regressão e perfil das leituras
+originais do período). As etapas chamam as mesmas funções das páginas
+(``page_steps.py`` e ``history_views.py``). Modelos, transformer,
+autenticador e índices são compartilhados entre os usuários, como os
+``st.cache_resource`` do ``app.py``; os ``st.cache_data`` não são simulados,
+então cada etapa paga o cálculo completo.
+
+O relatório (JSON) traz p50/p95/p99 por etapa, vazão e memória, e pode ser
+comparado com o de outra versão:
+
+    python loadtest.py --users 1,10,25 --iterations 3 --output carga.json
+    python loadtest.py --users 1,10,25 --compare carga.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+import yaml
+
+from artifacts import ArtifactStore, ArtifactMissing
+from auth import Authenticator
+from batch_io import read_batch
+from history_store import HistoryStore
+from history_views import HistoryViews
+from imputation import IMPUTATION_METHODS, IMPUTATION_LIMIT
+from memory_budget import process_rss_bytes
+from model_registry import ModelRegistry, MODELS_DIR, DEFAULT_KEY
+import page_steps
+from pipeline import score_chunk, REQUIRED_COLUMNS
+from profiling import profile_readings
+from sensitivity import sensitivity_ranking
+from summaries import ols_from_sums
+from user_store import UserStore, hash_password
+from warmup import synthetic_batch
+
+STEPS = ('login', 'previsao', 'lote', 'analise')
+LOAD_USER = 'carga'
+LOAD_PASSWORD = 'carga-local'
+MEMORY_SAMPLE_SECONDS = 0.2
+# Fração das células do lote esvaziadas para que o envio passe pela imputação
+BLANK_FRACTION = 0.01
+
+
+def percentiles(values):
+    """p50/p95/p99, média e máximo (ms) de uma lista de latências em segundos."""
+    if not values:
+        return {'p50_ms': None, 'p95_ms': None, 'p99_ms': None, 'media_ms': None, 'max_ms': None}
+    ms = np.asarray(values) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {'p50_ms': round(float(p50), 1), 'p95_ms': round(float(p95), 1), 'p99_ms': round(float(p99), 1),
+            'media_ms': round(float(ms.mean()), 1), 'max_ms': round(float(ms.max()), 1)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def batch_file_bytes(path, blank_fraction=0.0):
+    """Conteúdo do arquivo de lote; sem ele, roda o ``generate_test_data.py`` para criá-lo.
+
+    Com ``blank_fraction``, essa fração das células de poluentes é esvaziada e o
+    lote volta como CSV. Retorna ``(nome, conteúdo)``.
+    """
+    if not os.path.exists(path):
+        here = os.path.dirname(os.path.abspath(__file__))
+        subprocess.run([sys.executable, os.path.join(here, 'generate_test_data.py')],
+                       cwd=os.path.dirname(os.path.abspath(path)), check=True, capture_output=True)
+    with open(path, 'rb') as f:
+        content = f.read()
+    if not blank_fraction:
+        return os.path.basename(path), content
+    batch = read_batch(io.BytesIO(content), os.path.basename(path))
+    blanks = np.random.default_rng(0).random((len(batch), len(REQUIRED_COLUMNS))) < blank_fraction
+    batch[REQUIRED_COLUMNS] = batch[REQUIRED_COLUMNS].mask(blanks)
+    name = os.path.splitext(os.path.basename(path))[0] + '.csv'
+    return name, batch.to_csv(index=False).encode('utf-8')
+
+
+class Environment:
+    """Recursos compartilhados pelos usuários virtuais (o equivalente aos caches do app)."""
+
+    def __init__(self, model_path, qt_path, history_path, batch_path, models_dir=MODELS_DIR,
+                 auth_config=None, users_db=None, history_dir=None, imputation='interpolacao',
+                 blank_fraction=BLANK_FRACTION):
+        self.registry = ModelRegistry(models_dir=models_dir, default_path=model_path)
+        for key in self.registry.discover():
+            self.registry.load_latest(key)
+        self.qt = joblib.load(qt_path)
+        # Mesmo aquecimento do servidor: tabelas das árvores prontas antes da primeira medição
+        cities = [key for key in self.registry.cities() if key != DEFAULT_KEY] + [DEFAULT_KEY]
+        score_chunk(self.registry, self.qt, synthetic_batch(self.qt, cities=cities))
+
+        auth_config = auth_config or {}
+        rounds = auth_config.get('bcrypt_rounds', 12)
+        self.user_store = UserStore(users_db)
+        if not self.user_store.exists(LOAD_USER):
+            self.user_store.add_user(LOAD_USER, 'Teste de carga', 'carga@example.com',
+                                     hash_password(LOAD_PASSWORD, rounds))
+        self.authenticator = Authenticator(
+            self.user_store,
+            rounds=rounds,
+            workers=auth_config.get('workers', 2),
+            max_pending=auth_config.get('max_pending_logins', 32)
+        )
+
+        # Histórico em partições, como no app; as janelas de todas as cidades são carregadas antes
+        # da medição (o equivalente a alguém já ter aberto a análise com "Todas as cidades")
+        self.history_store = HistoryStore(history_dir or tempfile.mkdtemp(prefix='aqi_historico_'))
+        if self.history_store.is_empty():
+            self.history_store.append(pd.read_csv(history_path))
+        self.history = HistoryViews(self.history_store, 'interpolacao', IMPUTATION_LIMIT)
+        self.history.current()
+        self.imputation = imputation
+        self.batch_name, self.batch_bytes = batch_file_bytes(batch_path, blank_fraction)
+
+
+class VirtualUser:
+    """Um usuário percorrendo as páginas; ``timings[etapa]`` guarda as latências em segundos."""
+
+    def __init__(self, env, seed, think_seconds=0.0):
+        self.env = env
+        self.rng = np.random.default_rng(seed)
+        self.think_seconds = think_seconds
+        self.timings = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.last_error = {}
+        self.batch_rows = 0
+
+    def login(self):
+        user, token = self.env.authenticator.login(LOAD_USER, LOAD_PASSWORD)
+        if token is None:
+            raise RuntimeError('login recusado')
+
+    def predict(self):
+        # Medição real do histórico, como se digitada na página de previsão individual. Todas as
+        # abas são renderizadas a cada rerun: previsão, contribuições, varreduras e grade "e se?"
+        data = self.env.history.index.data
+        row = data.iloc[int(self.rng.integers(len(data)))]
+        vector, city = tuple(float(row[p]) for p in REQUIRED_COLUMNS), row['city']
+        registry, qt = self.env.registry, self.env.qt
+        page_steps.predict_vector(registry, qt, vector, city)
+        page_steps.explain_vector(registry, qt, vector, city)
+        sweeps = page_steps.what_if_sweeps(registry, qt, vector, city)
+        x_pollutant, y_pollutant = page_steps.what_if_axes(sensitivity_ranking(sweeps))
+        page_steps.what_if_grid(registry, qt, vector, city, x_pollutant, y_pollutant)
+
+    def batch(self):
+        input_df = page_steps.load_upload(io.BytesIO(self.env.batch_bytes), self.env.batch_name)
+        profile_readings(input_df, REQUIRED_COLUMNS)
+        input_df, _, _ = page_steps.impute_upload(input_df, self.env.imputation)
+        results_df, _ = page_steps.score_upload(self.env.registry, self.env.qt, input_df)
+        page_steps.batch_summaries(results_df)
+        self.batch_rows += len(results_df)
+
+    def analyze(self):
+        # Cidade e mês sorteados: tendência, distribuição, densidade e regressão do período
+        history = self.env.history.current()
+        cities = history.index.cities
+        city = cities[int(self.rng.integers(len(cities)))] if cities else None
+        rows = history.index.rows(city)
+        start = rows['date'].iloc[int(self.rng.integers(max(len(rows) - 720, 1)))]
+        end = start + pd.Timedelta(days=30)
+        history = self.env.history.current([city], start, end)
+        history.rollups.query(city, start, end)
+        history.rollups.query(city)
+        history.distribution('aqi', city, start, end)
+        history.density('pm2.5', 'aqi', city, start, end)
+        ols_from_sums(history.period_sums('pm2.5', 'aqi', city, start, end))
+        history.period_correlation(city, start, end)
+        self.env.history.profile(city, start, end)
+        # As anomalias do índice inteiro ficam em cache pela revisão no app: não entram por interação
+        history.city_summary('aqi', start, end)
+
+    def run(self, iterations, start_at):
+        time.sleep(max(start_at - time.perf_counter(), 0))
+        actions = {'login': self.login, 'previsao': self.predict, 'lote': self.batch, 'analise': self.analyze}
+        for _ in range(iterations):
+            for step in STEPS:
+                started = time.perf_counter()
+                try:
+                    actions[step]()
+                    self.timings[step].append(time.perf_counter() - started)
+                except Exception as e:
+                    # AuthBusy (fila de login cheia) também conta como erro da etapa
+                    self.errors[step] += 1
+                    self.last_error[step] = f'{type(e).__name__}: {e}'
+                if self.think_seconds:
+                    time.sleep(self.rng.uniform(0, 2 * self.think_seconds))
+
+
+class MemorySampler:
+    """Amostra a memória residente do processo enquanto a carga roda."""
+
+    def __init__(self, interval=MEMORY_SAMPLE_SECONDS):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='memory-sampler', daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.samples.append(process_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.samples.append(process_rss_bytes())
+
+    def summary(self):
+        """Memória inicial, de pico e final (MB); None onde a medição não existe (Windows)."""
+        samples = [sample / 1024 ** 2 for sample in self.samples if sample is not None]
+        if not samples:
+            return {'inicial_mb': None, 'pico_mb': None, 'final_mb': None}
+        return {'inicial_mb': round(samples[0], 1), 'pico_mb': round(max(samples), 1),
+                'final_mb': round(samples[-1], 1)}
+
+
+def run_level(env, users, iterations, ramp_seconds=0.0, think_seconds=0.0):
+    """Roda ``users`` usuários simultâneos por ``iterations`` fluxos cada. Retorna o resultado do nível."""
+    virtual_users = [VirtualUser(env, seed, think_seconds) for seed in range(users)]
+    begin = time.perf_counter()
+    threads = [
+        threading.Thread(target=user.run, args=(iterations, begin + ramp_seconds * i / max(users, 1)),
+                         name=f'usuario-{i}')
+        for i, user in enumerate(virtual_users)
+    ]
+    with MemorySampler() as memory:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - begin
+
+    steps = {}
+    for step in STEPS:
+        timings = [t for user in virtual_users for t in user.timings[step]]
+        steps[step] = {
+            'amostras': len(timings),
+            'erros': sum(user.errors[step] for user in virtual_users),
+            'por_s': round(len(timings) / elapsed, 2) if elapsed > 0 else 0.0,
+            **percentiles(timings),
+        }
+        errors = [user.last_error[step] for user in virtual_users if step in user.last_error]
+        if errors:
+            steps[step]['ultimo_erro'] = errors[-1]
+    flows = min(steps[step]['amostras'] for step in STEPS)
+    batch_rows = sum(user.batch_rows for user in virtual_users)
+    return {
+        'usuarios': users,
+        'duracao_s': round(elapsed, 2),
+        'fluxos': flows,
+        'fluxos_por_s': round(flows / elapsed, 3) if elapsed > 0 else 0.0,
+        'linhas_lote_por_s': round(batch_rows / elapsed, 1) if elapsed > 0 else 0.0,
+        'etapas': steps,
+        'memoria': memory.summary(),
+    }
+
+
+def print_level(level):
+    memory = level['memoria']
+    memory = ('memória n/d' if memory['pico_mb'] is None
+              else f"memória {memory['inicial_mb']:.0f} → pico {memory['pico_mb']:.0f} MB")
+    print(f"\n{level['usuarios']} usuários: {level['fluxos']} fluxos em {level['duracao_s']:.1f}s "
+          f"({level['fluxos_por_s']:.2f} fluxos/s, {level['linhas_lote_por_s']:,.0f} linhas de lote/s), {memory}")
+    print(f"  {'etapa':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'por s':>9}{'erros':>7}")
+    for step, stats in level['etapas'].items():
+        cells = [f"{stats[k]:>10.1f}" if stats[k] is not None else f"{'-':>10}"
+                 for k in ('p50_ms', 'p95_ms', 'p99_ms')]
+        print(f"  {step:<10}{''.join(cells)}{stats['por_s']:>9.2f}{stats['erros']:>7}")
+
+
+def print_comparison(report, baseline):
+    """Variação de p95 e vazão em relação a um relatório anterior, nível a nível."""
+    previous = {level['usuarios']: level for level in baseline['niveis']}
+    print(f"\nComparação com {baseline.get('revisao') or '?'} ({baseline.get('data', '?')}):")
+    for level in report['niveis']:
+        old = previous.get(level['usuarios'])
+        if old is None:
+            continue
+
+        def change(new, before):
+            return f"{(new - before) / before * 100:+.0f}%" if new is not None and before else '-'
+        steps = ", ".join(
+            f"{step} p95 {change(stats['p95_ms'], old['etapas'].get(step, {}).get('p95_ms'))}"
+            for step, stats in level['etapas'].items()
+        )
+        print(f"  {level['usuarios']} usuários: fluxos/s {change(level['fluxos_por_s'], old['fluxos_por_s'])}, "
+              f"pico de memória {change(level['memoria']['pico_mb'], old['memoria']['pico_mb'])}; {steps}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Teste de carga local do fluxo do app.')
+    parser.add_argument('--users', default='1,5,10',
+                        help='usuários simultâneos; vários níveis separados por vírgula (padrão: 1,5,10)')
+    parser.add_argument('--iterations', type=int, default=3, help='fluxos completos por usuário (padrão: 3)')
+    parser.add_argument('--ramp-seconds', type=float, default=0.0, help='tempo para todos os usuários começarem')
+    parser.add_argument('--think-ms', type=float, default=0.0, help='pausa média entre as etapas de cada usuário')
+    parser.add_argument('--batch-file', default='test_data.csv',
+                        help='arquivo de lote (criado pelo generate_test_data.py se não existir)')
+    parser.add_argument('--model', help='modelo padrão (padrão: rf_model.joblib do manifesto de artefatos)')
+    parser.add_argument('--models-dir', default=MODELS_DIR, help='diretório dos modelos por cidade')
+    parser.add_argument('--qt', help='Quantile Transformer (padrão: qt.joblib do manifesto de artefatos)')
+    parser.add_argument('--history', help='histórico para a análise (padrão: airquality.csv do manifesto)')
+    parser.add_argument('--imputacao', choices=list(IMPUTATION_METHODS), default='interpolacao',
+                        help='preenchimento das células vazias do lote (padrão: interpolacao)')
+    parser.add_argument('--blank-fraction', type=float, default=BLANK_FRACTION,
+                        help=f'fração das células do lote esvaziadas (padrão: {BLANK_FRACTION})')
+    parser.add_argument('--output', help='grava o relatório em JSON')
+    parser.add_argument('--compare', help='relatório JSON anterior para comparação')
+    args = parser.parse_args(argv)
+
+    try:
+        levels = [int(value) for value in args.users.split(',') if value.strip()]
+    except ValueError:
+        parser.error('--users deve ser uma lista de inteiros')
+    try:
+        store = ArtifactStore() if None in (args.model, args.qt, args.history) else None
+        args.model = args.model or store.path('rf_model.joblib')
+        args.qt = args.qt or store.path('qt.joblib')
+        args.history = args.history or store.path('airquality.csv')
+    except ArtifactMissing as e:
+        parser.error(str(e))
+
+    with open('config.yaml') as f:
+        auth_config = (yaml.safe_load(f) or {}).get('auth')
+    with tempfile.TemporaryDirectory(prefix='aqi_carga_') as tmp:
+        print('Preparando modelos, usuário de teste e histórico...')
+        env = Environment(args.model, args.qt, args.history, args.batch_file, args.models_dir,
+                          auth_config, os.path.join(tmp, 'users.db'), os.path.join(tmp, 'historico'),
+                          args.imputacao, args.blank_fraction)
+        report = {
+            'revisao': git_revision(),
+            'data': datetime.now().isoformat(timespec='seconds'),
+            'ambiente': {'python': platform.python_version(), 'plataforma': platform.platform(),
+                         'cpus': os.cpu_count(), 'pandas': pd.__version__, 'numpy': np.__version__},
+            'parametros': {'iteracoes': args.iterations, 'rampa_s': args.ramp_seconds,
+                           'pausa_ms': args.think_ms, 'lote': args.batch_file,
+                           'imputacao': args.imputacao, 'celulas_vazias': args.blank_fraction,
+                           'linhas_lote': len(pd.read_csv(io.BytesIO(env.batch_bytes)))},
+            'niveis': [],
+        }
+        for users in levels:
+            level = run_level(env, users, args.iterations, args.ramp_seconds, args.think_ms / 1000)
+            report['niveis'].append(level)
+            print_level(level)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            print_comparison(report, json.load(f))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f'\nRelatório: {args.output}')
+    failed = sum(stats['erros'] for level in report['niveis'] for stats in level['etapas'].values())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
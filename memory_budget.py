@@ -0,0 +1,180 @@
+"""Memória por sessão e por cache, com limites e despejo de objetos grandes.
+
+Cada rerun registra a sessão atual e mede o que ela guarda no
+``session_state``. Chaves grandes são descartadas quando a sessão passa do
+limite ou fica ociosa por mais de ``idle_seconds`` (o próximo rerun dela
+recria o que precisar). As medições dos caches vêm do próprio Streamlit.
+"""
+import io
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SESSION_CAP_BYTES = 64 * 1024 ** 2
+IDLE_SECONDS = 15 * 60
+LARGE_OBJECT_BYTES = 1024 ** 2
+HISTORY_LIMIT = 200
+# Chaves que nunca são despejadas (login e navegação)
+PROTECTED_KEYS = {'authentication_status', 'username', 'name', 'auth_token', 'show_register', 'logout'}
+
+
+def object_bytes(obj, _seen=None):
+    """Estimativa da memória de ``obj``, somando uma única vez os objetos compartilhados."""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(obj, pd.DataFrame) else usage)
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, io.BytesIO):
+        return obj.getbuffer().nbytes
+    if isinstance(obj, (bytes, bytearray, str)):
+        return sys.getsizeof(obj)
+    if type(obj).__name__ == 'Styler':
+        return object_bytes(obj.data, seen)
+    if hasattr(obj, 'to_plotly_json'):
+        return object_bytes(obj.to_plotly_json(), seen)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(object_bytes(k, seen) + object_bytes(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(object_bytes(item, seen) for item in obj)
+    return sys.getsizeof(obj)
+
+
+def process_rss_bytes():
+    """Memória residente atual do processo (pico, fora do Linux; None no Windows)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def cache_usage(stats):
+    """Agrupa ``CacheStat`` do Streamlit por (categoria, função): entradas e bytes."""
+    grouped = defaultdict(lambda: [0, 0])
+    for stat in stats:
+        entry = grouped[(stat.category_name, stat.cache_name)]
+        entry[0] += 1
+        entry[1] += stat.byte_length
+    return sorted(
+        ({'categoria': category, 'cache': name, 'entradas': count, 'mb': round(size / 1024 ** 2, 2)}
+         for (category, name), (count, size) in grouped.items()),
+        key=lambda row: row['mb'], reverse=True
+    )
+
+
+class SessionMemory:
+    """Sessões ativas do processo e o tamanho de cada chave do ``session_state`` delas."""
+
+    def __init__(self, cap_bytes=SESSION_CAP_BYTES, idle_seconds=IDLE_SECONDS,
+                 large_object_bytes=LARGE_OBJECT_BYTES, history_limit=HISTORY_LIMIT):
+        self.cap_bytes = cap_bytes
+        self.idle_seconds = idle_seconds
+        self.large_object_bytes = large_object_bytes
+        self.history_limit = history_limit
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _measure(self, state):
+        sizes = {}
+        for key, value in state.filtered_state.items():
+            sizes[key] = object_bytes(value)
+        return sizes
+
+    def _evict(self, session, keys):
+        state = session['estado']
+        for key in keys:
+            try:
+                del state[key]
+            except KeyError:
+                continue
+            session['despejado_mb'] += session['bytes'].pop(key, 0) / 1024 ** 2
+            session['despejos'] += 1
+
+    def _evictable(self, sizes):
+        """Chaves grandes, da maior para a menor."""
+        return sorted(
+            (key for key, size in sizes.items()
+             if size >= self.large_object_bytes and key not in PROTECTED_KEYS),
+            key=sizes.get, reverse=True
+        )
+
+    def track(self, session_id, user, state):
+        """Registra o rerun da sessão, aplica o limite a ela e despeja as sessões ociosas.
+
+        ``state`` é o ``session_state`` da sessão (acessível de outras threads).
+        Retorna as chaves despejadas desta sessão.
+        """
+        now = time.time()
+        with self._lock:
+            session = self._sessions.setdefault(session_id, {
+                'usuario': user, 'estado': state, 'bytes': {}, 'despejos': 0, 'despejado_mb': 0.0
+            })
+            session.update(usuario=user, estado=state, visto_em=now)
+            session['bytes'] = self._measure(state)
+            evicted = []
+            total = sum(session['bytes'].values())
+            for key in self._evictable(session['bytes']):
+                if total <= self.cap_bytes:
+                    break
+                total -= session['bytes'][key]
+                evicted.append(key)
+            self._evict(session, evicted)
+            self._evict_idle(now)
+        return evicted
+
+    def _evict_idle(self, now):
+        for session_id, session in list(self._sessions.items()):
+            idle = now - session['visto_em']
+            if idle > self.idle_seconds:
+                self._evict(session, self._evictable(session['bytes']))
+            # Sessões paradas há muito tempo deixam de ser acompanhadas
+            if idle > 4 * self.idle_seconds:
+                del self._sessions[session_id]
+
+    def evict_idle(self):
+        """Despeja agora os objetos grandes das sessões ociosas."""
+        with self._lock:
+            self._evict_idle(time.time())
+
+    def trim_history(self, history):
+        """Mantém só as ``history_limit`` entradas mais recentes de uma lista de histórico."""
+        if len(history) > self.history_limit:
+            del history[:len(history) - self.history_limit]
+        return history
+
+    def stats(self):
+        """Sessões da que mais ocupa para a que menos ocupa."""
+        now = time.time()
+        with self._lock:
+            rows = []
+            for session_id, session in self._sessions.items():
+                sizes = session['bytes']
+                largest = sorted(sizes, key=sizes.get, reverse=True)[:3]
+                rows.append({
+                    'sessao': session_id[:8],
+                    'usuario': session['usuario'],
+                    'mb': round(sum(sizes.values()) / 1024 ** 2, 3),
+                    'ociosa_min': round((now - session['visto_em']) / 60, 1),
+                    'maiores_chaves': ", ".join(f"{key} ({sizes[key] / 1024:.0f} KB)" for key in largest),
+                    'despejos': session['despejos'],
+                    'despejado_mb': round(session['despejado_mb'], 2),
+                })
+        return sorted(rows, key=lambda row: row['mb'], reverse=True)
@@ -0,0 +1,225 @@
+"""Registro de modelos por cidade com recarga a quente.
+
+Os artefatos ficam em ``models/<cidade>/<versao>.joblib``. A versão mais
+recente (ordem lexicográfica do nome do arquivo) de cada cidade é a ativa;
+o modelo global ``rf_model.joblib`` continua servindo como padrão para
+cidades sem modelo próprio.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import joblib
+
+DEFAULT_KEY = "default"
+MODELS_DIR = "models"
+
+
+def city_key(city):
+    """Normaliza o nome da cidade para uso como chave/diretório."""
+    if city is None:
+        return DEFAULT_KEY
+    key = re.sub(r'[^a-z0-9]+', '_', str(city).strip().lower()).strip('_')
+    return key or DEFAULT_KEY
+
+
+def estimate_model_bytes(model):
+    """Estima a memória ocupada por um modelo baseado em árvores."""
+    estimators = getattr(model, 'estimators_', None)
+    if estimators is None:
+        tree = getattr(model, 'tree_', None)
+        estimators = [model] if tree is not None else []
+    total = 0
+    for est in estimators:
+        tree = est.tree_
+        state = tree.__getstate__()
+        total += state['nodes'].nbytes + state['values'].nbytes
+    if total == 0:
+        total = sys.getsizeof(model)
+    return total
+
+
+@dataclass
+class ModelVersion:
+    key: str
+    version: str
+    path: str
+    model: object
+    load_seconds: float
+    memory_bytes: int
+    loaded_at: float = field(default_factory=time.time)
+
+
+# ``_swap`` sem verificação da versão substituída
+_ANY = object()
+
+
+@dataclass
+class _Slot:
+    current: ModelVersion = None
+    previous: ModelVersion = None
+    # Após um rollback a cidade fica fixada até uma nova carga explícita
+    pinned: bool = False
+
+
+class ModelRegistry:
+    """Mantém um modelo ativo (e o anterior, para rollback) por cidade.
+
+    A troca de versão é uma única atribuição feita sob lock, então leituras
+    concorrentes sempre veem uma versão completa, nunca um modelo parcial.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, default_path='rf_model.joblib', max_workers=2):
+        self.models_dir = models_dir
+        self.default_path = default_path
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='model-warmup')
+        self._pending = {}
+
+    # ------------------------------------------------------------------
+    # Descoberta de artefatos
+    # ------------------------------------------------------------------
+    def available_versions(self, key):
+        """Lista as versões disponíveis em disco para uma cidade, da mais antiga à mais nova."""
+        if key == DEFAULT_KEY:
+            if not os.path.exists(self.default_path):
+                return []
+            # O modelo global é versionado pela data de modificação do arquivo
+            version = time.strftime('%Y%m%d%H%M%S', time.localtime(os.path.getmtime(self.default_path)))
+            return [(version, self.default_path)]
+        directory = os.path.join(self.models_dir, key)
+        if not os.path.isdir(directory):
+            return []
+        files = sorted(f for f in os.listdir(directory) if f.endswith('.joblib'))
+        return [(os.path.splitext(f)[0], os.path.join(directory, f)) for f in files]
+
+    def discover(self):
+        """Retorna as chaves de cidade com artefatos no diretório de modelos."""
+        keys = [DEFAULT_KEY] if os.path.exists(self.default_path) else []
+        if os.path.isdir(self.models_dir):
+            keys.extend(
+                sorted(d for d in os.listdir(self.models_dir)
+                       if os.path.isdir(os.path.join(self.models_dir, d)))
+            )
+        return keys
+
+    # ------------------------------------------------------------------
+    # Carga e troca
+    # ------------------------------------------------------------------
+    def _load(self, key, version, path):
+        start = time.perf_counter()
+        model = joblib.load(path)
+        elapsed = time.perf_counter() - start
+        return ModelVersion(key, version, path, model, elapsed, estimate_model_bytes(model))
+
+    def _swap(self, entry, replaces=_ANY):
+        """Ativa ``entry``.
+
+        Com ``replaces`` (a versão ativa lida antes da carga), a troca é descartada se um
+        rollback fixou outra versão nesse meio-tempo.
+        """
+        with self._lock:
+            slot = self._slots.setdefault(entry.key, _Slot())
+            if slot.current is not None and slot.current.version == entry.version \
+                    and slot.current.path == entry.path:
+                return slot.current
+            if replaces is not _ANY and slot.pinned and slot.current is not replaces:
+                return slot.current
+            slot.previous, slot.current = slot.current, entry
+            slot.pinned = False
+            return entry
+
+    def register(self, key, model, version='base', path='', load_seconds=0.0):
+        """Registra um modelo já carregado (ex.: pelo aquecimento), com o tempo que a carga levou."""
+        entry = ModelVersion(key, version, path, model, load_seconds, estimate_model_bytes(model))
+        return self._swap(entry)
+
+    def load_latest(self, key):
+        """Carrega de forma síncrona a versão mais recente de uma cidade e a ativa.
+
+        Uma carga explícita também desfaz a fixação deixada por um rollback.
+        """
+        versions = self.available_versions(key)
+        if not versions:
+            return None
+        version, path = versions[-1]
+        with self._lock:
+            slot = self._slots.get(key)
+            current = slot.current if slot is not None else None
+            if current is not None and current.version == version and current.path == path:
+                slot.pinned = False
+                return current
+        # Um rollback durante a carga prevalece sobre ela
+        return self._swap(self._load(key, version, path), replaces=current)
+
+    def warm_up(self, keys=None):
+        """Agenda em segundo plano a carga da versão mais recente de cada cidade."""
+        keys = self.discover() if keys is None else keys
+        futures = {}
+        with self._lock:
+            for key in keys:
+                future = self._pending.get(key)
+                if future is None or future.done():
+                    future = self._executor.submit(self.load_latest, key)
+                    self._pending[key] = future
+                futures[key] = future
+        return futures
+
+    def refresh(self):
+        """Recarrega em segundo plano as cidades com versão nova em disco."""
+        stale = []
+        for key in self.discover():
+            slot = self._slots.get(key)
+            if slot is not None and slot.pinned:
+                continue
+            versions = self.available_versions(key)
+            current = self.current(key)
+            if versions and (current is None or versions[-1] != (current.version, current.path)):
+                stale.append(key)
+        return self.warm_up(stale) if stale else {}
+
+    def rollback(self, key):
+        """Volta instantaneamente para a versão anterior de uma cidade."""
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None or slot.previous is None:
+                return False
+            slot.current, slot.previous = slot.previous, slot.current
+            slot.pinned = True
+            return True
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+    def current(self, key):
+        slot = self._slots.get(key)
+        return slot.current if slot is not None else None
+
+    def get(self, city=None):
+        """Retorna o modelo ativo da cidade, ou o padrão se ela não tiver modelo próprio."""
+        entry = self.current(city_key(city)) or self.current(DEFAULT_KEY)
+        return entry.model if entry is not None else None
+
+    def cities(self):
+        return [key for key, slot in self._slots.items() if slot.current is not None]
+
+    def stats(self):
+        """Resumo por modelo: versão ativa, anterior, tempo de carga e memória."""
+        rows = []
+        for key, slot in sorted(self._slots.items()):
+            if slot.current is None:
+                continue
+            rows.append({
+                'cidade': key,
+                'versao': slot.current.version,
+                'versao_anterior': slot.previous.version if slot.previous else None,
+                'tempo_carga_s': round(slot.current.load_seconds, 3),
+                'memoria_mb': round(slot.current.memory_bytes / 1024 ** 2, 2),
+                'carregado_em': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(slot.current.loaded_at)),
+            })
+        return rows
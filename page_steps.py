@@ -0,0 +1,136 @@
+"""Trabalho de cada página do app, sem Streamlit.
+
+O ``app.py`` chama estas funções (com os caches por cima) e o ``loadtest.py``
+chama as mesmas, então o teste de carga mede o que as páginas calculam. O que
+depende do histórico fica em ``history_views.py``.
+"""
+import numpy as np
+import pandas as pd
+
+from batch_io import read_header, check_schema, read_batch, invalid_rows, as_float32
+from imputation import impute_batch
+from pipeline import (normalize_inputs, feature_contributions, predict_with_interval, score_chunk,
+                      finalize_batch, incomplete_rows, batch_moments, batch_insights,
+                      REQUIRED_COLUMNS, POLLUTANT_LIMITS)
+from rollups import aggregate, choose_grain
+from sensitivity import sensitivity_sweeps, sensitivity_grid
+from summaries import histogram_summary, box_summary
+
+# Faixas das varreduras "e se?": as mesmas aceitas na previsão individual
+WHAT_IF_RANGES = tuple((p, (POLLUTANT_LIMITS[p]['min'], POLLUTANT_LIMITS[p]['max'])) for p in REQUIRED_COLUMNS)
+WHAT_IF_POINTS = 50
+WHAT_IF_GRID_POINTS = 32
+
+
+class UploadRejected(ValueError):
+    """Arquivo de lote recusado antes da previsão (colunas ausentes ou valores inválidos)."""
+
+
+# Previsão individual
+
+def _vector_frame(vector):
+    return pd.DataFrame([vector], columns=REQUIRED_COLUMNS)
+
+
+def predict_vector(registry, qt, vector, city=None):
+    """AQI previsto para um vetor de poluentes (na ordem de ``REQUIRED_COLUMNS``)."""
+    return float(registry.get(city).predict(normalize_inputs(qt, _vector_frame(vector)))[0])
+
+
+def explain_vector(registry, qt, vector, city=None):
+    """Contribuições de cada poluente e intervalo entre as árvores. Retorna ``(explanation, (inferior, superior))``."""
+    model = registry.get(city)
+    normalized = normalize_inputs(qt, _vector_frame(vector))
+    bias, contributions = feature_contributions(model, normalized)
+    explanation = dict(zip(REQUIRED_COLUMNS, contributions[0]))
+    explanation['base'] = bias
+    _, bounds = predict_with_interval(model, normalized)
+    return explanation, (float(bounds[0, 0]), float(bounds[-1, 0]))
+
+
+def what_if_sweeps(registry, qt, vector, city=None, ranges=WHAT_IF_RANGES, points=WHAT_IF_POINTS):
+    return sensitivity_sweeps(registry.get(city), qt, dict(zip(REQUIRED_COLUMNS, vector)), dict(ranges), points)
+
+
+def what_if_grid(registry, qt, vector, city, x_pollutant, y_pollutant, ranges=WHAT_IF_RANGES,
+                 points=WHAT_IF_GRID_POINTS):
+    ranges = dict(ranges)
+    return sensitivity_grid(
+        registry.get(city), qt, dict(zip(REQUIRED_COLUMNS, vector)),
+        x_pollutant, y_pollutant, ranges[x_pollutant], ranges[y_pollutant], points
+    )
+
+
+def what_if_axes(ranking):
+    """Eixos iniciais da grade: o poluente que mais altera o AQI e o primeiro dos demais."""
+    x_pollutant = ranking.index[0]
+    return x_pollutant, next(p for p in REQUIRED_COLUMNS if p != x_pollutant)
+
+
+# Previsão em lote
+
+def load_upload(file, filename):
+    """Lê um arquivo de lote: confere as colunas pelo cabeçalho, lê só as usadas e valida os valores.
+
+    Retorna o DataFrame com os poluentes em float32; levanta ``UploadRejected``.
+    """
+    header = read_header(file, filename)
+    missing = check_schema(header)
+    if missing:
+        raise UploadRejected(f"Colunas ausentes no arquivo: {', '.join(missing)}")
+    input_df = read_batch(file, filename, header)
+    invalid = invalid_rows(input_df)
+    if invalid:
+        raise UploadRejected(f"Linhas com valores inválidos: {', '.join(map(str, invalid))}")
+    return as_float32(input_df)
+
+
+def impute_upload(input_df, method):
+    """Preenche as células vazias. Retorna ``(input_df, células preenchidas, linhas ainda incompletas)``.
+
+    As linhas incompletas (numeradas a partir de 1) ficam sem previsão.
+    """
+    input_df, filled = impute_batch(input_df, method, REQUIRED_COLUMNS)
+    return input_df, filled, np.flatnonzero(incomplete_rows(input_df)) + 1
+
+
+def score_upload(registry, qt, input_df, progress=None):
+    """Previsões e anomalias do lote inteiro. Retorna ``(results_df, anomaly_stats)``.
+
+    ``progress(fração, texto)``, se informado, recebe o andamento de cada etapa.
+    """
+    if progress:
+        progress(0.3, "Realizando previsões...")
+    results_df = score_chunk(registry, qt, input_df)
+    if progress:
+        progress(0.6, "Detectando anomalias...")
+    results_df, anomaly_stats = finalize_batch(results_df)
+    if progress:
+        progress(0.9, None)
+    return results_df, anomaly_stats
+
+
+def batch_summaries(results_df):
+    """Resumos dos gráficos do resultado de um lote.
+
+    Chaves: ``hist`` (contagens, bordas), ``box``, ``time`` (resolução, série;
+    None sem datas), ``corr``, ``means``, ``contrib`` e ``insights``.
+    """
+    predictions = results_df['aqi_prediction'].to_numpy()
+    summaries = {'hist': histogram_summary(predictions), 'box': box_summary(predictions), 'time': None}
+    if 'date' in results_df.columns:
+        # AQI ao longo do tempo, agregado na resolução adequada ao período do arquivo
+        dated = pd.DataFrame({
+            'date': pd.to_datetime(results_df['date'], errors='coerce'),
+            'aqi_prediction': results_df['aqi_prediction']
+        }).dropna(subset=['date'])
+        if len(dated):
+            grain = choose_grain(dated['date'].min(), dated['date'].max())
+            summaries['time'] = (grain, aggregate(dated, ['aqi_prediction'], grain))
+    # Co-momentos numa passada; os insights reaproveitam os mesmos
+    moments = batch_moments(results_df)
+    summaries['corr'] = moments.correlation()
+    summaries['means'] = results_df[REQUIRED_COLUMNS].mean()
+    summaries['contrib'] = results_df[[f'contrib_{p}' for p in REQUIRED_COLUMNS]].abs().mean()
+    summaries['insights'] = batch_insights(results_df, moments)
+    return summaries
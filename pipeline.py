@@ -0,0 +1,261 @@
+"""Etapas de pré-processamento e previsão compartilhadas pelas páginas do app."""
+import time
+import weakref
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from anomalies import detect_anomalies
+from artifacts import ArtifactStore
+from correlations import CoMoments
+
+REQUIRED_COLUMNS = ['co', 'no2', 'so2', 'o3', 'pm2.5', 'pm10']
+# Colunas numéricas do histórico: AQI e poluentes
+HISTORY_VALUE_COLUMNS = ['aqi'] + REQUIRED_COLUMNS
+# Faixas aceitas na previsão individual e usadas no perfil de qualidade dos dados
+POLLUTANT_LIMITS = {
+    'co': {'min': 0.0, 'max': 1000.0, 'ref': 290.0, 'unit': 'μg/m³'},
+    'no2': {'min': 0.0, 'max': 100.0, 'ref': 25.0, 'unit': 'μg/m³'},
+    'so2': {'min': 0.0, 'max': 50.0, 'ref': 1.0, 'unit': 'μg/m³'},
+    'o3': {'min': 0.0, 'max': 100.0, 'ref': 25.0, 'unit': 'μg/m³'},
+    'pm2.5': {'min': 0.0, 'max': 100.0, 'ref': 10.0, 'unit': 'μg/m³'},
+    'pm10': {'min': 0.0, 'max': 150.0, 'ref': 15.0, 'unit': 'μg/m³'}
+}
+# Colunas da matriz de correlação e dos insights do lote
+INSIGHT_COLUMNS = ['aqi_prediction'] + REQUIRED_COLUMNS
+
+
+def normalize_inputs(qt, input_df):
+    """Normaliza os poluentes com o Quantile Transformer pré-treinado.
+
+    O transformer foi ajustado com a coluna 'aqi' junto, então ela é
+    preenchida com zero apenas para a transformação e descartada depois.
+    """
+    input_with_aqi = input_df[REQUIRED_COLUMNS].copy()
+    input_with_aqi['aqi'] = 0  # Valor temporário para a transformação
+    normalized = pd.DataFrame(
+        qt.transform(input_with_aqi),
+        columns=input_with_aqi.columns,
+        index=input_df.index
+    )
+    return normalized.drop('aqi', axis=1)
+
+
+# ----------------------------------------------------------------------
+# Contribuição dos poluentes (decomposição pelos caminhos das árvores)
+# ----------------------------------------------------------------------
+_leaf_contributions = weakref.WeakKeyDictionary()
+
+
+def _tree_leaf_contributions(tree, n_features):
+    """Contribuição acumulada por variável em cada nó de uma árvore.
+
+    Cada nó soma a variação do valor previsto em relação ao pai, atribuída
+    à variável usada na divisão do pai. Como a contribuição de uma amostra
+    depende só da folha onde ela cai, basta indexar esta tabela pela folha.
+    """
+    values = tree.value[:, 0, 0]
+    internal = np.flatnonzero(tree.children_left != -1)
+    parent = np.full(tree.node_count, -1)
+    parent[tree.children_left[internal]] = internal
+    parent[tree.children_right[internal]] = internal
+
+    depth = np.zeros(tree.node_count, dtype=np.int64)
+    # Os filhos sempre têm índice maior que o pai, então uma passada em ordem basta
+    for node in internal:
+        depth[tree.children_left[node]] = depth[tree.children_right[node]] = depth[node] + 1
+
+    cumulative = np.zeros((tree.node_count, n_features))
+    for level in range(1, depth.max() + 1):
+        nodes = np.flatnonzero(depth == level)
+        parents = parent[nodes]
+        cumulative[nodes] = cumulative[parents]
+        cumulative[nodes, tree.feature[parents]] += values[nodes] - values[parents]
+    return cumulative, values[0]
+
+
+def _leaf_tables(model):
+    cached = _leaf_contributions.get(model)
+    if cached is None:
+        estimators = getattr(model, 'estimators_', [model])
+        tables = [_tree_leaf_contributions(est.tree_, model.n_features_in_) for est in estimators]
+        cached = ([table for table, _ in tables], float(np.mean([bias for _, bias in tables])))
+        _leaf_contributions[model] = cached
+    return cached
+
+
+def _apply(model, normalized):
+    leaves = model.apply(normalized)
+    return leaves[:, None] if leaves.ndim == 1 else leaves
+
+
+def feature_contributions(model, normalized, leaves=None):
+    """Calcula viés e contribuição de cada poluente para as previsões do modelo.
+
+    Retorna ``(bias, contributions)``, com ``bias + contributions.sum(axis=1)``
+    igual à previsão. O custo é o de ``model.apply`` (o mesmo percurso do
+    ``predict``) mais uma indexação por árvore.
+    """
+    tables, bias = _leaf_tables(model)
+    leaves = _apply(model, normalized) if leaves is None else leaves
+    contributions = np.zeros((leaves.shape[0], model.n_features_in_))
+    for i, table in enumerate(tables):
+        contributions += table[leaves[:, i]]
+    contributions /= len(tables)
+    return bias, contributions
+
+
+# ----------------------------------------------------------------------
+# Intervalos a partir das previsões de cada árvore
+# ----------------------------------------------------------------------
+PREDICTION_QUANTILES = (0.05, 0.95)
+_leaf_values = weakref.WeakKeyDictionary()
+
+
+def interval_columns(quantiles=PREDICTION_QUANTILES):
+    return [f'aqi_p{round(q * 100):02d}' for q in quantiles]
+
+
+def _leaf_value_table(model):
+    """Valores dos nós de todas as árvores num único vetor, com o deslocamento de cada árvore."""
+    cached = _leaf_values.get(model)
+    if cached is None:
+        estimators = getattr(model, 'estimators_', [model])
+        values = [est.tree_.value[:, 0, 0] for est in estimators]
+        offsets = np.cumsum([0] + [len(v) for v in values[:-1]])
+        cached = (np.concatenate(values), offsets)
+        _leaf_values[model] = cached
+    return cached
+
+
+def tree_predictions(model, normalized, leaves=None):
+    """Previsão de cada árvore, matriz (amostras × árvores), numa única indexação."""
+    values, offsets = _leaf_value_table(model)
+    leaves = _apply(model, normalized) if leaves is None else leaves
+    return values[leaves + offsets]
+
+
+def predict_with_interval(model, normalized, quantiles=PREDICTION_QUANTILES, leaves=None):
+    """Média das árvores (igual ao ``predict``) e quantis entre elas: ``(mean, bounds)``.
+
+    ``bounds`` tem uma linha por quantil. O intervalo mede a discordância
+    entre as árvores, não o erro de medição dos poluentes.
+    """
+    per_tree = tree_predictions(model, normalized, leaves)
+    return per_tree.mean(axis=1), np.quantile(per_tree, quantiles, axis=1)
+
+
+def explain_frame(registry, qt, input_df, city_column='city', normalized=None, quantiles=PREDICTION_QUANTILES):
+    """Previsão, intervalo e contribuições por linha, com um único ``apply`` por modelo.
+
+    Colunas: ``aqi_prediction``, ``aqi_pXX`` (um por quantil),
+    ``contrib_<poluente>`` e ``contrib_base``.
+    """
+    normalized = normalize_inputs(qt, input_df) if normalized is None else normalized
+    contrib_columns = [f'contrib_{col}' for col in REQUIRED_COLUMNS]
+    columns = ['aqi_prediction'] + interval_columns(quantiles) + contrib_columns + ['contrib_base']
+    values = np.zeros((len(input_df), len(columns)))
+    if city_column in input_df.columns:
+        cities = input_df[city_column].fillna('').astype(str).to_numpy()
+    else:
+        cities = np.full(len(input_df), '', dtype=object)
+    n_bounds = len(quantiles)
+    for city in pd.unique(cities):
+        idx = np.flatnonzero(cities == city)
+        model = registry.get(city or None)
+        leaves = _apply(model, normalized.iloc[idx])
+        mean, bounds = predict_with_interval(model, None, quantiles, leaves)
+        bias, contributions = feature_contributions(model, None, leaves)
+        values[idx, 0] = mean
+        values[idx, 1:1 + n_bounds] = bounds.T
+        values[idx, 1 + n_bounds:-1] = contributions
+        values[idx, -1] = bias
+    return pd.DataFrame(values, index=input_df.index, columns=columns)
+
+
+def benchmark_interval_overhead(model, normalized, repeat=5):
+    """Tempo médio (ms) de ``predict`` comparado ao de ``predict_with_interval``."""
+    timings = {}
+    for name, fn in (('predict', lambda: model.predict(normalized)),
+                     ('intervalo', lambda: predict_with_interval(model, normalized))):
+        fn()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        timings[f'{name}_ms'] = (time.perf_counter() - started) * 1000 / repeat
+    timings['sobrecarga'] = timings['intervalo_ms'] / timings['predict_ms']
+    return timings
+
+
+def incomplete_rows(input_df):
+    """Máscara das linhas com algum poluente vazio (mesmo após a imputação)."""
+    return input_df[REQUIRED_COLUMNS].isna().any(axis=1).to_numpy()
+
+
+def score_chunk(registry, qt, input_df, city_column='city'):
+    """Previsões, intervalos e contribuições de um bloco de linhas (independe dos demais blocos).
+
+    Linhas com poluente vazio não são enviadas ao modelo (a floresta mandaria o NaN
+    para um dos ramos sem aviso): ficam com as colunas de previsão vazias.
+    """
+    incomplete = incomplete_rows(input_df)
+    if not incomplete.any():
+        return pd.concat([input_df, explain_frame(registry, qt, input_df, city_column)], axis=1)
+    scored = explain_frame(registry, qt, input_df[~incomplete], city_column)
+    explained = pd.DataFrame(np.nan, index=input_df.index, columns=scored.columns)
+    explained.iloc[np.flatnonzero(~incomplete)] = scored.to_numpy()
+    return pd.concat([input_df, explained], axis=1)
+
+
+def finalize_batch(results_df, city_column='city', window=30, date_column='date'):
+    """Etapas que precisam do lote inteiro: detecção de anomalias.
+
+    Com a coluna de datas, as janelas móveis seguem a ordem (cidade, data), como
+    no histórico, e não a ordem das linhas do arquivo; o resultado mantém a ordem
+    original. Retorna ``(results_df, anomaly_stats)``.
+    """
+    if date_column not in results_df.columns:
+        flags, anomaly_stats = detect_anomalies(
+            results_df, REQUIRED_COLUMNS, group_column=city_column, window=window
+        )
+        return pd.concat([results_df, flags], axis=1), anomaly_stats
+    times = pd.to_datetime(results_df[date_column], errors='coerce', utc=True)
+    keys = [times.to_numpy(dtype='datetime64[ns]').astype(np.int64)]
+    if city_column in results_df.columns:
+        keys.append(pd.factorize(results_df[city_column].fillna('').astype(str))[0])
+    order = np.lexsort(keys)
+    flags, anomaly_stats = detect_anomalies(
+        results_df.iloc[order], REQUIRED_COLUMNS, group_column=city_column, window=window
+    )
+    # Volta as marcações para a ordem das linhas do arquivo
+    flags = flags.iloc[np.argsort(order)].set_axis(results_df.index)
+    return pd.concat([results_df, flags], axis=1), anomaly_stats
+
+
+def batch_moments(results_df):
+    """Co-momentos das ``INSIGHT_COLUMNS`` do lote, numa passada."""
+    return CoMoments.from_frame(results_df, INSIGHT_COLUMNS)
+
+
+def batch_insights(results_df, moments=None):
+    """Poluente mais correlacionado com o AQI previsto e o de maior variação relativa (CV).
+
+    Com ``moments`` (co-momentos já acumulados, ex.: bloco a bloco) o lote não é relido.
+    """
+    moments = batch_moments(results_df) if moments is None else moments
+    most_corr, corr = moments.most_correlated('aqi_prediction')
+    cv = moments.std()[REQUIRED_COLUMNS] / moments.means()[REQUIRED_COLUMNS]
+    most_variable = cv.idxmax()
+    return {
+        'most_corr': (most_corr, corr),
+        'most_variable': (most_variable, float(cv[most_variable])),
+    }
+
+
+if __name__ == '__main__':
+    store = ArtifactStore()
+    history = pd.read_csv(store.path('airquality.csv'))
+    history.columns = history.columns.str.lower()
+    normalized = normalize_inputs(joblib.load(store.path('qt.joblib')), history)
+    print(benchmark_interval_overhead(joblib.load(store.path('rf_model.joblib')), normalized))
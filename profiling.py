@@ -0,0 +1,161 @@
+"""Perfil de qualidade dos dados numa única passada vetorizada.
+
+Para um conjunto de leituras calcula, sem laços por linha:
+
+- valores faltantes e fora da faixa válida de cada poluente;
+- datas repetidas (mesma cidade e data);
+- lacunas na série de cada cidade, pelo intervalo típico entre leituras;
+- sensores travados: ``stuck_run`` ou mais leituras seguidas com o mesmo valor.
+
+    python profiling.py airquality.csv
+"""
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from pipeline import POLLUTANT_LIMITS
+
+# Faixas válidas (mínimo, máximo) de cada coluna
+VALID_RANGES = {**{p: (limits['min'], limits['max']) for p, limits in POLLUTANT_LIMITS.items()},
+                'aqi': (0.0, 500.0)}
+# Leituras seguidas com o mesmo valor a partir das quais o sensor é considerado travado
+STUCK_RUN = 12
+
+
+def _city_codes(df, city_column):
+    if city_column not in df.columns:
+        return np.zeros(len(df), dtype=np.int64), ['todas']
+    codes, cities = pd.factorize(df[city_column], use_na_sentinel=False)
+    return codes.astype(np.int64), list(cities)
+
+
+def _stuck_runs(values, same_series, stuck_run):
+    """Trechos travados por coluna: ``(quantidade de trechos, leituras nesses trechos)``."""
+    n, k = values.shape
+    if n == 0:
+        return np.zeros(k, dtype=np.int64), np.zeros(k, dtype=np.int64)
+    # Cada coluna vira um trecho da sequência achatada; um trecho novo começa a cada mudança
+    # de valor, de série (cidade) ou em NaN
+    starts = np.ones((k, n), dtype=bool)
+    starts[:, 1:] = ~((values[1:] == values[:-1]) & same_series[:, None]).T
+    run_ids = np.cumsum(starts.ravel()) - 1
+    lengths = np.bincount(run_ids)
+    first = np.flatnonzero(starts.ravel())
+    column = first // n
+    stuck = (lengths >= stuck_run) & ~np.isnan(values.T.ravel()[first])
+    return (np.bincount(column[stuck], minlength=k),
+            np.bincount(column[stuck], weights=lengths[stuck], minlength=k).astype(np.int64))
+
+
+def profile_readings(df, columns, city_column='city', date_column='date', ranges=None, stuck_run=STUCK_RUN):
+    """Perfil de qualidade de ``df``.
+
+    Retorna um dict com ``linhas``, ``segundos``, ``colunas`` (DataFrame por coluna),
+    ``cidades`` (DataFrame por cidade, se houver datas), ``duplicadas``,
+    ``datas_invalidas`` e ``intervalo`` (passo típico entre leituras).
+    """
+    started = time.perf_counter()
+    ranges = VALID_RANGES if ranges is None else ranges
+    columns = [col for col in columns if col in df.columns]
+    values = df[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    n = len(values)
+    codes, cities = _city_codes(df, city_column)
+
+    has_dates = date_column in df.columns
+    if has_dates:
+        dates = pd.to_datetime(df[date_column], errors='coerce', utc=True)
+        invalid_dates = int(dates.isna().sum())
+        times = dates.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        # Ordem por (cidade, data) para comparar cada leitura com a anterior da mesma série;
+        # NaT fica no início e não forma lacunas nem repetições
+        order = np.lexsort((times, codes))
+        if not (np.all(np.diff(order) == 1)):
+            values, codes, times = values[order], codes[order], times[order]
+    else:
+        invalid_dates = 0
+        times = None
+
+    missing = np.isnan(values)
+    low = np.array([ranges.get(col, (-np.inf, np.inf))[0] for col in columns])
+    high = np.array([ranges.get(col, (-np.inf, np.inf))[1] for col in columns])
+    below = (values < low).sum(axis=0)
+    above = (values > high).sum(axis=0)
+    same_series = codes[1:] == codes[:-1]
+    if has_dates:
+        valid_time = times != np.iinfo(np.int64).min
+        same_series &= valid_time[1:] & valid_time[:-1]
+    stuck_counts, stuck_rows = _stuck_runs(values, same_series, stuck_run)
+
+    with warnings.catch_warnings():
+        # Colunas inteiramente vazias resultam em NaN nas estatísticas
+        warnings.simplefilter('ignore', RuntimeWarning)
+        column_stats = pd.DataFrame({
+            'faltantes': missing.sum(axis=0),
+            'faltantes_pct': missing.mean(axis=0) * 100 if n else 0.0,
+            'abaixo_min': below,
+            'acima_max': above,
+            'fora_faixa_pct': (below + above) / max(n, 1) * 100,
+            'travamentos': stuck_counts,
+            'leituras_travadas': stuck_rows,
+            'min': np.nanmin(values, axis=0) if n else np.nan,
+            'media': np.nanmean(values, axis=0) if n else np.nan,
+            'max': np.nanmax(values, axis=0) if n else np.nan,
+        }, index=columns)
+
+    profile = {
+        'linhas': n,
+        'colunas': column_stats,
+        'cidades': None,
+        'duplicadas': 0,
+        'datas_invalidas': invalid_dates,
+        'intervalo': None,
+    }
+    if has_dates and n > 1:
+        steps = np.diff(times)
+        counted = same_series
+        duplicated = counted & (steps == 0)
+        positive = steps[counted & (steps > 0)]
+        if len(positive):
+            # Passo típico entre leituras (1 hora no histórico); acima dele há lacuna
+            interval = int(np.median(positive))
+            gap = counted & (steps > interval)
+            missing_steps = np.where(gap, steps // interval - 1, 0)
+            series = codes[1:]
+            k = len(cities)
+            largest = np.zeros(k, dtype=np.int64)
+            np.maximum.at(largest, series[gap], steps[gap])
+            per_city = pd.DataFrame({
+                'leituras': np.bincount(codes, minlength=k),
+                'duplicadas': np.bincount(series[duplicated], minlength=k),
+                'lacunas': np.bincount(series[gap], minlength=k),
+                'leituras_faltantes': np.bincount(series, weights=missing_steps, minlength=k).astype(np.int64),
+                'maior_lacuna': pd.to_timedelta(largest, unit='ns'),
+            }, index=[str(city) for city in cities])
+            profile.update(cidades=per_city, intervalo=pd.Timedelta(interval, unit='ns'))
+        profile['duplicadas'] = int(duplicated.sum())
+    profile['segundos'] = time.perf_counter() - started
+    return profile
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print(__doc__)
+        return 2
+    for path in argv:
+        df = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+        df.columns = df.columns.str.lower()
+        profile = profile_readings(df, ['aqi'] + list(POLLUTANT_LIMITS))
+        print(f"{path}: {profile['linhas']:,} linhas em {profile['segundos']:.2f}s, "
+              f"{profile['duplicadas']} datas repetidas, intervalo {profile['intervalo']}")
+        print(profile['colunas'].round(2).to_string())
+        if profile['cidades'] is not None:
+            print(profile['cidades'].to_string())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""Cache em disco dos resultados de previsão em lote, com despejo por tamanho."""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+RESULTS_DIR = os.path.join(tempfile.gettempdir(), 'aqi_results')
+# Tamanho máximo ocupado pelos resultados em disco
+MAX_RESULTS_BYTES = 512 * 1024 ** 2
+# Quantidade de resultados mantidos também em memória
+MEMORY_ENTRIES = 4
+
+
+def job_id(upload_hash, model_signature=''):
+    """Identificador do lote: conteúdo do arquivo + versões dos modelos usados."""
+    return hashlib.sha256(f'{upload_hash}:{model_signature}'.encode('utf-8')).hexdigest()[:32]
+
+
+class ResultStore:
+    """Guarda DataFrames de resultado em Parquet, com metadados em JSON.
+
+    Os arquivos mais antigos (por último acesso) são removidos quando o total
+    passa de ``max_bytes``. Os últimos resultados usados ficam também em
+    memória para que reruns do Streamlit não releiam o disco.
+    """
+
+    def __init__(self, directory=RESULTS_DIR, max_bytes=MAX_RESULTS_BYTES, memory_entries=MEMORY_ENTRIES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + '.parquet', base + '.json'
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Retorna ``(results_df, metadata)`` ou None se o lote não estiver em cache."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        data_path, meta_path = self._paths(key)
+        if entry is not None:
+            if os.path.exists(data_path):
+                os.utime(data_path)
+            return entry
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            results_df = pd.read_parquet(data_path)
+            with open(meta_path, encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            return None
+        os.utime(data_path)
+        entry = (results_df, metadata)
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key, results_df, metadata):
+        """Grava o resultado (de forma atômica) e aplica o limite de tamanho."""
+        data_path, meta_path = self._paths(key)
+        fd, tmp_data = tempfile.mkstemp(prefix='.partial-', suffix='.parquet', dir=self.directory)
+        os.close(fd)
+        results_df.to_parquet(tmp_data, index=False)
+        fd, tmp_meta = tempfile.mkstemp(prefix='.partial-', suffix='.json', dir=self.directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, default=str)
+        # Os metadados são gravados por último: um lote só é visível quando completo
+        os.replace(tmp_data, data_path)
+        os.replace(tmp_meta, meta_path)
+        self._remember(key, (results_df, metadata))
+        self.evict()
+
+    def usage(self):
+        """Total de bytes ocupados e quantidade de lotes em disco."""
+        files = [f for f in os.listdir(self.directory) if not f.startswith('.') and f.endswith('.parquet')]
+        total = sum(os.path.getsize(os.path.join(self.directory, f)) for f in files)
+        return total, len(files)
+
+    def evict(self):
+        """Remove os lotes menos usados até caber no limite de tamanho."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.') or not name.endswith('.parquet'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name[:-len('.parquet')]))
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            with self._lock:
+                self._memory.pop(key, None)
+            total -= size
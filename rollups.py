@@ -0,0 +1,114 @@
+"""Agregados do histórico por cidade em hora, dia, semana e mês.
+
+Os agregados (média, máximo e percentis) são materializados uma vez; após
+novas leituras só os períodos a partir da primeira data nova são
+recalculados. Os gráficos escolhem a resolução pelo tamanho do período, então
+um ano aparece com ~365 pontos por cidade em vez de 8.760.
+"""
+import pandas as pd
+
+GRAINS = {
+    'hora': pd.Timedelta(hours=1),
+    'dia': pd.Timedelta(days=1),
+    'semana': pd.Timedelta(days=7),
+    'mes': pd.Timedelta(days=30.44),
+}
+GRAIN_LABELS = {'hora': 'Hora', 'dia': 'Dia', 'semana': 'Semana', 'mes': 'Mês'}
+ROLLUP_QUANTILES = (0.5, 0.95)
+# Pontos máximos por série ao escolher a resolução automaticamente
+MAX_POINTS = 500
+# Chave dos agregados de todas as cidades juntas
+ALL_CITIES = '__todas__'
+
+
+def period_start(dates, grain):
+    """Início do período (hora, dia, semana começando na segunda ou mês) de cada data."""
+    if grain == 'hora':
+        return dates.dt.floor('h')
+    day = dates.dt.floor('D')
+    if grain == 'dia':
+        return day
+    if grain == 'semana':
+        return day - pd.to_timedelta(day.dt.weekday, unit='D')
+    if grain == 'mes':
+        return day - pd.to_timedelta(day.dt.day - 1, unit='D')
+    raise ValueError(f'resolução desconhecida: {grain}')
+
+
+def aggregate(frame, columns, grain, date_column='date'):
+    """Média, máximo, percentis e quantidade de linhas por período, indexados pelo início do período."""
+    periods = period_start(frame[date_column], grain).rename('periodo')
+    grouped = frame[columns].groupby(periods, sort=True)
+    parts = [grouped.mean().add_suffix('_mean'), grouped.max().add_suffix('_max')]
+    quantiles = grouped.quantile(list(ROLLUP_QUANTILES)).unstack()
+    quantiles.columns = [f'{col}_p{round(q * 100):02d}' for col, q in quantiles.columns]
+    parts.append(quantiles)
+    result = pd.concat(parts, axis=1)
+    result['linhas'] = grouped.size()
+    return result
+
+
+def choose_grain(start, end, max_points=MAX_POINTS):
+    """Menor resolução com no máximo ``max_points`` pontos no período."""
+    span = pd.Timestamp(end) - pd.Timestamp(start)
+    for grain, step in GRAINS.items():
+        if span / step <= max_points:
+            return grain
+    return 'mes'
+
+
+class Rollups:
+    """Agregados de um ``CityIndex`` por (cidade, resolução), incluindo todas as cidades juntas."""
+
+    def __init__(self, index, columns, grains=tuple(GRAINS)):
+        self.index = index
+        self.columns = list(columns)
+        self.grains = grains
+        self.tables = {}
+        for key in self._keys():
+            rows = self.index.rows(None if key == ALL_CITIES else key)
+            for grain in grains:
+                self.tables[(key, grain)] = aggregate(rows, self.columns, grain, index.date_column)
+
+    def _keys(self):
+        return (self.index.cities or []) + [ALL_CITIES]
+
+    def _timestamp(self, value):
+        ts = pd.Timestamp(value)
+        if ts.tzinfo is None and self.index.tz is not None:
+            ts = ts.tz_localize(self.index.tz)
+        return ts
+
+    def update(self, index, cities, since):
+        """Recalcula os períodos a partir de ``since`` após novas leituras de ``cities``.
+
+        ``index`` é o índice já atualizado; períodos anteriores são mantidos.
+        """
+        self.index = index
+        since = self._timestamp(since)
+        for key in list(cities) + [ALL_CITIES]:
+            city = None if key == ALL_CITIES else key
+            for grain in self.grains:
+                start = period_start(pd.Series([since]), grain).iloc[0]
+                rows = index.time_slice(city, start, None)
+                fresh = aggregate(rows, self.columns, grain, index.date_column)
+                table = self.tables.get((key, grain))
+                kept = table[table.index < start] if table is not None else None
+                self.tables[(key, grain)] = pd.concat([kept, fresh]) if kept is not None and len(kept) else fresh
+
+    def query(self, city=None, start=None, end=None, grain=None, max_points=MAX_POINTS):
+        """Agregados da cidade (ou de todas) no período. Retorna ``(grain, table)``.
+
+        Sem ``grain``, usa a menor resolução com até ``max_points`` pontos.
+        """
+        key = ALL_CITIES if city is None else city
+        if (key, self.grains[0]) not in self.tables:
+            # Cidade sem leituras no índice: tabela vazia com as mesmas colunas
+            grain = grain or self.grains[0]
+            return grain, self.tables[(ALL_CITIES, grain)].iloc[0:0]
+        hourly = self.tables[(key, self.grains[0])]
+        start = self._timestamp(start) if start is not None else hourly.index.min()
+        end = self._timestamp(end) if end is not None else hourly.index.max()
+        grain = grain or choose_grain(start, end, max_points)
+        first = period_start(pd.Series([start]), grain).iloc[0]
+        return grain, self.tables[(key, grain)].loc[first:end]
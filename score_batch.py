@@ -0,0 +1,256 @@
+"""Previsão em lote pela linha de comando, sem Streamlit (ex.: cron noturno).
+
+Usa as mesmas etapas da página "Lote": validação do arquivo, normalização
+com o ``qt``, previsão com o modelo de cada cidade, contribuições, detecção
+de anomalias e insights. Com ``--no-anomalies`` e sem ``--imputacao`` cada
+arquivo é processado em fluxo (memória de um bloco de ``--chunk-rows``);
+com elas o arquivo inteiro fica em memória.
+
+Exemplo:
+    python score_batch.py "dumps/*.csv.gz" --output-dir predicoes --format Parquet --workers 4
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import pandas as pd
+
+from artifacts import ArtifactStore, ArtifactMissing
+from batch_io import read_header, check_schema, read_batch, iter_batch, as_float32, invalid_rows
+from exports import EXPORT_FORMATS, write_frame, frame_writer
+from model_registry import ModelRegistry, MODELS_DIR
+from correlations import CoMoments
+from pipeline import score_chunk, finalize_batch, batch_moments, batch_insights, incomplete_rows, REQUIRED_COLUMNS
+from imputation import impute_batch, IMPUTATION_METHODS
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CHUNK_ROWS = 20_000
+
+# Modelos e transformer carregados uma vez por processo
+_registry = None
+_qt = None
+
+
+def _load_artifacts(models_dir, model_path, qt_path):
+    global _registry, _qt
+    _registry = ModelRegistry(models_dir=models_dir, default_path=model_path)
+    for key in _registry.discover():
+        _registry.load_latest(key)
+    _qt = joblib.load(qt_path)
+
+
+def peak_rss_mb(children=False):
+    """Pico de memória residente (MB) deste processo ou dos processos filhos."""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    return usage.ru_maxrss / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+
+def output_path(input_path, output_dir, fmt):
+    name = os.path.basename(input_path)
+    for suffix in ('.gz', '.zst', '.csv', '.parquet', '.xlsx'):
+        if name.lower().endswith(suffix):
+            name = name[:-len(suffix)]
+    return os.path.join(output_dir, f'{name}_predicoes{EXPORT_FORMATS[fmt][0]}')
+
+
+def _score_whole(file, filename, columns, destination, fmt, chunk_rows, anomalies, imputation):
+    """Arquivo inteiro em memória: imputação e anomalias precisam das leituras vizinhas."""
+    input_df = read_batch(file, filename, columns)
+    bad_rows = invalid_rows(input_df)
+    if bad_rows:
+        raise ValueError(f'{len(bad_rows)} linhas com valores inválidos (primeiras: {bad_rows[:10]})')
+    input_df = as_float32(input_df)
+    # Imputação antes dos blocos, para usar as leituras vizinhas de todo o arquivo
+    input_df, filled_cells = impute_batch(input_df, imputation, REQUIRED_COLUMNS)
+    not_scored = int(incomplete_rows(input_df).sum())
+
+    # Blocos limitam a memória das matrizes intermediárias (normalização e contribuições);
+    # os co-momentos de cada bloco são acumulados para os insights
+    chunks = [score_chunk(_registry, _qt, input_df.iloc[start:start + chunk_rows])
+              for start in range(0, len(input_df), chunk_rows)] or [score_chunk(_registry, _qt, input_df)]
+    moments = CoMoments.combine(batch_moments(chunk) for chunk in chunks)
+    results_df = pd.concat(chunks, ignore_index=True)
+
+    anomaly_stats = None
+    if anomalies:
+        results_df, anomaly_stats = finalize_batch(results_df)
+    write_frame(results_df, destination, fmt)
+    return len(results_df), moments, anomaly_stats, filled_cells, not_scored
+
+
+def _score_stream(file, filename, columns, destination, fmt, chunk_rows):
+    """Lê, prevê e grava bloco a bloco: só um bloco de ``chunk_rows`` linhas fica em memória."""
+    rows, bad_rows, moments, not_scored = 0, [], [], 0
+    with frame_writer(destination, fmt) as write:
+        for chunk in iter_batch(file, filename, columns, chunk_rows):
+            bad_rows.extend(rows + row for row in invalid_rows(chunk))
+            rows += len(chunk)
+            # Depois da primeira linha inválida os blocos são só validados, para informar todas
+            if bad_rows:
+                continue
+            chunk = as_float32(chunk)
+            not_scored += int(incomplete_rows(chunk).sum())
+            scored = score_chunk(_registry, _qt, chunk)
+            moments.append(batch_moments(scored))
+            write(scored)
+        if bad_rows:
+            raise ValueError(f'{len(bad_rows)} linhas com valores inválidos (primeiras: {bad_rows[:10]})')
+    return rows, CoMoments.combine(moments), None, 0, not_scored
+
+
+def score_file(input_path, output_dir, fmt, chunk_rows=CHUNK_ROWS, anomalies=True, imputation='nenhum'):
+    """Processa um arquivo e grava as previsões. Retorna as estatísticas do arquivo.
+
+    Sem detecção de anomalias e sem imputação o arquivo é lido, previsto e gravado
+    em fluxo, e a memória fica limitada por ``chunk_rows``. As duas etapas usam as
+    leituras vizinhas (janelas móveis e interpolação); com qualquer uma delas o
+    arquivo inteiro e as previsões ficam em memória (``chunk_rows`` limita só as
+    matrizes intermediárias da previsão). Linhas que continuam com células vazias
+    ficam sem previsão e são contadas em ``sem_previsao``.
+    """
+    started = time.perf_counter()
+    filename = os.path.basename(input_path)
+    destination = output_path(input_path, output_dir, fmt)
+    with open(input_path, 'rb') as f:
+        columns = read_header(f, filename)
+        missing = check_schema(columns)
+        if missing:
+            raise ValueError(f"colunas ausentes: {', '.join(missing)}")
+        if anomalies or imputation != 'nenhum':
+            rows, moments, anomaly_stats, filled_cells, not_scored = _score_whole(
+                f, filename, columns, destination, fmt, chunk_rows, anomalies, imputation
+            )
+        else:
+            rows, moments, anomaly_stats, filled_cells, not_scored = _score_stream(
+                f, filename, columns, destination, fmt, chunk_rows
+            )
+
+    elapsed = time.perf_counter() - started
+    return {
+        'arquivo': input_path,
+        'saida': destination,
+        'linhas': rows,
+        'imputadas': filled_cells,
+        'sem_previsao': not_scored,
+        'segundos': elapsed,
+        'linhas_por_segundo': rows / elapsed if elapsed > 0 else 0.0,
+        'aqi_medio': float(moments.means()['aqi_prediction']) if rows else None,
+        'anomalias': anomaly_stats['anomalias'] if anomaly_stats else None,
+        'insights': batch_insights(None, moments=moments) if rows > 1 else None,
+        'pico_rss_mb': peak_rss_mb(),
+    }
+
+
+def _score_file_safe(args):
+    input_path = args[0]
+    try:
+        return score_file(*args)
+    except Exception as e:
+        return {'arquivo': input_path, 'erro': f'{type(e).__name__}: {e}'}
+
+
+def expand_inputs(patterns):
+    """Expande arquivos e globs, sem repetir arquivos e mantendo a ordem."""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        paths.extend(p for p in matches if os.path.isfile(p) and p not in paths)
+    return paths
+
+
+def _print_result(result):
+    if 'erro' in result:
+        print(f"[ERRO] {result['arquivo']}: {result['erro']}", file=sys.stderr)
+        return
+    line = (f"[OK] {result['arquivo']} -> {result['saida']}: {result['linhas']:,} linhas em "
+            f"{result['segundos']:.2f}s ({result['linhas_por_segundo']:,.0f} linhas/s)")
+    if result['imputadas']:
+        line += f", {result['imputadas']:,} células imputadas"
+    if result['anomalias'] is not None:
+        line += f", {result['anomalias']} anomalias"
+    if result['pico_rss_mb'] is not None:
+        line += f", pico RSS {result['pico_rss_mb']:.0f} MB"
+    print(line)
+    if result['sem_previsao']:
+        print(f"[AVISO] {result['arquivo']}: {result['sem_previsao']:,} linhas com células vazias ficaram "
+              "sem previsão", file=sys.stderr)
+    if result['insights']:
+        most_corr, corr = result['insights']['most_corr']
+        most_variable, cv = result['insights']['most_variable']
+        print(f"     mais correlacionado com o AQI: {most_corr.upper()} ({corr:.2f}); "
+              f"maior variação: {most_variable.upper()} (CV {cv:.2f})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Previsão de AQI em lote, sem interface.')
+    parser.add_argument('inputs', nargs='+', help='arquivos ou globs (CSV, CSV.gz/.zst, Parquet, Excel)')
+    parser.add_argument('--output-dir', default='predicoes', help='diretório de saída (padrão: predicoes)')
+    parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='CSV', help='formato de saída')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processos em paralelo; cada um mantém um arquivo por vez em memória')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS,
+                        help='linhas por bloco de previsão; com --no-anomalies e sem --imputacao o arquivo é '
+                             'processado em fluxo e a memória fica limitada a um bloco (senão o arquivo '
+                             'inteiro e as previsões ficam em memória)')
+    parser.add_argument('--model', help='modelo padrão (padrão: rf_model.joblib do manifesto de artefatos)')
+    parser.add_argument('--models-dir', default=MODELS_DIR, help='diretório dos modelos por cidade')
+    parser.add_argument('--qt', help='Quantile Transformer (padrão: qt.joblib do manifesto de artefatos)')
+    parser.add_argument('--imputacao', choices=list(IMPUTATION_METHODS), default='nenhum',
+                        help='preenchimento de células vazias antes da previsão (padrão: nenhum)')
+    parser.add_argument('--no-anomalies', action='store_true', help='não executar a detecção de anomalias')
+    args = parser.parse_args(argv)
+
+    try:
+        store = ArtifactStore() if args.model is None or args.qt is None else None
+        args.model = args.model or store.path('rf_model.joblib')
+        args.qt = args.qt or store.path('qt.joblib')
+    except ArtifactMissing as e:
+        parser.error(str(e))
+
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        parser.error('nenhum arquivo encontrado')
+    os.makedirs(args.output_dir, exist_ok=True)
+    tasks = [(path, args.output_dir, args.format, args.chunk_rows, not args.no_anomalies, args.imputacao)
+             for path in paths]
+
+    started = time.perf_counter()
+    results = []
+    if args.workers <= 1:
+        _load_artifacts(args.models_dir, args.model, args.qt)
+        for task in tasks:
+            results.append(_score_file_safe(task))
+            _print_result(results[-1])
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(args.workers, len(tasks)),
+            initializer=_load_artifacts,
+            initargs=(args.models_dir, args.model, args.qt)
+        ) as executor:
+            for result in executor.map(_score_file_safe, tasks):
+                results.append(result)
+                _print_result(result)
+    elapsed = time.perf_counter() - started
+
+    done = [r for r in results if 'erro' not in r]
+    total_rows = sum(r['linhas'] for r in done)
+    peaks = [p for p in (peak_rss_mb(), peak_rss_mb(children=True)) if p]
+    print(f"Total: {len(done)}/{len(results)} arquivos, {total_rows:,} linhas em {elapsed:.2f}s "
+          f"({total_rows / elapsed if elapsed > 0 else 0:,.0f} linhas/s)"
+          + (f", pico RSS {max(peaks):.0f} MB" if peaks else ''))
+    return 0 if len(done) == len(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
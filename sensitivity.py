@@ -0,0 +1,58 @@
+"""Análise "e se?": previsões para variações em torno de uma medição.
+
+Todos os vetores perturbados são montados numa única matriz e passam por
+uma única chamada de ``qt.transform`` e ``predict``, então uma varredura de
+centenas de pontos custa quase o mesmo que uma previsão.
+"""
+import numpy as np
+import pandas as pd
+
+from pipeline import normalize_inputs, REQUIRED_COLUMNS
+
+
+def _base_row(base):
+    return np.array([base[p] for p in REQUIRED_COLUMNS], dtype=np.float64)
+
+
+def score_vectors(model, qt, vectors):
+    """Previsões para uma matriz (linhas × poluentes) numa única passada."""
+    frame = pd.DataFrame(vectors, columns=REQUIRED_COLUMNS)
+    return model.predict(normalize_inputs(qt, frame))
+
+
+def sensitivity_sweeps(model, qt, base, ranges, points=50):
+    """Varia um poluente por vez dentro de ``ranges[p] = (min, max)``, com os demais no valor base.
+
+    Retorna um DataFrame com as colunas ``poluente``, ``valor`` e ``aqi``.
+    """
+    base_row = _base_row(base)
+    vectors = np.tile(base_row, (len(REQUIRED_COLUMNS) * points, 1))
+    varied = np.empty(len(vectors))
+    for i, pollutant in enumerate(REQUIRED_COLUMNS):
+        block = slice(i * points, (i + 1) * points)
+        varied[block] = vectors[block, i] = np.linspace(*ranges[pollutant], points)
+    return pd.DataFrame({
+        'poluente': np.repeat(REQUIRED_COLUMNS, points),
+        'valor': varied,
+        'aqi': score_vectors(model, qt, vectors),
+    })
+
+
+def sensitivity_grid(model, qt, base, x_pollutant, y_pollutant, x_range, y_range, points=30):
+    """Grade 2-D variando dois poluentes juntos. Retorna ``(x_values, y_values, aqi)``.
+
+    ``aqi`` tem forma (len(y_values), len(x_values)).
+    """
+    x_values = np.linspace(*x_range, points)
+    y_values = np.linspace(*y_range, points)
+    vectors = np.tile(_base_row(base), (points * points, 1))
+    grid_x, grid_y = np.meshgrid(x_values, y_values)
+    vectors[:, REQUIRED_COLUMNS.index(x_pollutant)] = grid_x.ravel()
+    vectors[:, REQUIRED_COLUMNS.index(y_pollutant)] = grid_y.ravel()
+    return x_values, y_values, score_vectors(model, qt, vectors).reshape(points, points)
+
+
+def sensitivity_ranking(sweeps):
+    """Amplitude do AQI (máximo − mínimo) em cada varredura, do poluente mais influente ao menos."""
+    aqi = sweeps.groupby('poluente', sort=False)['aqi']
+    return (aqi.max() - aqi.min()).sort_values(ascending=False)
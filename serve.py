@@ -0,0 +1,28 @@
+"""Inicia o Streamlit já aquecendo os modelos, com a sonda de prontidão ativa.
+
+    python serve.py            # app em 8501 (ou server.port do config.toml), sonda em 8502
+    AQI_PROBE_PORT=9000 python serve.py
+
+O aquecimento roda neste mesmo processo, então o ``app.py`` reaproveita os
+modelos já carregados. O balanceador deve rotear para a instância apenas
+quando ``GET /ready`` na porta da sonda responder 200.
+"""
+import os
+import sys
+
+from streamlit.web import bootstrap
+
+import warmup
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+
+def main():
+    os.chdir(os.path.dirname(APP_PATH))
+    warmup.start()
+    warmup.serve_probe(int(os.environ.get('AQI_PROBE_PORT', '8502')))
+    bootstrap.run(APP_PATH, False, sys.argv[1:], {})
+
+
+if __name__ == '__main__':
+    main()
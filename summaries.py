@@ -0,0 +1,100 @@
+"""Resumos estatísticos calculados no servidor para os gráficos da análise histórica."""
+import numpy as np
+
+# Acima disso o gráfico bivariado mostra densidade em vez de pontos
+SCATTER_POINT_LIMIT = 5000
+SUM_KEYS = ('n', 'sx', 'sy', 'sxy', 'sxx', 'syy')
+
+
+class PrefixSums:
+    """Somas acumuladas de n, x, y, xy, x² e y² ao longo das linhas do histórico.
+
+    As estatísticas suficientes da regressão de qualquer intervalo de linhas
+    saem de duas subtrações, sem percorrer os dados. Pares com NaN não entram
+    nas somas.
+    """
+
+    def __init__(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x = np.where(valid, x, 0.0)
+        y = np.where(valid, y, 0.0)
+        terms = np.column_stack([valid, x, y, x * y, x * x, y * y])
+        self._prefix = np.vstack([np.zeros((1, len(SUM_KEYS))), np.cumsum(terms, axis=0)])
+
+    def sums(self, ranges):
+        """Somas dos intervalos ``(start, stop)`` de linhas."""
+        total = np.zeros(len(SUM_KEYS))
+        for start, stop in ranges:
+            total += self._prefix[stop] - self._prefix[start]
+        return dict(zip(SUM_KEYS, total))
+
+
+def ols_from_sums(sums):
+    """Reta de mínimos quadrados y = a·x + b em forma fechada, ou None se indefinida."""
+    n = sums['n']
+    if n < 2:
+        return None
+    sxx = sums['sxx'] - sums['sx'] ** 2 / n
+    syy = sums['syy'] - sums['sy'] ** 2 / n
+    sxy = sums['sxy'] - sums['sx'] * sums['sy'] / n
+    if sxx <= 0:
+        return None
+    slope = sxy / sxx
+    r = sxy / np.sqrt(sxx * syy) if syy > 0 else 0.0
+    return {
+        'n': int(n),
+        'inclinacao': float(slope),
+        'intercepto': float((sums['sy'] - slope * sums['sx']) / n),
+        'r': float(r),
+        'r2': float(r * r),
+    }
+
+
+def density_grid(x, y, bins=60):
+    """Contagens 2D (linhas = y, colunas = x) e os centros dos bins."""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    counts, x_edges, y_edges = np.histogram2d(x[valid], y[valid], bins=bins)
+    return counts.T, (x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2
+
+
+def histogram_summary(values, bins=30):
+    """Contagens em ``bins`` faixas de mesma largura: ``(counts, edges)``."""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(1)
+    return np.histogram(values, bins=bins)
+
+
+def box_summary(values, max_outliers=200):
+    """Cinco números do box plot (bigodes em 1,5·IQR) e até ``max_outliers`` outliers.
+
+    Com mais outliers que o limite, fica uma amostra espaçada uniformemente
+    entre eles, que inclui sempre o menor e o maior.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    outliers = np.sort(values[(values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)])
+    total_outliers = len(outliers)
+    if total_outliers > max_outliers:
+        outliers = outliers[np.linspace(0, total_outliers - 1, max_outliers).round().astype(int)]
+    return {
+        'n': len(values),
+        'media': float(values.mean()),
+        'q1': float(q1),
+        'mediana': float(median),
+        'q3': float(q3),
+        'bigode_inferior': float(inside.min()),
+        'bigode_superior': float(inside.max()),
+        'outliers': outliers,
+        'total_outliers': total_outliers,
+    }
@@ -0,0 +1,139 @@
+"""Cadastro de usuários em SQLite (modo WAL), compartilhado entre processos."""
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import bcrypt
+
+USERS_DB = 'users.db'
+BCRYPT_ROUNDS = 12
+# Poucas threads: o bcrypt libera o GIL, mas é CPU pura
+_hash_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='bcrypt')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    password TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_email ON users (email);
+CREATE TABLE IF NOT EXISTS sessions (
+    token_hash TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expires_at);
+"""
+
+
+def hash_password(password, rounds=BCRYPT_ROUNDS):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def hash_password_async(password, rounds=BCRYPT_ROUNDS):
+    """Calcula o hash bcrypt num pool de threads separado, retornando um Future."""
+    return _hash_executor.submit(hash_password, password, rounds)
+
+
+class UserStore:
+    """Usuários indexados por nome (chave primária), com inserção atômica, e sessões de login."""
+
+    def __init__(self, db_path=USERS_DB):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            yield conn
+        finally:
+            conn.close()
+
+    def import_credentials(self, credentials):
+        """Importa os usuários do config.yaml (os já existentes são mantidos)."""
+        users = (credentials or {}).get('usernames') or {}
+        rows = [
+            (username.lower(), info.get('name', username), info.get('email', ''), info['password'], time.time())
+            for username, info in users.items()
+            if info.get('password')
+        ]
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany(
+                'INSERT OR IGNORE INTO users (username, name, email, password, created_at) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+            conn.execute('COMMIT')
+
+    def exists(self, username):
+        with self._connect() as conn:
+            row = conn.execute('SELECT 1 FROM users WHERE username = ?', (username.lower(),)).fetchone()
+        return row is not None
+
+    def get(self, username):
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT name, email, password FROM users WHERE username = ?', (username.lower(),)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'name': row[0], 'email': row[1], 'password': row[2]}
+
+    def add_user(self, username, name, email, password_hash):
+        """Insere o usuário. Retorna False se o nome de usuário já existir."""
+        with self._connect() as conn:
+            try:
+                conn.execute(
+                    'INSERT INTO users (username, name, email, password, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (username.lower(), name, email, password_hash, time.time())
+                )
+            except sqlite3.IntegrityError:
+                return False
+        return True
+
+    def update_password(self, username, password_hash):
+        with self._connect() as conn:
+            conn.execute('UPDATE users SET password = ? WHERE username = ?', (password_hash, username.lower()))
+
+    def add_session(self, token_hash, username, expires_at):
+        """Grava o hash de um token de sessão e remove os já expirados."""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),))
+            conn.execute('INSERT OR REPLACE INTO sessions (token_hash, username, expires_at) VALUES (?, ?, ?)',
+                         (token_hash, username.lower(), expires_at))
+            conn.execute('COMMIT')
+
+    def session_user(self, token_hash):
+        """Dono de uma sessão ainda válida: ``(username, user)`` ou ``(None, None)``."""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT s.username, u.name, u.email, u.password FROM sessions s '
+                'JOIN users u ON u.username = s.username WHERE s.token_hash = ? AND s.expires_at > ?',
+                (token_hash, time.time())
+            ).fetchone()
+        if row is None:
+            return None, None
+        return row[0], {'name': row[1], 'email': row[2], 'password': row[3]}
+
+    def delete_session(self, token_hash):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM sessions WHERE token_hash = ?', (token_hash,))
+
+    def count_sessions(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM sessions WHERE expires_at > ?', (time.time(),)).fetchone()[0]
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
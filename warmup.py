@@ -0,0 +1,145 @@
+"""Aquecimento dos modelos no início do servidor e sonda de prontidão (readiness).
+
+O aquecimento roda uma vez por processo, em segundo plano: carrega os
+artefatos, ativa os modelos de todas as cidades e passa um lote sintético
+pelo ``qt``, pelo ``predict`` e pelas contribuições, para que a primeira
+requisição real não pague a desserialização nem as alocações iniciais.
+
+Com ``python serve.py`` o aquecimento começa antes do primeiro acesso e a
+sonda HTTP responde ``/ready`` (200 quando pronto, 503 antes disso).
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from artifacts import ArtifactStore
+from model_registry import ModelRegistry, DEFAULT_KEY
+from pipeline import score_chunk, REQUIRED_COLUMNS
+
+WARMUP_ROWS = 256
+
+_lock = threading.Lock()
+_ready = threading.Event()
+_thread = None
+_state = {'status': 'parado', 'erro': None, 'iniciado_em': None, 'pronto_em': None, 'etapas': {}}
+_artifacts = {}
+
+
+def synthetic_batch(qt, rows=WARMUP_ROWS, cities=()):
+    """Lote sintético dentro da faixa de treino do transformer (quantis aprendidos)."""
+    rng = np.random.default_rng(0)
+    quantiles = qt.quantiles_[:, :len(REQUIRED_COLUMNS)]
+    picks = rng.integers(0, len(quantiles), size=(rows, len(REQUIRED_COLUMNS)))
+    values = quantiles[picks, np.arange(len(REQUIRED_COLUMNS))]
+    batch = pd.DataFrame(values.astype(np.float32), columns=REQUIRED_COLUMNS)
+    if cities:
+        batch['city'] = [cities[i % len(cities)] for i in range(rows)]
+    return batch
+
+
+def _step(name, fn):
+    started = time.perf_counter()
+    result = fn()
+    _state['etapas'][name] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def _run(store):
+    try:
+        model_path = store.path('rf_model.joblib')
+        model = _step('modelo', lambda: joblib.load(model_path))
+        qt = _step('transformer', lambda: joblib.load(store.path('qt.joblib')))
+
+        registry = ModelRegistry(default_path=model_path)
+        versions = registry.available_versions(DEFAULT_KEY)
+        version, path = versions[-1] if versions else ('base', '')
+        registry.register(DEFAULT_KEY, model, version=version, path=path, load_seconds=_state['etapas']['modelo'])
+        # Modelos por cidade carregados já aqui (de forma síncrona), não no primeiro acesso
+        _step('modelos_por_cidade', lambda: [registry.load_latest(key) for key in registry.discover()
+                                             if key != DEFAULT_KEY])
+
+        # Um lote passando por todos os modelos: qt.transform, predict e tabelas de contribuição
+        cities = [key for key in registry.cities() if key != DEFAULT_KEY] + [DEFAULT_KEY]
+        _step('lote_sintetico', lambda: score_chunk(registry, qt, synthetic_batch(qt, cities=cities)))
+
+        with _lock:
+            _artifacts.update(model=model, qt=qt, registry=registry)
+            _state.update(status='pronto', pronto_em=time.time())
+        _ready.set()
+    except Exception as e:
+        with _lock:
+            _state.update(status='falhou', erro=f'{type(e).__name__}: {e}')
+        _ready.set()
+
+
+def start(store=None):
+    """Inicia o aquecimento (uma vez por processo; de novo apenas se o anterior falhou)."""
+    global _thread
+    with _lock:
+        if _thread is None or (_state['status'] == 'falhou' and not _thread.is_alive()):
+            _ready.clear()
+            _state.update(status='aquecendo', erro=None, iniciado_em=time.time(), etapas={})
+            _thread = threading.Thread(target=_run, args=(store or ArtifactStore(),),
+                                       name='warmup', daemon=True)
+            _thread.start()
+    return _thread
+
+
+def is_ready():
+    return _ready.is_set() and _state['status'] == 'pronto'
+
+
+def wait(timeout=None):
+    """Espera o fim do aquecimento. Retorna True se os modelos estão prontos."""
+    start()
+    _ready.wait(timeout)
+    return is_ready()
+
+
+def status():
+    with _lock:
+        return {**_state, 'etapas': dict(_state['etapas'])}
+
+
+def model():
+    return _artifacts.get('model')
+
+
+def quantile_transformer():
+    return _artifacts.get('qt')
+
+
+def registry():
+    return _artifacts.get('registry')
+
+
+class _ProbeHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith('/live'):
+            code = 200
+        elif self.path.startswith('/ready'):
+            code = 200 if is_ready() else 503
+        else:
+            self.send_error(404)
+            return
+        body = json.dumps(status(), default=str).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_probe(port, host='0.0.0.0'):
+    """Sonda HTTP em thread própria: ``/live`` sempre 200, ``/ready`` 200 só após o aquecimento."""
+    server = ThreadingHTTPServer((host, port), _ProbeHandler)
+    threading.Thread(target=server.serve_forever, name='readiness-probe', daemon=True).start()
+    return server